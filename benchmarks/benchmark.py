@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+Benchmark both selection extensions on synthetic documents.
+
+Runs BezierIntersection.effect in touching and enclosed mode with every
+criterion, and SelectByXPath.effect, headlessly: the DBus passback is
+replaced by a recorder. Every run is written as one JSON line with the
+document parameters, per-phase timings (document load, effect) and
+tracemalloc peaks, so results can be compared between versions:
+
+    python benchmarks/benchmark.py --objects 1000 10000 --depth 0 2 > before.jsonl
+
+With --trace, the extensions' own spans (candidates, flatten, geometry,
+...) are added to every record. Bounding boxes are computed while the
+candidates are gathered and count towards that span.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import select_by_path
+import select_by_xpath
+from instrumentation import TRACE_ENV
+from synthetic_svg import generate_svg
+
+CASES = [
+    ('select_by_path', ['--method=touching', '--t_criteria=bounding_box_cross']),
+    ('select_by_path', ['--method=touching', '--t_criteria=bounding_box_center', '--t_selection_tolerance=5']),
+    ('select_by_path', ['--method=touching', '--t_criteria=geometry_cross']),
+    ('select_by_path', ['--method=touching', '--t_criteria=bounding_box_cross', '--flatten=fixed']),
+    ('select_by_path', ['--method=enclosed', '--e_criteria=bounding_box_center']),
+    ('select_by_path', ['--method=enclosed', '--e_criteria=all_points']),
+    ('select_by_path', ['--method=enclosed', '--e_criteria=any_point']),
+    ('select_by_path', ['--method=enclosed', '--e_criteria=geometry_inside']),
+    ('select_by_path', ['--method=touching', '--t_criteria=geometry_cross', '--time_budget=1']),
+    ('select_by_xpath', ['--xpath=//svg:rect']),
+    ('select_by_xpath', ['--xpath=//*[@sodipodi:insensitive="true"]']),
+    ('select_by_xpath', ['--style=display:none']),
+]
+
+EXTENSIONS = {
+    'select_by_path': (select_by_path, select_by_path.BezierIntersection, ['--id=lasso', '--log_errors=false']),
+    'select_by_xpath': (select_by_xpath, select_by_xpath.SelectByXPath, ['--debug=false']),
+}
+
+
+def measure(function, memory=True):
+    """Run function, return its result, duration in seconds and tracemalloc peak in bytes
+
+    The peak is counted from the memory in use when function starts.
+    """
+    if memory:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = function()
+    duration = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - baseline if memory else None
+    return result, duration, peak
+
+
+def read_spans(trace_file):
+    """Spans logged by one extension run, keyed by span name"""
+    spans = {}
+    with open(trace_file, encoding='utf-8') as file:
+        for line in file:
+            span = json.loads(line)
+            spans[span['span']] = {key: span[key] for key in ('duration_s', 'peak_bytes', 'counts') if key in span}
+    return spans
+
+
+def run_case(svg_file, extension, args, memory=True, trace=False):
+    """Run one extension on svg_file with the DBus passback stubbed, returns the phase report"""
+    module, extension_class, base_args = EXTENSIONS[extension]
+    passed = []
+    counted = []
+    if trace:
+        fd, trace_file = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        os.environ[TRACE_ENV] = trace_file
+
+    def record_passback(path_id_list_string, *dummy_args, **dummy_kwargs):
+        passed.append(path_id_list_string)
+
+    stdout, stderr = sys.stdout, sys.stderr
+    passback = module.pass_ids_to_dbus
+    module.pass_ids_to_dbus = record_passback
+    effect = None
+    try:
+        effect = extension_class()
+        effect.parse_arguments(base_args + args + [svg_file])
+        if hasattr(effect, 'collect_candidates'):
+            collect_candidates = effect.collect_candidates
+
+            def count_candidates(*candidate_args, **candidate_kwargs):
+                found = collect_candidates(*candidate_args, **candidate_kwargs)
+                counted.append(len(found[0]))
+                return found
+
+            effect.collect_candidates = count_candidates
+        phases = {}
+        dummy, phases['load'], load_peak = measure(effect.load_raw, memory)
+
+        def run_effect():
+            try:
+                effect.effect()
+            except SystemExit:
+                pass
+
+        dummy, phases['effect'], effect_peak = measure(run_effect, memory)
+    finally:
+        module.pass_ids_to_dbus = passback
+        if getattr(effect, 'file_io', None) is not None:
+            effect.file_io.close()
+        sys.stdout, sys.stderr = stdout, stderr
+        if trace:
+            del os.environ[TRACE_ENV]
+
+    hits = len([x for x in passed[0].split(',') if x]) if passed else 0
+    report = {
+        'phases': phases,
+        'peak_bytes': {'load': load_peak, 'effect': effect_peak},
+        'hits': hits,
+    }
+    if counted:
+        report['candidates'] = counted[0]
+    if trace:
+        effect.trace.file.close()
+        report['spans'] = read_spans(trace_file)
+        os.unlink(trace_file)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--objects', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--depth', type=int, nargs='+', default=[0])
+    parser.add_argument('--clone-ratio', type=float, nargs='+', default=[0.0])
+    parser.add_argument('--hidden-ratio', type=float, default=0.05)
+    parser.add_argument('--locked-ratio', type=float, default=0.05)
+    parser.add_argument('--lasso-segments', type=int, nargs='+', default=[16])
+    parser.add_argument('--lasso-fraction', type=float, default=0.01)
+    parser.add_argument('--case', type=int, nargs='+', default=None,
+                        help='Indices into the case list, default all')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true', help='Skip tracemalloc, it slows allocation heavy code')
+    parser.add_argument('--trace', action='store_true', help='Add the extensions\' per-phase spans to every record')
+    parser.add_argument('--output', default=None, help='JSON lines output file, default stdout')
+    options = parser.parse_args(argv)
+
+    cases = [CASES[i] for i in options.case] if options.case else CASES
+    memory = not options.no_memory
+    output = open(options.output, 'a', encoding='utf-8') if options.output else sys.stdout
+    if memory:
+        tracemalloc.start()
+
+    try:
+        for objects, depth, clone_ratio, lasso_segments in itertools.product(
+                options.objects, options.depth, options.clone_ratio, options.lasso_segments):
+            document = {
+                'objects': objects, 'depth': depth, 'clone_ratio': clone_ratio,
+                'hidden_ratio': options.hidden_ratio, 'locked_ratio': options.locked_ratio,
+                'lasso_segments': lasso_segments, 'lasso_fraction': options.lasso_fraction,
+            }
+            start = time.perf_counter()
+            svg = generate_svg(**document)
+            generate_time = time.perf_counter() - start
+            fd, svg_file = tempfile.mkstemp(suffix='.svg')
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                file.write(svg)
+            try:
+                for (extension, args), run in itertools.product(cases, range(options.repeat)):
+                    if depth and extension == 'select_by_path':
+                        # The objects are inside groups, below the lasso's layer
+                        args = args + ['--scope=layer_recursive']
+                    report = run_case(svg_file, extension, args, memory, options.trace)
+                    # Only the lasso itself means the case measured nothing
+                    assert report.get('candidates', 2) > 1, f'{extension} {args} found no candidates besides the lasso'
+                    record = {
+                        'extension': extension, 'args': args, 'run': run,
+                        'document': document, 'svg_bytes': len(svg), 'generate': generate_time,
+                    }
+                    record.update(report)
+                    output.write(json.dumps(record) + '\n')
+                    output.flush()
+            finally:
+                os.unlink(svg_file)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
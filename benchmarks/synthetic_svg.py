@@ -0,0 +1,115 @@
+"""
+Synthetic SVG documents for benchmarking the selection extensions.
+
+Objects are laid out on a regular grid inside one layer, optionally wrapped
+in nested groups, with a share of ``<use>`` clones and hidden or locked
+objects. The layer also holds a closed lasso path with id ``lasso`` around
+the canvas center, covering a given fraction of the canvas.
+"""
+
+import math
+import random
+
+SPACING = 20.0
+
+SHAPES = ('rect', 'circle', 'ellipse', 'path', 'polyline')
+
+
+def shape_element(kind, x, y, size, element_id, attributes):
+    """SVG markup of one object of the given kind at (x, y)"""
+    if kind == 'rect':
+        return f'<rect id="{element_id}" x="{x:.2f}" y="{y:.2f}" width="{size:.2f}" height="{size * 0.7:.2f}"{attributes}/>'
+    if kind == 'circle':
+        return f'<circle id="{element_id}" cx="{x:.2f}" cy="{y:.2f}" r="{size / 2:.2f}"{attributes}/>'
+    if kind == 'ellipse':
+        return f'<ellipse id="{element_id}" cx="{x:.2f}" cy="{y:.2f}" rx="{size / 2:.2f}" ry="{size / 3:.2f}"{attributes}/>'
+    if kind == 'polyline':
+        return (f'<polyline id="{element_id}" points="{x:.2f},{y:.2f} {x + size:.2f},{y:.2f} '
+                f'{x + size:.2f},{y + size:.2f}" fill="none"{attributes}/>')
+    # Diagonal curve, its bounding box is mostly empty
+    return (f'<path id="{element_id}" d="M {x:.2f},{y:.2f} C {x + size / 3:.2f},{y:.2f} '
+            f'{x + size:.2f},{y + size * 2 / 3:.2f} {x + size:.2f},{y + size:.2f}" fill="none"{attributes}/>')
+
+
+def lasso_path(cx, cy, radius, segments, rng):
+    """Closed cubic path around (cx, cy) with a wobbly radius"""
+    segments = max(3, segments)
+    step = 2 * math.pi / segments
+    kappa = 4 / 3 * math.tan(step / 4)
+    radii = [radius * rng.uniform(0.9, 1.1) for dummy in range(segments)]
+
+    def point(i):
+        angle = i * step
+        r = radii[i % segments]
+        return (cx + r * math.cos(angle), cy + r * math.sin(angle),
+                -r * math.sin(angle) * kappa, r * math.cos(angle) * kappa)
+
+    x0, y0, dummy, dummy = point(0)
+    d = [f'M {x0:.3f},{y0:.3f}']
+    for i in range(segments):
+        xa, ya, txa, tya = point(i)
+        xb, yb, txb, tyb = point(i + 1)
+        d.append(f'C {xa + txa:.3f},{ya + tya:.3f} {xb - txb:.3f},{yb - tyb:.3f} {xb:.3f},{yb:.3f}')
+    d.append('Z')
+    return ' '.join(d)
+
+
+def generate_svg(objects=1000, depth=0, group_size=8, clone_ratio=0.0, clone_sources=8,
+                 hidden_ratio=0.0, locked_ratio=0.0, lasso_segments=16, lasso_fraction=0.01, seed=0):
+    """SVG document text with the given number of objects
+
+    depth wraps every group_size objects in that many nested groups,
+    clone_ratio of the objects are <use> clones of clone_sources shapes in
+    the defs, and hidden_ratio / locked_ratio of the objects are hidden or
+    locked. The lasso has lasso_segments cubic segments and covers
+    lasso_fraction of the canvas.
+    """
+    rng = random.Random(seed)
+    columns = max(1, math.ceil(math.sqrt(objects)))
+    rows = max(1, math.ceil(objects / columns))
+    width, height = columns * SPACING, rows * SPACING
+
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        f'xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd" '
+        f'xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" '
+        f'width="{width}" height="{height}" viewBox="0 0 {width} {height}">\n<defs>\n'
+    ]
+    for k in range(clone_sources):
+        parts.append(shape_element(SHAPES[k % len(SHAPES)], 0, 0, 8, f'source{k}', ''))
+        parts.append('\n')
+    parts.append('</defs>\n<g id="layer1" inkscape:label="Layer 1" inkscape:groupmode="layer">\n')
+
+    open_groups = 0
+    group_count = 0
+    for i in range(objects):
+        if depth and i % group_size == 0:
+            parts.append('</g>' * open_groups)
+            for level in range(depth):
+                parts.append(f'<g id="g{group_count}" transform="translate({rng.uniform(-1, 1):.2f},{rng.uniform(-1, 1):.2f})">')
+                group_count += 1
+            open_groups = depth
+
+        x = (i % columns) * SPACING + rng.uniform(0, 4)
+        y = (i // columns) * SPACING + rng.uniform(0, 4)
+        size = rng.uniform(4, 12)
+        attributes = ''
+        roll = rng.random()
+        if roll < hidden_ratio:
+            attributes += ' style="display:none"'
+        elif roll < hidden_ratio + locked_ratio:
+            attributes += ' sodipodi:insensitive="true"'
+
+        if rng.random() < clone_ratio:
+            source = rng.randrange(clone_sources)
+            parts.append(f'<use id="obj{i}" xlink:href="#source{source}" x="{x:.2f}" y="{y:.2f}"{attributes}/>')
+        else:
+            parts.append(shape_element(SHAPES[i % len(SHAPES)], x, y, size, f'obj{i}', attributes))
+        parts.append('\n')
+    parts.append('</g>' * open_groups)
+
+    radius = math.sqrt(lasso_fraction * width * height / math.pi)
+    d = lasso_path(width / 2, height / 2, radius, lasso_segments, rng)
+    parts.append(f'<path id="lasso" d="{d}" fill="none" stroke="#000000"/>\n</g>\n</svg>\n')
+    return ''.join(parts)
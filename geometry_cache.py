@@ -0,0 +1,278 @@
+"""
+Persistent cache of element bounding boxes and flattened outlines.
+
+Refining a lasso on the same heavy document recomputes the same boxes on
+every run. With the extensions' geometry_cache option the boxes and
+flattened outlines of plain shapes are kept between runs in one file in
+the user cache dir (SELECTION_CACHE_DIR overrides it).
+
+Entries are keyed by a hash of the element's id, tag and attributes, of
+the composed transform of its parent and of the document's user unit
+scale, so an element is only computed again when its geometry, its
+transform chain or the document size changed. Style is left out
+since it does not enter the geometric box; elements with a clip path are
+not cached, their box depends on other elements.
+
+Groups made of such shapes get an entry of their own, keyed by a hash of
+their whole subtree, so that later runs can drop groups away from the
+lasso without measuring their contents.
+
+The file holds two .npy arrays back to back, a structured index and the
+outline segments, and is read memory-mapped: a run only touches the
+entries it looks up. New entries are written with the next save, which
+drops the least recently used entries beyond the size limit and replaces
+the file in one step. Runs that only read update the use times of their
+entries in place.
+"""
+
+import hashlib
+import os
+import time
+
+import numpy as np
+from lxml import etree
+
+CACHE_ENV = 'SELECTION_CACHE_DIR'
+CACHE_FILE = 'geometry_cache.npy'
+DEFAULT_CACHE_BYTES = 256 * 2**20
+
+# Shapes whose box follows from their own attributes
+CACHED_TAGS = {'{http://www.w3.org/2000/svg}' + tag
+               for tag in ('path', 'rect', 'circle', 'ellipse', 'polygon', 'polyline', 'line', 'image')}
+
+# Containers whose box is made up of their children's
+GROUP_TAGS = {'{http://www.w3.org/2000/svg}' + tag for tag in ('g', 'a', 'switch')}
+
+# Elements without geometry that may appear inside groups
+NO_GEOMETRY_TAGS = {'{http://www.w3.org/2000/svg}' + tag for tag in ('title', 'desc', 'metadata')}
+
+# Attributes that do not change the geometry
+IGNORED_ATTRIBUTES = {'style', 'class', '{http://www.inkscape.org/namespaces/inkscape}label',
+                      '{http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd}insensitive'}
+
+INDEX_DTYPE = np.dtype([
+    ('key', '<u8'),
+    ('bbox', '<f8', 4),
+    ('has_bbox', '?'),
+    ('flatness', '<f8'),  # NaN without an outline
+    ('start', '<i8'),
+    ('count', '<i8'),
+    ('used', '<f8'),
+])
+SEGMENT_BYTES = 4 * 8
+
+
+def cache_dir():
+    """Directory of the cache file, SELECTION_CACHE_DIR or the platform's user cache dir"""
+    directory = os.environ.get(CACHE_ENV)
+    if directory:
+        return directory
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'inkscape_select_by_path')
+
+
+def read_arrays(path, mode='r'):
+    """Memory-map the arrays stored back to back in the .npy file at path"""
+    arrays = []
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        while file.tell() < size:
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(file)
+            offset = file.tell()
+            count = int(np.prod(shape))
+            arrays.append(np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=shape) if count
+                          else np.empty(shape, dtype=dtype))
+            file.seek(offset + count * dtype.itemsize)
+    return arrays
+
+
+class GeometryCache:
+    """Boxes and flattened outlines of elements, kept between runs in the file at path
+
+    scale is the user unit scale of the document (inkex's svg.scale).
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_CACHE_BYTES, scale=1.0):
+        self.path = path or os.path.join(cache_dir(), CACHE_FILE)
+        self.max_bytes = max_bytes
+        self.scale = scale
+        self.index = np.empty(0, dtype=INDEX_DTYPE)
+        self.segments = np.empty((0, 2, 2))
+        self.rows = {}
+        # Entries added or changed in this run, by key
+        self.added = {}
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+        self.now = time.time()
+        try:
+            try:
+                # Writable so that use times can be updated in place
+                index, segments = read_arrays(self.path, mode='r+')
+            except PermissionError:
+                index, segments = read_arrays(self.path)
+            if index.dtype != INDEX_DTYPE or segments.shape[1:] != (2, 2):
+                raise ValueError(f"Unexpected cache layout in {self.path}")
+        except (OSError, ValueError):
+            # No cache yet, or one that cannot be read, it is rewritten on save
+            return
+        self.index, self.segments = index, segments
+        self.rows = dict(zip(index['key'].tolist(), range(len(index))))
+
+    def key(self, elem, transform):
+        """Cache key of elem under its parent's composed transform, None if elem is not cached"""
+        if elem.tag not in CACHED_TAGS:
+            return None
+        attributes = []
+        for name, value in elem.attrib.items():
+            if name == 'clip-path' or (name == 'style' and 'clip-path' in value):
+                return None
+            if name not in IGNORED_ATTRIBUTES:
+                attributes.append((name, value))
+        text = repr((elem.tag, sorted(attributes), tuple(transform.matrix), self.scale))
+        return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+
+    def group_key(self, elem, transform, context=()):
+        """Cache key of the group elem with everything below it, None if elem is not cached
+
+        context holds whatever else decides which objects make up the box,
+        such as the selectable tags. Groups holding anything but cached
+        shapes and groups are not cached.
+        """
+        if elem.tag not in GROUP_TAGS:
+            return None
+        for node in elem.iter():
+            if not isinstance(node.tag, str):
+                continue
+            if node.tag not in CACHED_TAGS and node.tag not in GROUP_TAGS and node.tag not in NO_GEOMETRY_TAGS:
+                return None
+            if 'clip-path' in node.attrib or 'clip-path' in node.attrib.get('style', ''):
+                return None
+        text = etree.tostring(elem, with_tail=False) + repr((tuple(transform.matrix), self.scale, context)).encode()
+        return int.from_bytes(hashlib.blake2b(text, digest_size=8).digest(), 'little')
+
+    def entry(self, key):
+        """The added entry or index row for key, None when missing"""
+        if key in self.added:
+            return self.added[key]
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        self.used[row] = self.now
+        record = self.index[row]
+        return {'bbox': record['bbox'], 'has_bbox': record['has_bbox'], 'flatness': record['flatness'],
+                'row': row}
+
+    def bbox(self, key):
+        """(found, bbox) for key, bbox is a (left, top, right, bottom) array or None for elements without one"""
+        entry = self.entry(key)
+        if entry is None or not entry['has_bbox']:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        bbox = entry['bbox']
+        return True, None if np.isnan(bbox).any() else np.array(bbox)
+
+    def set_bbox(self, key, bbox):
+        """Store the box of key, (left, top, right, bottom) or None"""
+        entry = self.editable(key)
+        entry['bbox'] = np.full(4, np.nan) if bbox is None else np.asarray(bbox, dtype=np.float64)
+        entry['has_bbox'] = True
+
+    def outline(self, key, flatness):
+        """Flattened outline of key as (n, 2, 2) segments if stored for this flatness, else None"""
+        entry = self.entry(key)
+        if entry is None or entry['flatness'] != flatness:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if 'segments' in entry:
+            return entry['segments']
+        record = self.index[entry['row']]
+        return np.array(self.segments[record['start']:record['start'] + record['count']])
+
+    def set_outline(self, key, flatness, segments):
+        """Store the outline of key flattened with flatness"""
+        entry = self.editable(key)
+        entry['flatness'] = flatness
+        entry['segments'] = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+
+    def editable(self, key):
+        """Entry of key in added, starting from its stored row"""
+        if key not in self.added:
+            entry = {'bbox': np.full(4, np.nan), 'has_bbox': False, 'flatness': np.nan}
+            row = self.rows.get(key)
+            if row is not None:
+                record = self.index[row]
+                entry.update(bbox=np.array(record['bbox']), has_bbox=bool(record['has_bbox']),
+                             flatness=float(record['flatness']))
+                if not np.isnan(entry['flatness']):
+                    entry['segments'] = np.array(self.segments[record['start']:record['start'] + record['count']])
+            self.added[key] = entry
+        return self.added[key]
+
+    def save_used(self):
+        """Write the use times of the entries read in this run into the stored index"""
+        if not self.used or not isinstance(self.index, np.memmap) or not self.index.flags.writeable:
+            return
+        used = self.index['used']
+        used[list(self.used)] = list(self.used.values())
+        self.index.flush()
+        self.used = {}
+
+    def save(self):
+        """Write the added entries, keeping the most recently used ones within max_bytes
+
+        Runs that only read from the cache just update the use times of
+        the entries they read.
+        """
+        if not self.added:
+            self.save_used()
+            return
+        # Stored rows not replaced by an added entry, then the added ones
+        kept = np.array([row for key, row in self.rows.items() if key not in self.added], dtype=np.intp)
+        old = np.array(self.index[kept]) if len(kept) else np.empty(0, dtype=INDEX_DTYPE)
+        for row, used in self.used.items():
+            position = np.searchsorted(kept, row)
+            if position < len(kept) and kept[position] == row:
+                old['used'][position] = used
+        new = np.zeros(len(self.added), dtype=INDEX_DTYPE)
+        new['key'] = list(self.added)
+        new['used'] = self.now
+        for i, entry in enumerate(self.added.values()):
+            new['bbox'][i] = entry['bbox']
+            new['has_bbox'][i] = entry['has_bbox']
+            new['flatness'][i] = entry['flatness']
+            new['count'][i] = len(entry['segments']) if 'segments' in entry else 0
+        index = np.concatenate((old, new))
+
+        # Least recently used entries go first when over the limit
+        order = np.argsort(-index['used'], kind='stable')
+        sizes = INDEX_DTYPE.itemsize + index['count'][order] * SEGMENT_BYTES
+        order = np.sort(order[np.cumsum(sizes) <= self.max_bytes])
+        parts = [self.segments[start:start + count] if i < len(old) else self.added[key]['segments']
+                 for i, key, start, count in zip(order, index['key'][order], index['start'][order],
+                                                  index['count'][order]) if count]
+        index = index[order]
+        index['start'] = np.concatenate(([0], np.cumsum(index['count'])[:-1])) if len(index) else []
+        segments = np.concatenate(parts) if parts else np.empty((0, 2, 2))
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp = f'{self.path}.{os.getpid()}.tmp'
+        with open(temp, 'wb') as file:
+            np.lib.format.write_array(file, index, version=(1, 0))
+            np.lib.format.write_array(file, np.ascontiguousarray(segments, dtype=np.float64), version=(1, 0))
+        # Release the mapped file before it is replaced
+        self.index = self.segments = None
+        os.replace(temp, self.path)
+        self.index, self.segments = index, segments
+        self.rows = dict(zip(index['key'].tolist(), range(len(index))))
+        self.added = {}
+        self.used = {}
@@ -1,14 +1,37 @@
 
 import sys, os, shutil
 
-from time import sleep
-
-import gi
+from time import sleep, monotonic
 
 import tempfile
 
-gi.require_version("Gio", "2.0")
-from gi.repository import Gio, GLib
+import json
+import socket
+
+from ink_dbus_client import daemon_socket_path, private_dir
+
+# Seconds a connected client may take to send its request, the helper
+# serves one client at a time
+REQUEST_TIMEOUT = 5.0
+
+# Windows API values used to probe the extension process
+WIN_SYNCHRONIZE = 0x00100000
+WIN_WAIT_TIMEOUT = 0x00000102
+WIN_ERROR_ACCESS_DENIED = 5
+
+# gi is only loaded once a bus connection is made, see load_gi
+Gio = None
+GLib = None
+
+
+def load_gi():
+
+    global Gio, GLib
+
+    if Gio is None:
+        import gi
+        gi.require_version("Gio", "2.0")
+        from gi.repository import Gio, GLib
 
 # Needed to write debug info - as not possible to see subprocess
 # stdout / stderr in Inkscape
@@ -54,6 +77,8 @@ class InkDbus:
 
     def start_bus(self):
 
+        load_gi()
+
         try:
             bus = Gio.bus_get_sync(Gio.BusType.SESSION, None)
 
@@ -89,19 +114,86 @@ class InkDbus:
         winGroupName = appGroupName + "/window/1"
         docGroupName = appGroupName + "/document/1"
 
+        InkDbus.bus = bus
+        InkDbus.busName = name
+        InkDbus.appGroupName = appGroupName
+
         InkDbus.applicationGroup = Gio.DBusActionGroup.get(bus, name, appGroupName)
         InkDbus.windowGroup = Gio.DBusActionGroup.get(bus, name, winGroupName)
         InkDbus.documentGroup = Gio.DBusActionGroup.get(bus, name, docGroupName)
 
+    def process_running(self, pid):
+
+        if pid is None:
+            return False
+        if os.name == 'nt':
+            # os.kill cannot probe processes on windows, wait on a handle instead
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.OpenProcess(WIN_SYNCHRONIZE, False, pid)
+            if not handle:
+                # Gone, or not ours to open (ERROR_ACCESS_DENIED means it is there)
+                return kernel32.GetLastError() == WIN_ERROR_ACCESS_DENIED
+            try:
+                return kernel32.WaitForSingleObject(handle, 0) == WIN_WAIT_TIMEOUT
+            finally:
+                kernel32.CloseHandle(handle)
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def inkscape_responding(self, timeout_float):
+
+        # A synchronous call only returns once the Inkscape main loop
+        # is serving requests again
+        try:
+            InkDbus.bus.call_sync(InkDbus.busName, InkDbus.appGroupName, 'org.gtk.Actions', 'List',
+                                  None, None, Gio.DBusCallFlags.NO_AUTO_START,
+                                  max(1, int(timeout_float * 1000)), None)
+        except GLib.Error:
+            return False
+        return True
+
+    # Wait for the extension process (parent_pid) to exit and Inkscape to
+    # answer on the bus, polling with a short backoff. Gives up after
+    # dbus_delay_float seconds and returns the time waited.
+
+    def wait_until_ready(self, parent_pid, dbus_delay_float):
+
+        start = monotonic()
+        deadline = start + dbus_delay_float
+        interval = 0.005
+
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            if not InkDbus.process_running(None, parent_pid) and InkDbus.inkscape_responding(None, remaining):
+                break
+            sleep(min(interval, max(0, deadline - monotonic())))
+            interval = min(interval * 2, 0.05)
+
+        return monotonic() - start
+
     # This function is used if we have already launched a subprocess
     # From an Inkscape extension. We cannot have a sub-subprocess
     # in windows sucessfully without introducing delays.
 
-    def call_dbus_selection(self, path_id_list, current_selection_id_list, selection_mode, dbus_delay_float):
+    def call_dbus_selection(self, path_id_list, current_selection_id_list, selection_mode, dbus_delay_float,
+                            parent_pid=None, debug=False, chunk_size=1000):
 
-        InkDbus.start_bus(None)
+        # Connect once per process, the helper daemon reuses the connection
+        if not hasattr(InkDbus, 'applicationGroup'):
+            InkDbus.start_bus(None)
 
-        sleep(dbus_delay_float)
+        # Wait until Inkscape can take the selection, at most dbus_delay_float
+        waited = InkDbus.wait_until_ready(None, parent_pid, dbus_delay_float)
+        if debug:
+            write_debug_file(f'DBus ready after {waited:.3f}s (limit {dbus_delay_float}s)\n', 'ink_dbus_debug.txt')
 
         # It's just easier to clear the selection and start from scratch
 
@@ -116,15 +208,57 @@ class InkDbus:
 
         elif selection_mode == 'subtract':
 
+            path_ids = set(path_id_list)
+            path_id_list = [x for x in current_selection_id_list if x not in path_ids]
+
+        InkDbus.ink_dbus_action_chunked(None, 'select-by-id', path_id_list, chunk_size)
+
+    # Apply only the changes to the current selection, computed by the
+    # extension with ink_dbus_client.selection_delta
+
+    def call_dbus_selection_delta(self, add_id_list, remove_id_list, dbus_delay_float,
+                                  parent_pid=None, debug=False, chunk_size=1000):
 
-            path_id_list = [x for x in current_selection_id_list if x not in path_id_list]
+        if not hasattr(InkDbus, 'applicationGroup'):
+            InkDbus.start_bus(None)
 
-        path_id_list_string = f"{','.join(path_id_list)}"
-        InkDbus.ink_dbus_action(None, 'application', 'select-by-id', path_id_list_string, None)
+        waited = InkDbus.wait_until_ready(None, parent_pid, dbus_delay_float)
+        if debug:
+            write_debug_file(f'DBus ready after {waited:.3f}s (limit {dbus_delay_float}s), '
+                             f'adding {len(add_id_list)}, removing {len(remove_id_list)}\n', 'ink_dbus_debug.txt')
+
+        InkDbus.ink_dbus_action_chunked(None, 'unselect-by-id', remove_id_list, chunk_size)
+        InkDbus.ink_dbus_action_chunked(None, 'select-by-id', add_id_list, chunk_size)
+
+    # Send id list actions in bounded chunks, a single huge id string stalls Inkscape
+
+    def ink_dbus_action_chunked(self, action, id_list, chunk_size):
+
+        chunk_size = max(1, chunk_size)
+        for start in range(0, len(id_list), chunk_size):
+            id_list_string = f"{','.join(id_list[start:start + chunk_size])}"
+            InkDbus.ink_dbus_action(None, 'application', action, id_list_string, None)
+
+    def apply_request(self, request):
+
+        InkDbus.call_dbus_selection_delta(None, request['add_ids'], request['remove_ids'], request['dbus_delay'],
+                                          request.get('pid'), request.get('debug', False),
+                                          request.get('chunk_size', 1000))
 
     def standalone_dbus(self):
 
         path_id_args = sys.argv[4]
+
+        # '@<file>' - the whole request is in a temp file written by
+        # ink_dbus_client.write_request_file, ids never touch argv
+        if path_id_args.startswith('@'):
+            request_path = path_id_args[1:]
+            with open(request_path, encoding='utf-8') as file:
+                request = json.load(file)
+            os.unlink(request_path)
+            InkDbus.apply_request(None, request)
+            return
+
         path_id_list, dummy_string = selection_arg_to_list(path_id_args)
 
         # Delay (mainly for windows systems)
@@ -139,8 +273,62 @@ class InkDbus:
 
         InkDbus.call_dbus_selection(None, path_id_list, current_selection_id_list, selection_mode, dbus_delay_float)
 
+    # Long-lived helper, started with: python3 ink_dbus.py serve
+    # Keeps the bus connection and action groups warm and applies selection
+    # requests sent over a UNIX socket by ink_dbus_client.send_to_daemon
+
+    def serve(self, socket_path=None):
+
+        socket_path = socket_path or daemon_socket_path()
+        socket_dir = os.path.dirname(socket_path)
+
+        # Only a directory no one else can write to keeps the socket ours
+        os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+        if not private_dir(socket_dir):
+            sys.exit(f'ink_dbus serve: {socket_dir} must belong to you and be writable by you only')
+
+        InkDbus.start_bus(None)
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # The socket is created with mode 0600 right away
+        umask = os.umask(0o177)
+        try:
+            server.bind(socket_path)
+        finally:
+            os.umask(umask)
+        server.listen()
+
+        try:
+            while True:
+                conn, dummy = server.accept()
+                try:
+                    with conn:
+                        conn.settimeout(REQUEST_TIMEOUT)
+                        chunks = []
+                        while True:
+                            chunk = conn.recv(65536)
+                            if not chunk:
+                                break
+                            chunks.append(chunk)
+                    request = json.loads(b''.join(chunks).decode('utf-8'))
+                    InkDbus.apply_request(None, request)
+                except BaseException as error:
+                    if isinstance(error, KeyboardInterrupt):
+                        raise
+                    write_debug_file(f'ink_dbus serve: {error!r}\n', 'ink_dbus_serve.txt')
+        finally:
+            server.close()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
 # If ink_dbus is called as a subprocess
 
 if 'as_subprocess' in sys.argv:
     InkDbus.standalone_dbus(None)
 
+elif len(sys.argv) > 1 and sys.argv[1] == 'serve':
+    InkDbus.serve(None)
+
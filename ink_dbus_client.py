@@ -0,0 +1,127 @@
+"""
+Client side of the long-lived ink_dbus.py selection helper.
+
+Start the helper once with ``python3 ink_dbus.py serve``. It keeps the DBus
+connection and Inkscape action groups open and listens on a local UNIX
+socket, so an extension run only has to write one request to the socket
+instead of starting a new interpreter and connecting to the bus.
+
+This module must stay free of gi and other heavy imports, it is loaded by
+every extension run. json and socket are only imported on the passback path.
+"""
+
+import os
+import stat
+import tempfile
+
+
+def daemon_socket_path():
+    """Path of the helper's UNIX socket, in a directory private to the current user
+
+    That is $XDG_RUNTIME_DIR, or else a directory of the user's own in the
+    shared temp dir, which the helper creates with mode 0700.
+    """
+    user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, f'ink_dbus_{user}.sock')
+    return os.path.join(tempfile.gettempdir(), f'ink_dbus_{user}', 'ink_dbus.sock')
+
+
+def private_dir(path):
+    """Whether the directory at path belongs to the current user and no one else can write to it"""
+    if not hasattr(os, 'getuid'):
+        return False
+    try:
+        info = os.stat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and not info.st_mode & 0o022
+
+
+def trusted_socket(path):
+    """Whether the socket at path is the current user's, in a directory only they can write to
+
+    Another user could otherwise put a socket there to receive the ids.
+    """
+    try:
+        info = os.stat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid() and private_dir(os.path.dirname(path))
+
+
+def selection_delta(current_id_list, path_id_list, selection_mode, deselect_id_list=()):
+    """Final selection for a selection mode and the changes leading to it
+
+    selection_mode is 'clear' (replace), 'add' or 'subtract'. Returns the
+    final id list and the ids to add to and remove from current_id_list,
+    all in their original order. deselect_id_list are also selected in
+    Inkscape but take no part in the mode, like the lasso paths, they are
+    removed unless path_id_list selects them.
+    """
+    current_ids = set(current_id_list) | set(deselect_id_list)
+    path_ids = set(path_id_list)
+    if selection_mode == 'add':
+        final_id_list = list(dict.fromkeys(list(current_id_list) + list(path_id_list)))
+    elif selection_mode == 'subtract':
+        final_id_list = [x for x in current_id_list if x not in path_ids]
+    else:
+        final_id_list = list(dict.fromkeys(path_id_list))
+    final_ids = set(final_id_list)
+    add_id_list = [x for x in final_id_list if x not in current_ids]
+    remove_id_list = [x for x in dict.fromkeys(list(current_id_list) + list(deselect_id_list)) if x not in final_ids]
+    return final_id_list, add_id_list, remove_id_list
+
+
+def selection_request(add_id_list, remove_id_list, dbus_delay, debug=False, chunk_size=1000):
+    """Selection request as understood by ink_dbus.py
+
+    Only the changes to the current selection are sent. The helper waits
+    for this process to exit before selecting, at most dbus_delay seconds,
+    and sends the ids in calls of at most chunk_size ids.
+    """
+    return {
+        'add_ids': list(add_id_list),
+        'remove_ids': list(remove_id_list),
+        'dbus_delay': float(dbus_delay),
+        'pid': os.getpid(),
+        'debug': bool(debug),
+        'chunk_size': int(chunk_size),
+    }
+
+
+def send_to_daemon(request):
+    """Send a selection request to the running helper
+
+    Returns False when no helper is listening, or the socket does not
+    belong to the current user, so the caller can fall back to spawning
+    ink_dbus.py.
+    """
+    import json
+    import socket
+
+    socket_path = daemon_socket_path()
+    if not hasattr(socket, 'AF_UNIX') or not trusted_socket(socket_path):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_path)
+            client.sendall(json.dumps(request).encode('utf-8'))
+    except OSError:
+        return False
+    return True
+
+
+def write_request_file(request):
+    """Write a selection request to a temp file for a spawned ink_dbus.py
+
+    Keeps the id lists off the command line, which is limited in size.
+    ink_dbus.py removes the file after reading it.
+    """
+    import json
+
+    fd, request_path = tempfile.mkstemp(prefix='ink_dbus_', suffix='.json')
+    with os.fdopen(fd, 'w', encoding='utf-8') as file:
+        json.dump(request, file)
+    return request_path
@@ -0,0 +1,134 @@
+"""
+Structured timing and memory instrumentation for the selection extensions.
+
+A run is split into named spans (document load, candidate gathering with
+their bounding boxes, lasso flattening, geometry tests, result processing,
+DBus handoff). Each finished span is appended as one JSON line with its
+duration, tracemalloc peak and counts such as candidates or hits.
+
+Tracing is enabled with the extensions' trace option, which logs to
+selection_trace.jsonl in the temp dir, or by pointing the
+SELECTION_TRACE_LOG environment variable at a log file. When it is off,
+span() returns one shared no-op span, so instrumented code only pays for
+a method call.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+TRACE_ENV = 'SELECTION_TRACE_LOG'
+DEFAULT_TRACE_FILE = 'selection_trace.jsonl'
+
+
+class NullSpan:
+    """Span used when tracing is off, does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **counts):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    """Timed section of a run, written to the trace log when it ends"""
+
+    def __init__(self, trace, name, counts):
+        self.trace = trace
+        self.name = name
+        self.counts = dict(counts)
+
+    def set(self, **counts):
+        """Add or update counts reported with the span"""
+        self.counts.update(counts)
+
+    def __enter__(self):
+        stack = self.trace.stack
+        self.parent = stack[-1].name if stack else None
+        if self.trace.memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            # Hand the peak so far to the enclosing span before resetting it
+            if stack:
+                stack[-1].max_memory = max(stack[-1].max_memory, peak)
+            tracemalloc.reset_peak()
+            self.base_memory = self.max_memory = current
+        stack.append(self)
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.start
+        stack = self.trace.stack
+        stack.pop()
+        record = {
+            'run': self.trace.run_id,
+            'extension': self.trace.extension,
+            'span': self.name,
+            'parent': self.parent,
+            'start': self.wall_start,
+            'duration_s': duration,
+        }
+        if self.trace.memory:
+            import tracemalloc
+            self.max_memory = max(self.max_memory, tracemalloc.get_traced_memory()[1])
+            record['peak_bytes'] = self.max_memory - self.base_memory
+            if stack:
+                stack[-1].max_memory = max(stack[-1].max_memory, self.max_memory)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        record['counts'] = self.counts
+        self.trace.write(record)
+        return False
+
+
+class Trace:
+    """Span factory writing JSON lines to log_path, disabled without a log path"""
+
+    def __init__(self, extension=None, log_path=None, memory=True):
+        self.extension = extension
+        self.log_path = log_path
+        self.memory = memory and log_path is not None
+        self.run_id = f'{os.getpid()}-{int(time.time() * 1000)}'
+        self.stack = []
+        self.file = None
+        if self.memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    @property
+    def enabled(self):
+        return self.log_path is not None
+
+    @classmethod
+    def from_options(cls, extension, enabled=False):
+        """Trace for an extension run, logging where SELECTION_TRACE_LOG points or to the temp dir when enabled"""
+        log_path = os.environ.get(TRACE_ENV) or None
+        if log_path is None and enabled:
+            log_path = os.path.join(tempfile.gettempdir(), DEFAULT_TRACE_FILE)
+        return cls(extension, log_path)
+
+    def span(self, name, **counts):
+        """Context manager timing the enclosed block as a span called name"""
+        if self.log_path is None:
+            return NULL_SPAN
+        return Span(self, name, counts)
+
+    def write(self, record):
+        if self.file is None:
+            self.file = open(self.log_path, 'a', encoding='utf-8')
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+
+NO_TRACE = Trace()
@@ -1,13 +1,57 @@
 #!/usr/bin/env python
 
 import inkex
-from inkex import PathElement, ShapeElement
-from inkex.paths import CubicSuperPath, Path
-from inkex.bezier import pointdistance
+from inkex import BoundingBox, Group, Transform, PathElement, ShapeElement, Rectangle, Circle, Ellipse, Polygon, Polyline, Line, Use
 import numpy as np
-import subprocess
+from ink_dbus_client import selection_delta, selection_request, send_to_daemon, write_request_file
+from geometry_cache import GeometryCache
+from instrumentation import Trace, NO_TRACE
 
-import sys, os, shutil
+import sys, os, re, time
+
+# Upper bound for the number of (object, sample) pairs tested in one
+# broadcast step, keeps memory bounded on large layers
+BROADCAST_CHUNK = 1 << 20
+
+# Upper bound for the number of Bézier segment pairs kept alive while
+# subdividing, overlapping curves would otherwise grow it exponentially
+MAX_SUBDIVISION_PAIRS = 1 << 16
+
+# Candidates in the first batch evaluated under a time budget, later
+# batches are sized from the measured rate to fit the time left
+BUDGET_FIRST_BATCH = 16
+
+# Share of the time left that collecting candidates may use under a time
+# budget, the rest is kept for testing them
+BUDGET_COLLECT_SHARE = 0.5
+
+# Flatness of the lasso used to order objects under a time budget, as a
+# share of the diagonal of its box
+BUDGET_ORDER_FLATNESS = 0.01
+
+# Elements with an outline usable for geometry tests
+OUTLINE_ELEMENTS = (PathElement, Rectangle, Circle, Ellipse, Polygon, Polyline, Line)
+
+# Element types a lasso can select, groups are added on request
+SELECTABLE_TAGS = ('path', 'rect', 'circle', 'ellipse', 'polygon', 'polyline', 'line', 'text', 'image', 'use')
+
+# A display:none declaration in a style attribute
+DISPLAY_NONE = re.compile(r'(?:^|;)\s*display\s*:\s*none\s*(?:;|$)')
+
+# Elements walked into by the recursive scopes
+CONTAINER_TAGS = {inkex.addNS(tag, 'svg') for tag in ('g', 'a', 'switch')}
+
+# Attribute pairs read for a rough position of a shape before its box is
+# computed, the path data and points are read first
+ANCHOR_ATTRIBUTES = (('x', 'y'), ('cx', 'cy'), ('x1', 'y1'))
+ANCHOR_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+# Rough cost of one exact Bézier pair test in units of one vectorized
+# segment/object test, used to weigh geometry_cross against the threshold
+BEZIER_PAIR_COST = 1000
+
+# Test state of a process pool worker, set once per worker by init_worker
+WORKER = {}
 
 
 def get_attributes(obj):
@@ -62,13 +106,35 @@ def set_stderr(state):
 # import warnings
 # warnings.filterwarnings("ignore")
 
-def pass_ids_to_dbus(path_id_list_string, dbus_delay, selection_mode, current_selection_id_list_string):
+def pass_ids_to_dbus(path_id_list_string, dbus_delay, selection_mode, current_selection_id_list_string, debug=False,
+                     chunk_size=1000, lasso_id_list=()):
     dbus_delay = str(dbus_delay)
     inkex.utils.debug(f"DBus delay: {dbus_delay}")
     inkex.utils.debug(f"Selection mode: {selection_mode}")
     inkex.utils.debug(f"Path ID list: {path_id_list_string}")
     inkex.utils.debug(f"Current selection ID list: {current_selection_id_list_string}")
 
+    # Work out the final selection here and only send the changes,
+    # ink_dbus.py waits for this process to exit before selecting,
+    # with debug it records the wait in its debug file
+    path_id_list = [x for x in path_id_list_string.split(',') if x]
+    current_selection_id_list = [x for x in current_selection_id_list_string.split(',') if x]
+    # The lassos are still selected in Inkscape, they are deselected unless hit
+    final_id_list, add_id_list, remove_id_list = selection_delta(current_selection_id_list, path_id_list, selection_mode,
+                                                                 lasso_id_list)
+    inkex.utils.debug(f"Adding {len(add_id_list)}, removing {len(remove_id_list)} IDs")
+    request = selection_request(add_id_list, remove_id_list, dbus_delay, debug, chunk_size)
+
+    # A running ink_dbus.py helper takes the request with one socket write
+    if send_to_daemon(request):
+        return
+
+    # Otherwise hand the request over in a temp file, the id lists can be
+    # too long for the command line
+    request_arg = '@' + write_request_file(request)
+
+    import subprocess
+
     if os_check() == 'windows':
 
         py_exe = sys.executable
@@ -76,14 +142,296 @@ def pass_ids_to_dbus(path_id_list_string, dbus_delay, selection_mode, current_se
             py_exe = py_exe.replace('pythonw.exe', 'python.exe')
 
         DETACHED_PROCESS = 0x08000000
-        subprocess.Popen([py_exe, 'ink_dbus.py',  'application', 'None', 'None', path_id_list_string, dbus_delay, selection_mode, current_selection_id_list_string, 'as_subprocess'], creationflags=DETACHED_PROCESS)
+        subprocess.Popen([py_exe, 'ink_dbus.py',  'application', 'None', 'None', request_arg, dbus_delay, selection_mode, '', 'as_subprocess'], creationflags=DETACHED_PROCESS)
     else:
-        subprocess.Popen(['python3', 'ink_dbus.py', 'application', 'None', 'None', path_id_list_string, dbus_delay, selection_mode, current_selection_id_list_string, 'as_subprocess'],
+        subprocess.Popen(['python3', 'ink_dbus.py', 'application', 'None', 'None', request_arg, dbus_delay, selection_mode, '', 'as_subprocess'],
                          preexec_fn=os.setpgrp, stdout=open('/dev/null', 'w'),
                          stderr=open('/dev/null', 'w'), )
 
+def init_worker(method, items_arg, kwargs):
+    """Keep the test of a parallel evaluation and its flattened lasso in the worker"""
+    WORKER['test'] = getattr(BezierIntersection(), method)
+    WORKER['items_arg'] = items_arg
+    WORKER['kwargs'] = kwargs
+
+
+def run_chunk(items):
+    """Run the worker's test on one chunk of items"""
+    return WORKER['test'](**{WORKER['items_arg']: items}, **WORKER['kwargs'])
+
+
+class BBoxGrid:
+    """Uniform grid index over an (objects, 4) bounding box array
+
+    Every object is registered in each grid cell its bounding box overlaps.
+    Cell keys and object indices are stored as sorted NumPy arrays, so
+    queries are binary searches over the occupied cells near the lasso
+    instead of a scan over every object in the layer. Objects spanning
+    more than max_cells_per_object cells are kept aside and always
+    returned as candidates.
+    """
+
+    max_cells_per_object = 64
+
+    def __init__(self, bboxes, cell_size=None):
+        self.bboxes = bboxes
+        self.origin = np.zeros(2)
+        self.upper = np.zeros(2)
+        self.cell_size = 1.0
+        self.keys = np.empty(0, dtype=np.int64)
+        self.items = np.empty(0, dtype=np.intp)
+        self.large = np.empty(0, dtype=np.intp)
+
+        idx = np.flatnonzero(~np.isnan(bboxes).any(axis=1))
+        if not len(idx):
+            return
+        b = bboxes[idx]
+        self.origin = b[:, :2].min(axis=0)
+        self.upper = b[:, 2:].max(axis=0)
+        if cell_size is None:
+            # Roughly one typical object per cell, but never less than one
+            # cell per object on sparse layers, nor more than 1024 cells
+            # along an axis
+            extent = self.upper - self.origin
+            typical = np.median(b[:, 2:] - b[:, :2], axis=0).max()
+            cell_size = max(typical, np.sqrt(extent[0] * extent[1] / len(idx)), extent.max() / 1024)
+            if not cell_size > 1e-9:
+                # All objects collapse to one point, any cell size will do
+                cell_size = 1.0
+        self.cell_size = float(cell_size)
+
+        owner, keys = self._expand(self._cells(b[:, :2]), self._cells(b[:, 2:]), self.max_cells_per_object)
+        large = np.ones(len(idx), dtype=bool)
+        large[owner] = False
+        self.large = idx[large]
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.items = idx[owner][order]
+
+    def _cells(self, points):
+        """Grid cell coordinates of points"""
+        cells = np.floor((points - self.origin) / self.cell_size)
+        return np.clip(cells, -2**30, 2**30).astype(np.int64)
+
+    def _expand(self, lo, hi, limit=None):
+        """Enumerate the cells covered by each (lo, hi) cell range
+
+        Returns the range index and cell key of every covered cell. Ranges
+        covering more than limit cells are left out.
+        """
+        spans = hi - lo + 1
+        counts = spans[:, 0] * spans[:, 1]
+        ranges = np.arange(len(lo))
+        if limit is not None:
+            ranges = ranges[counts <= limit]
+            lo, spans, counts = lo[ranges], spans[ranges], counts[ranges]
+        owner = np.repeat(np.arange(len(lo)), counts)
+        offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        ci = lo[owner, 0] + offset // spans[owner, 1]
+        cj = lo[owner, 1] + offset % spans[owner, 1]
+        return ranges[owner], (ci + 2**30) * 2**31 + (cj + 2**30)
+
+    def _lookup(self, keys):
+        """Sorted unique indices of objects registered in any of the cells"""
+        keys = np.unique(keys)
+        starts = np.searchsorted(self.keys, keys, side='left')
+        lengths = np.searchsorted(self.keys, keys, side='right') - starts
+        pos = (np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+               + np.repeat(starts, lengths))
+        return np.union1d(self.items[pos], self.large)
+
+    def query_points(self, points, tol=0.0):
+        """Candidate objects whose bounding box may lie within tol of any point"""
+        if not len(points):
+            return np.empty(0, dtype=np.intp)
+        lo, hi = self._clip_cells(self._cells(points - tol), self._cells(points + tol))
+        dummy, keys = self._expand(lo, hi)
+        return self._lookup(keys)
+
+    def _clip_cells(self, lo, hi):
+        """Restrict cell ranges to the occupied grid, dropping ranges outside of it"""
+        last = self._cells(self.upper[None, :])[0]
+        lo, hi = np.maximum(lo, 0), np.minimum(hi, last)
+        inside = (lo <= hi).all(axis=1)
+        return lo[inside], hi[inside]
+
+    def query_segments(self, segments, tol=0.0):
+        """Candidate objects whose bounding box may lie within tol of any line segment
+
+        Segments are given as an (segments, 2, 2) array. Long segments are
+        split into pieces no longer than one cell, every point of a piece
+        lies within half a cell of one of its end points.
+        """
+        # Only the parts of the segments over the grid can find anything
+        segments = self.clip_segments(segments, self.origin - tol - self.cell_size, self.upper + tol + self.cell_size)
+        if not len(segments):
+            return np.empty(0, dtype=np.intp)
+        delta = segments[:, 1] - segments[:, 0]
+        lengths = np.nan_to_num(np.hypot(delta[:, 0], delta[:, 1]))
+        pieces = np.maximum(1, np.ceil(lengths / self.cell_size)).astype(np.int64)
+        owner = np.repeat(np.arange(len(segments)), pieces + 1)
+        step = np.arange(len(owner)) - np.repeat(np.cumsum(pieces + 1) - (pieces + 1), pieces + 1)
+        t = (step / pieces[owner])[:, None]
+        points = segments[owner, 0] + t * delta[owner]
+        return self.query_points(points, tol + self.cell_size / 2)
+
+    def clip_segments(self, segments, lower, upper):
+        """Clip (segments, 2, 2) line segments to the rectangle from lower to upper (Liang-Barsky)"""
+        start = segments[:, 0]
+        delta = segments[:, 1] - start
+        t0 = np.zeros(len(segments))
+        t1 = np.ones(len(segments))
+        for axis in (0, 1):
+            d = delta[:, axis]
+            parallel = d == 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ta = (lower[axis] - start[:, axis]) / d
+                tb = (upper[axis] - start[:, axis]) / d
+            t0 = np.where(parallel, t0, np.maximum(t0, np.minimum(ta, tb)))
+            t1 = np.where(parallel, t1, np.minimum(t1, np.maximum(ta, tb)))
+            outside = parallel & ((start[:, axis] < lower[axis]) | (start[:, axis] > upper[axis]))
+            t1 = np.where(outside, -1.0, t1)
+        keep = t0 <= t1
+        return np.stack((start + t0[:, None] * delta, start + t1[:, None] * delta), axis=1)[keep]
+
+    def query_rect(self, rect):
+        """Indices of objects whose bounding box overlaps rect (left, top, right, bottom)"""
+        lo, hi = self._clip_cells(self._cells(np.array([rect[:2]])), self._cells(np.array([rect[2:]])))
+        if not len(lo):
+            return np.empty(0, dtype=np.intp)
+        spans = hi - lo + 1
+        if spans[0, 0] * spans[0, 1] <= len(self.keys):
+            candidates = self._lookup(self._expand(lo, hi)[1])
+        else:
+            candidates = np.arange(len(self.bboxes))
+        b = self.bboxes[candidates]
+        overlap = ((b[:, 0] <= rect[2]) & (rect[0] <= b[:, 2])
+                   & (b[:, 1] <= rect[3]) & (rect[1] <= b[:, 3]))
+        return candidates[overlap]
+
+
+class BezierPath:
+    """Cubic Bézier segments of a path as one contiguous (segments, 4, 2) float64 array
+
+    Each row holds the start point, the two control points and the end
+    point of a segment, in path order. Evaluation, derivatives, boxes and
+    subdivision work on all segments at once, and np.asarray on a
+    BezierPath returns the array itself.
+    """
+
+    __slots__ = ('segments',)
+
+    def __init__(self, segments=()):
+        self.segments = np.ascontiguousarray(segments, dtype=np.float64).reshape(-1, 4, 2)
+
+    @classmethod
+    def from_superpath(cls, csp):
+        """Segments of all subpaths of a CubicSuperPath"""
+        parts = []
+        for subpath in csp:
+            if len(subpath) < 2:
+                continue
+            # Nodes are (incoming handle, point, outgoing handle)
+            nodes = np.asarray(subpath, dtype=np.float64)
+            parts.append(np.stack((nodes[:-1, 1], nodes[:-1, 2], nodes[1:, 0], nodes[1:, 1]), axis=1))
+        return cls(np.concatenate(parts) if parts else ())
+
+    @classmethod
+    def concatenate(cls, paths):
+        """One path with the segments of all paths in order"""
+        paths = [np.asarray(path, dtype=np.float64).reshape(-1, 4, 2) for path in paths]
+        return cls(np.concatenate(paths) if paths else ())
+
+    def __len__(self):
+        return len(self.segments)
+
+    def __iter__(self):
+        return iter(self.segments)
+
+    def __getitem__(self, index):
+        return self.segments[index]
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None or np.dtype(dtype) == self.segments.dtype:
+            return self.segments.copy() if copy else self.segments
+        return self.segments.astype(dtype)
+
+    @staticmethod
+    def basis(t):
+        """Cubic Bernstein weights of the parameters t, a (..., 4) array"""
+        t = np.asarray(t, dtype=np.float64)[..., None]
+        mt = 1 - t
+        return np.concatenate((mt**3, 3 * mt**2 * t, 3 * mt * t**2, t**3), axis=-1)
+
+    @staticmethod
+    def derivative_basis(t):
+        """Weights of the control point differences in the first derivative at t, a (..., 3) array"""
+        t = np.asarray(t, dtype=np.float64)[..., None]
+        mt = 1 - t
+        return np.concatenate((3 * mt**2, 6 * mt * t, 3 * t**2), axis=-1)
+
+    def points(self, t):
+        """Every segment at each of the parameters t, a (segments, len(t), 2) array"""
+        return self.basis(np.atleast_1d(t)) @ self.segments
+
+    def points_at(self, t):
+        """Each segment at its own parameter, t is a (segments,) array, returns (segments, 2)"""
+        return np.einsum('nk,nkd->nd', self.basis(t), self.segments)
+
+    def derivatives(self, t):
+        """First derivative of every segment at each of the parameters t, a (segments, len(t), 2) array"""
+        return self.derivative_basis(np.atleast_1d(t)) @ np.diff(self.segments, axis=1)
+
+    def derivatives_at(self, t):
+        """First derivative of each segment at its own parameter, returns (segments, 2)"""
+        return np.einsum('nk,nkd->nd', self.derivative_basis(t), np.diff(self.segments, axis=1))
+
+    def bboxes(self):
+        """Control point bounding boxes (left, top, right, bottom) of the segments, a (segments, 4) array"""
+        return np.concatenate((self.segments.min(axis=1), self.segments.max(axis=1)), axis=1)
+
+    def bbox(self):
+        """Bounding box (left, top, right, bottom) of all control points, NaN when empty
+
+        By the convex hull property it contains the whole path.
+        """
+        if not len(self.segments):
+            return np.full(4, np.nan)
+        points = self.segments.reshape(-1, 2)
+        return np.concatenate((points.min(axis=0), points.max(axis=0)))
+
+    def split(self, t=0.5):
+        """Split every segment at t with de Casteljau's algorithm, returns the (first, second) halves
+
+        Each level of the construction is computed for all segments at
+        once, both halves are views into one array.
+        """
+        segments = self.segments
+        # Points on the control polygon, then on the lines between them
+        level1 = segments[:, :-1] + t * np.diff(segments, axis=1)
+        level2 = level1[:, :-1] + t * np.diff(level1, axis=1)
+        mid = level2[:, 0] + t * (level2[:, 1] - level2[:, 0])
+        halves = np.empty((2,) + segments.shape)
+        first, second = halves
+        first[:, 0], first[:, 1], first[:, 2], first[:, 3] = segments[:, 0], level1[:, 0], level2[:, 0], mid
+        second[:, 0], second[:, 1], second[:, 2], second[:, 3] = mid, level2[:, 1], level1[:, 2], segments[:, 3]
+        return BezierPath(first), BezierPath(second)
+
+    def transform(self, transform):
+        """The path mapped by an inkex Transform"""
+        matrix = np.array(Transform(transform).matrix)
+        return BezierPath(self.segments @ matrix[:, :2].T + matrix[:, 2])
+
+
 class BezierIntersection(inkex.EffectExtension):
 
+    # Replaced in load_raw, runs that skip it are not traced
+    trace = NO_TRACE
+    geometry_cache = None
+    # Set from the time_budget option, objects it left out are counted in unevaluated
+    deadline = None
+    unevaluated = 0
+
     def add_arguments(self, pars):
 
         pars.add_argument("--debug", type=inkex.Boolean, default=False,
@@ -94,9 +442,9 @@ class BezierIntersection(inkex.EffectExtension):
                          help="Selection method: touching, enclosed")
 
         pars.add_argument("--t_criteria", type=str, default='bounding_box_cross',
-                            help="Selection criteria for touching path: bounding_box_center, bounding_box_cross")
+                            help="Selection criteria for touching path: bounding_box_center, bounding_box_cross, geometry_cross")
         pars.add_argument("--e_criteria", type=str, default='bounding_box_center',
-                            help="Selection criteria for enclosed path: bounding_box_center, all_points, any_point")
+                            help="Selection criteria for enclosed path: bounding_box_center, all_points, any_point, geometry_inside")
 
         pars.add_argument("--t_include_hidden", type=inkex.Boolean, default=False, 
                          help="Include hidden/locked objects")
@@ -109,7 +457,12 @@ class BezierIntersection(inkex.EffectExtension):
                             help="Include groups in selection")
 
         pars.add_argument("--dbus_delay_float", type=float, default=0.5,
-                         help="Delay for DBus selection passback")
+                         help="Maximum wait for Inkscape before the DBus selection passback")
+        pars.add_argument("--dbus_chunk_size", type=int, default=1000,
+                         help="Maximum number of IDs per DBus selection call")
+
+        pars.add_argument("--scope", type=str, default='layer',
+                         help="Objects tested: layer (children of the lasso's layer), layer_recursive, all_layers, document")
 
         pars.add_argument("--t_mode", type=str, default='replace',
                          help="Selection mode for touching path: replace, add, subtract")
@@ -125,239 +478,1213 @@ class BezierIntersection(inkex.EffectExtension):
                             help="Tolerance for Bezier intersection (px)")
         
         pars.add_argument("--sample_points", type=int, default=200,
-                         help="Number of sample points along path")
+                         help="Number of sample points along path (fixed flattening)")
+        pars.add_argument("--flatten", type=str, default='adaptive',
+                         help="Path flattening for touching selection: adaptive, fixed")
+        pars.add_argument("--flatness", type=float, default=0.1,
+                         help="Maximum distance between path and its flattened polyline (px)")
+        pars.add_argument("--workers", type=int, default=0,
+                         help="Worker processes for parallel evaluation, 0 uses all cores, 1 disables it")
+        pars.add_argument("--parallel_threshold", type=int, default=20000000,
+                         help="Minimum number of segment/object tests for parallel evaluation")
+        pars.add_argument("--trace", type=inkex.Boolean, default=False,
+                         help="Write per-phase timings and memory peaks to a JSON-lines log")
+        pars.add_argument("--geometry_cache", type=inkex.Boolean, default=False,
+                         help="Keep bounding boxes and flattened outlines between runs in the user cache dir")
+        pars.add_argument("--geometry_cache_mb", type=int, default=256,
+                         help="Size limit of the geometry cache file (MB)")
+        pars.add_argument("--time_budget", type=float, default=0.0,
+                         help="Seconds after which evaluation stops and the objects found so far are selected, 0 for no limit")
+
+    def load_raw(self):
+        self.trace = Trace.from_options('select_by_path', self.options.trace)
+        with self.trace.span('document_load'):
+            super().load_raw()
 
     def effect(self):
         if not self.options.log_errors:
             set_stdout('off')
             set_stderr('off')
 
-        if not self.svg.selected:
+        if self.options.debug:
+            from startup_report import import_time_report
+            inkex.utils.debug(import_time_report('select_by_path'))
+
+        # Every selected path is a lasso, together they select like one
+        # region, other selected objects are the selection to add to or
+        # subtract from
+        paths = [elem for elem in self.svg.selected if isinstance(elem, PathElement)]
+        if not paths:
             inkex.errormsg("No paths selected. Please select at least one path.")
             return
-        
-        path = self.svg.selected.pop()
+        for path in paths:
+            error = self.lasso_error(path)
+            if error:
+                inkex.errormsg(error)
+                return
+        self.lasso_ids = [path.get('id') for path in paths]
+        for path in paths:
+            self.svg.selected.pop(path)
 
-        if not isinstance(path, PathElement):
-            inkex.errormsg("Selected object is not a path. Please select a path.")
-            return
-        # check if the path is closed by z command in d
-        d = path.get('d', '').strip()
-        # count m and z commands
-        m_count = d.lower().count('m')
-        z_count = d.lower().count('z')
-        is_closed = z_count > 0 and (m_count == z_count)
-        if not is_closed and self.options.method == 'enclosed':
-            inkex.errormsg("Selected path must be closed for enclosed selection method.")
+        # Lassos and objects are compared in document coordinates
+        self.transform_cache = {}
+        self.outline_cache = {}
+        self.source_bboxes = {}
+        if self.options.geometry_cache:
+            self.geometry_cache = GeometryCache(max_bytes=self.options.geometry_cache_mb * 2**20,
+                                                scale=self.svg.scale)
+        self.unevaluated = 0
+        if self.options.time_budget > 0:
+            self.deadline = time.perf_counter() + self.options.time_budget
+        lassos = [self.lasso_curve(path, self.parent_transform(path, self.transform_cache)) for path in paths]
+
+        curve = BezierPath.concatenate(lasso_curve for lasso_curve, rule in lassos)
+
+        # Walk the scope once, gathering candidates with their bounding boxes
+        roots = self.scope_roots(paths)
+        inkex.utils.debug(f"Scope roots: {[root.get('id') for root in roots]}")
+        with self.trace.span('candidates', roots=len(roots)) as span:
+            candidates, bboxes, transforms = self.collect_candidates(roots, self.lasso_region(curve), curve)
+            inkex.utils.debug(f"Candidates: {[obj.get('id') for obj in candidates]}")
+            span.set(candidates=len(candidates))
+
+        # Check each object against the path
+        if self.options.method == 'touching':
+            # Find touching paths
+            selected = self.touching_objects(curve, candidates, bboxes, transforms)
+        elif self.options.method == 'enclosed':
+            # Find enclosed paths
+            selected = self.enclosed_objects(lassos, candidates, bboxes, transforms)
+        else:
             return
-        # error if muliple m or z
-        if m_count > 1 or z_count > 1:
-            inkex.errormsg("Selected path has multiple 'm' or 'z' commands. Please select a valid path.")
+        if self.unevaluated:
+            inkex.errormsg(f"Time budget of {self.options.time_budget:g} s reached, "
+                           f"{self.unevaluated} objects were not evaluated.")
+        self.save_geometry_cache()
+        # Process results based on selection mode
+        self.process_results(selected)
+
+    def save_geometry_cache(self):
+        """Write new entries of the geometry cache, a failure only costs the next run its hits"""
+        if self.geometry_cache is None:
             return
+        with self.trace.span('geometry_cache', hits=self.geometry_cache.hits,
+                             misses=self.geometry_cache.misses) as span:
+            try:
+                self.geometry_cache.save()
+            except OSError as error:
+                inkex.errormsg(f"Could not write geometry cache: {error}")
+            span.set(entries=len(self.geometry_cache.rows))
+
+    def lasso_error(self, path):
+        """Reason why path cannot be used as a lasso, None if it can"""
+        if not isinstance(path, PathElement):
+            return "Selected object is not a path. Please select a path."
+        if self.options.method == 'enclosed' and self.open_subpaths(path):
+            return f"Selected path {path.get('id')} must be closed for enclosed selection method."
+        return None
+
+    def open_subpaths(self, path):
+        """Number of subpaths that neither end with z nor end where they start"""
+        count = 0
+        first = prev = start = None
+        drawing = closed = False
+        for segment in path.path.to_absolute():
+            if isinstance(segment, inkex.paths.Move):
+                if drawing and not closed and abs(prev - start) > 1e-9:
+                    count += 1
+                first = start = prev = segment.end_point(first, prev)
+                drawing = closed = False
+                continue
+            if closed:
+                # Drawing on after z starts a new subpath at the same point
+                closed = False
+                start = prev
+            end = segment.end_point(first, prev)
+            closed = isinstance(segment, inkex.paths.ZoneClose)
+            drawing = True
+            prev = end
+        if drawing and not closed and abs(prev - start) > 1e-9:
+            count += 1
+        return count
 
-        csp = path.path.to_superpath()
-        if path.transform:
-            csp = csp.transform(path.transform)
-        # Flatten to numpy arrays: [control_points][x,y][t]
-        curve = self.csp_to_bezier(csp)
+    def lasso_rule(self, path):
+        """Fill rule deciding what is inside a lasso, SVG's default nonzero unless the path sets evenodd"""
+        rule = path.style.get('fill-rule') or path.get('fill-rule')
+        return 'evenodd' if rule == 'evenodd' else 'nonzero'
 
-        layer_label = path.getparent().get('inkscape:label')
+    def lasso_curve(self, path, transform):
+        """Bézier segments of all subpaths of a lasso in document coordinates and its fill rule
 
-        # Make list of all objects types that can be selected
-        checked_objects = ['path', 'rect', 'circle', 'ellipse', 'polygon', 'polyline', 'line', 'text', 'image', 'use']
+        transform is the composed transform of the path's parent.
+        """
+        csp = path.path.to_superpath().transform(transform @ path.transform)
+        return self.csp_to_bezier(csp), self.lasso_rule(path)
 
-        # Add group objects if a option is selected
+    def selectable_tags(self):
+        """Tag names of the layer children that are tested against the lasso"""
         if self.options.t_include_groups or self.options.e_include_groups:
-            checked_objects.append('g')
+            return SELECTABLE_TAGS + ('g',)
+        return SELECTABLE_TAGS
 
-        # Make inclue_xpath of all object types
-        include_xpath = '|self::svg:'.join(checked_objects)
-        include_xpath = f'self::svg:{include_xpath}'
-        
-        # Get all objects in the current layer
-        xpath = f'//svg:g[@inkscape:label="{layer_label}"]/*[{include_xpath}]'
-        inkex.utils.debug(f"XPath: {xpath}")
+    def hidden(self, obj):
+        """Whether obj is not displayed by its own style or display attribute"""
+        attrib = obj.attrib
+        return attrib.get('display') == 'none' or DISPLAY_NONE.search(attrib.get('style', '')) is not None
 
-        objects = self.svg.xpath(xpath, namespaces=inkex.NSS)
-        inkex.utils.debug(f"Layer objects: {[obj.get('id') for obj in objects]}")
-        # Check each object against the path
+    def include_hidden(self):
+        """Whether hidden and locked objects may be selected, by the method's option"""
+        if self.options.method == 'touching':
+            return self.options.t_include_hidden
+        return self.options.e_include_hidden
+
+    def selectable(self, obj):
+        """Whether obj may be selected, hidden and locked objects only on request"""
+        if not self.include_hidden():
+            if self.hidden(obj):
+                return False
+            if obj.get('sodipodi:insensitive') == 'true':
+                return False
+        return True
+
+    def scope_roots(self, paths):
+        """Elements whose contents are tested against the lassos, by the scope option"""
+        scope = self.options.scope
+        if scope == 'document':
+            return [self.svg]
+        if scope == 'all_layers':
+            roots = self.svg.xpath('//svg:g[@inkscape:groupmode="layer"]')
+        else:
+            roots = list(dict.fromkeys(path.getparent() for path in paths))
+        if scope != 'layer':
+            # Nested layers are walked with their ancestors
+            nested = set(roots)
+            roots = [root for root in roots if not any(parent in nested for parent in root.iterancestors())]
+        if scope == 'all_layers':
+            roots = [root for root in roots if self.selectable(root)]
+        return roots
 
+    def lasso_region(self, curve):
+        """Box (left, top, right, bottom) that every object the lassos can select overlaps"""
+        margin = 0.0
         if self.options.method == 'touching':
-            # Find touching paths
-            touching_objects = []
-            for obj in objects:
-                if not self.options.t_include_hidden:
-                    if obj.get('style', '').find('display:none') != -1:
-                        continue
-                    if obj.get('sodipodi:insensitive') == 'true':
-                        continue
-                # if isinstance(obj, PathElement):
-                #     csp2 = obj.path.to_superpath()
-                #     curve2 = self.csp_to_bezier(csp2)
-                #     intersections = self.find_intersections(curve, curve2, tol=self.options.t_bezier_tolerance, max_iter=20)
-                #     if intersections:
-                #         touching_objects.append(obj)
+            margin = self.options.t_selection_tolerance
+            if self.options.t_criteria == 'geometry_cross':
+                margin += self.options.flatness
+        return self.curve_bbox(curve) + np.array([-margin, -margin, margin, margin])
+
+    def collect_candidates(self, roots, region=None, curve=None):
+        """Selectable objects below roots, their (objects, 4) bounding box array and composed parent transforms
+
+        Only the children of the roots are tested in the layer scope, other
+        scopes walk the whole subtrees. Under a time budget the children,
+        and the contents of sublayers with them, are collected nearest to
+        curve first for a share of the time left. Objects not reached by
+        then are counted in unevaluated and left out. The candidates are
+        returned in document order.
+        """
+        found = ([], [], [])
+        tags = {inkex.addNS(tag, 'svg') for tag in self.selectable_tags()}
+        units = []
+        for root in roots:
+            if root is self.svg:
+                transform = Transform()
+            else:
+                transform = self.parent_transform(root, self.transform_cache) @ root.transform
+            for child in root:
+                self.add_unit(child, transform, units)
+        if self.deadline is None or curve is None:
+            order = range(len(units))
+        else:
+            order = self.nearest_first(curve, units)
+        collected = []
+        collect_deadline = None
+        if self.deadline is not None:
+            now = time.perf_counter()
+            collect_deadline = now + max(0.0, self.deadline - now) * BUDGET_COLLECT_SHARE
+        for i, unit in enumerate(order):
+            if collect_deadline is not None and time.perf_counter() >= collect_deadline:
+                self.unevaluated += sum(self.subtree_candidates(units[rest][0], tags) for rest in order[i:])
+                break
+            start = len(found[0])
+            self.collect_subtree(*units[unit], tags, region, found)
+            collected.append((unit, start, len(found[0])))
+        if self.deadline is not None:
+            positions = [i for dummy, start, end in sorted(collected) for i in range(start, end)]
+            found = tuple([items[i] for i in positions] for items in found)
+        candidates, boxes, transforms = found
+        bboxes = np.full((len(candidates), 4), np.nan, dtype=np.float64)
+        for i, bbox in enumerate(boxes):
+            if bbox is not None:
+                bboxes[i] = (bbox.left, bbox.top, bbox.right, bbox.bottom)
+        return candidates, bboxes, transforms
+
+    def add_unit(self, elem, transform, units):
+        """Add elem with its parent's composed transform to the units collected one at a time
+
+        Under a time budget the recursive scopes add the contents of
+        selectable sublayers in their place, layers are never candidates.
+        """
+        if (self.deadline is not None and self.options.scope != 'layer' and isinstance(elem, Group)
+                and elem.get('inkscape:groupmode') == 'layer' and self.selectable(elem)):
+            transform = transform @ elem.transform
+            for child in elem:
+                self.add_unit(child, transform, units)
+        else:
+            units.append((elem, transform))
+
+    def subtree_candidates(self, elem, tags):
+        """Number of objects with a selectable tag collect_subtree can find below elem, elem included"""
+        if self.options.scope == 'layer' or elem.tag not in CONTAINER_TAGS:
+            return int(elem.tag in tags)
+        return sum(1 for dummy in elem.iter(*tags))
+
+    def anchor_point(self, elem):
+        """Rough position of elem in its parent's coordinates, of its first shape for containers
+
+        Read off the raw attributes without computing any geometry: the
+        start of the path data or points, or the position attributes.
+        None when no position is found.
+        """
+        attrib = elem.attrib
+        point = None
+        if elem.tag in CONTAINER_TAGS:
+            for child in elem:
+                point = self.anchor_point(child)
+                if point is not None:
+                    break
+        else:
+            value = attrib.get('d', attrib.get('points'))
+            if value is not None:
+                numbers = ANCHOR_NUMBER.findall(value[:100])
+                point = (float(numbers[0]), float(numbers[1])) if len(numbers) >= 2 else None
+            else:
+                for x_name, y_name in ANCHOR_ATTRIBUTES:
+                    if x_name in attrib or y_name in attrib:
+                        x, y = (ANCHOR_NUMBER.match(attrib.get(name, '0').strip()) for name in (x_name, y_name))
+                        point = (float(x.group()), float(y.group())) if x and y else None
+                        break
+        if point is not None and 'transform' in attrib:
+            point = tuple(Transform(attrib['transform']).apply_to_point(point))
+        return point
+
+    def nearest_first(self, curve, units):
+        """Indices of the (element, parent transform) units by the lasso_distances of their anchor_point
+
+        The nearest come first, units without a position last.
+        """
+        points = np.full((len(units), 2), np.nan)
+        shared = {}
+        for i, (elem, transform) in enumerate(units):
+            point = self.anchor_point(elem) if isinstance(elem, ShapeElement) else None
+            if point is not None:
+                points[i] = point
+            shared.setdefault(id(transform), (transform, []))[1].append(i)
+        # Units mostly share their parent's transform, apply each one at once
+        for transform, indices in shared.values():
+            matrix = np.array(transform.matrix)
+            points[indices] = points[indices] @ matrix[:, :2].T + matrix[:, 2]
+        # NaN distances sort last
+        return np.argsort(self.lasso_distances(curve, np.hstack((points, points))), kind='stable').tolist()
+
+    def collect_subtree(self, elem, transform, tags, region, found, need_visible=False):
+        """Add elem and the selectable objects below it to found, a (candidates, bboxes, transforms) triple of lists
+
+        transform is the composed transform of elem's parent. Subtrees that
+        are hidden or locked are skipped unless hidden objects are included.
+        Group boxes are built bottom-up from their children's, and groups
+        whose contents miss region are dropped again with everything below.
+        With the geometry cache, a group whose stored box misses region is
+        dropped before its contents are measured.
+        Returns the box around all objects found below elem, kept or not,
+        and, when need_visible is set because a group above is a candidate,
+        the visible bounding box of elem.
+        """
+        if not isinstance(elem, ShapeElement):
+            return None, None
+        if not self.selectable(elem):
+            if not need_visible or self.hidden(elem):
+                return None, None
+            # Locked objects are not candidates but still make up their group's box
+            return None, self.element_bbox(elem, transform)
+        candidates, bboxes, transforms = found
+        if self.options.scope == 'layer' or elem.tag not in CONTAINER_TAGS:
+            if elem.tag not in tags:
+                return None, None
+            bbox = self.element_bbox(elem, transform)
+            candidates.append(elem)
+            bboxes.append(bbox)
+            transforms.append(transform)
+            return bbox, None if self.hidden(elem) else bbox
+
+        group_key = None
+        if self.geometry_cache is not None and region is not None and not need_visible:
+            group_key = self.geometry_cache.group_key(elem, Transform(transform),
+                                                      (self.include_hidden(), sorted(tags)))
+            if group_key is not None:
+                found_box, box = self.geometry_cache.bbox(group_key)
+                if found_box and (box is None or box[2] < region[0] or box[0] > region[2]
+                                  or box[3] < region[1] or box[1] > region[3]):
+                    return None, None
+        start = len(candidates)
+        # Sublayers are walked into but never selected themselves
+        is_candidate = elem.tag in tags and elem.get('inkscape:groupmode') != 'layer'
+        need_visible = need_visible or is_candidate
+        if is_candidate:
+            candidates.append(elem)
+            bboxes.append(None)
+            transforms.append(transform)
+        inner = transform @ elem.transform
+        extent = visible = None
+        for child in elem:
+            child_extent, child_visible = self.collect_subtree(child, inner, tags, region, found, need_visible)
+            if child_extent is not None:
+                extent = child_extent if extent is None else extent + child_extent
+            if child_visible is not None:
+                visible = child_visible if visible is None else visible + child_visible
+        if need_visible and visible is not None and elem.clip is not None:
+            visible = visible & elem.clip.bounding_box(inner)
+        if is_candidate:
+            bboxes[start] = visible
+            if visible is not None:
+                extent = visible if extent is None else extent + visible
+        if group_key is not None:
+            self.geometry_cache.set_bbox(group_key, None if extent is None else
+                                         (extent.left, extent.top, extent.right, extent.bottom))
+        if region is not None and (extent is None or extent.right < region[0] or extent.left > region[2]
+                                   or extent.bottom < region[1] or extent.top > region[3]):
+            del candidates[start:], bboxes[start:], transforms[start:]
+        return extent, None if self.hidden(elem) else visible
+
+    def touching_objects(self, curve, candidates, bboxes, transforms=None):
+        """Candidates touched by the path curve, in document order
+
+        transforms are the composed parent transforms of the candidates,
+        looked up from their parents when not given.
+        """
+        tol = self.options.t_selection_tolerance
+        hits = np.zeros(len(candidates), dtype=bool)
+        if self.options.t_criteria == 'geometry_cross':
+            # An outline lies within its bounding box, so only objects
+            # whose box the path crosses need the exact intersection test
+            flatness = self.options.flatness
+            with self.trace.span('flatten') as span:
+                segments = self.flatten_curve(curve, flatness)
+                span.set(segments=len(segments))
+            with self.trace.span('geometry', candidates=len(candidates)) as span:
+                near = BBoxGrid(bboxes).query_segments(segments, tol + flatness)
+                near = near[self.segments_cross_bboxes(segments, bboxes[near], tol=tol + flatness)]
+                if transforms is None:
+                    transforms = [self.parent_transform(obj, self.transform_cache) for obj in candidates]
+
+                def crossed(part):
+                    outlines = [self.object_curve(candidates[i], transforms[i]) for i in near[part]]
+                    # Objects without an outline fall back to bounding_box_cross
+                    has_outline = np.array([outline is not None for outline in outlines], dtype=bool)
+                    crossing = np.ones(len(part), dtype=bool)
+                    outlines = [outline for outline in outlines if outline is not None]
+                    cost = len(curve) * sum(len(outline) for outline in outlines) * BEZIER_PAIR_COST
+                    crossing[has_outline] = self.evaluate(
+                        'outlines_intersect', 'outlines', outlines, cost,
+                        curve=curve, tol=tol, eps=self.options.t_bezier_tolerance)
+                    return crossing
+
+                hits[near] = self.within_budget(curve, bboxes[near], crossed)
+                span.set(near=len(near), hits=int(hits.sum()), unevaluated=self.unevaluated)
+        elif self.options.flatten == 'fixed':
+            # Sample the whole path once and test it against the bounding
+            # boxes of objects found near the samples in the grid index
+            with self.trace.span('flatten') as span:
+                samples = self.sample_curve(curve, self.options.sample_points)
+                span.set(samples=len(samples))
+            with self.trace.span('geometry', candidates=len(candidates)) as span:
+                near = np.zeros(0, dtype=int)
                 if self.options.t_criteria == 'bounding_box_cross':
-                    intersected = self.bezier_passes_trough_objects_bbox(curve, obj, tol=self.options.t_selection_tolerance, samples=self.options.sample_points)
-                    if intersected:
-                        touching_objects.append(obj)
+                    near = BBoxGrid(bboxes).query_points(samples, tol)
+                    hits[near] = self.within_budget(curve, bboxes[near], lambda part: self.evaluate(
+                        'points_in_bboxes', 'bboxes', bboxes[near[part]], len(samples) * len(part),
+                        points=samples, tol=tol))
                 elif self.options.t_criteria == 'bounding_box_center':
-                    intersected = self.bezier_passes_near_objects_bbox_center(curve, obj, tol=self.options.t_selection_tolerance, samples=self.options.sample_points)
-                    if intersected:
-                        touching_objects.append(obj)
-            # Process results based on selection mode
-            self.process_results(touching_objects)
-        elif self.options.method == 'enclosed':
-            # Check if the path is closed
-            if not is_closed:
-                inkex.errormsg("Selected path must be closed for enclosed selection method.")
-                return
-            # Find enclosed paths
-            enclosed_objects = []
-            for obj in objects:                
-                if not self.options.e_include_hidden:
-                    if obj.get('style', '').find('display:none') != -1:
-                        continue
-                    if obj.get('sodipodi:insensitive') == 'true':
-                        continue
-
-                if self.options.e_criteria == 'bounding_box_center':
-                    center = obj.bounding_box().center
-                    if self.point_enclosed_by_path(center, curve):
-                        enclosed_objects.append(obj)
-                elif self.options.e_criteria == 'all_points' or self.options.e_criteria == 'any_point':
-                    bbox = obj.bounding_box()
-                    bbox_points = [
-                        (bbox.left, bbox.top), # Top-left
-                        (bbox.right, bbox.top), # Top-right
-                        (bbox.right, bbox.bottom), # Bottom-right
-                        (bbox.left, bbox.bottom) # Bottom-left
-                    ]
+                    centers = self.bbox_centers(bboxes)
+                    near = BBoxGrid(np.hstack((centers, centers))).query_points(samples, tol)
+                    hits[near] = self.within_budget(curve, np.hstack((centers[near], centers[near])), lambda part: self.evaluate(
+                        'points_near_points', 'targets', centers[near[part]], len(samples) * len(part),
+                        points=samples, tol=tol))
+                span.set(near=len(near), hits=int(hits.sum()), unevaluated=self.unevaluated)
+        else:
+            # Flatten the path to a polyline within the flatness tolerance
+            # and test its segments exactly
+            with self.trace.span('flatten') as span:
+                segments = self.flatten_curve(curve, self.options.flatness)
+                span.set(segments=len(segments))
+            with self.trace.span('geometry', candidates=len(candidates)) as span:
+                near = np.zeros(0, dtype=int)
+                if self.options.t_criteria == 'bounding_box_cross':
+                    near = BBoxGrid(bboxes).query_segments(segments, tol)
+                    hits[near] = self.within_budget(curve, bboxes[near], lambda part: self.evaluate(
+                        'segments_cross_bboxes', 'bboxes', bboxes[near[part]], len(segments) * len(part),
+                        segments=segments, tol=tol))
+                elif self.options.t_criteria == 'bounding_box_center':
+                    centers = self.bbox_centers(bboxes)
+                    near = BBoxGrid(np.hstack((centers, centers))).query_segments(segments, tol)
+                    hits[near] = self.within_budget(curve, np.hstack((centers[near], centers[near])), lambda part: self.evaluate(
+                        'segments_near_points', 'targets', centers[near[part]], len(segments) * len(part),
+                        segments=segments, tol=tol))
+                span.set(near=len(near), hits=int(hits.sum()), unevaluated=self.unevaluated)
+        return [obj for obj, hit in zip(candidates, hits) if hit]
+
+    def enclosed_objects(self, lassos, candidates, bboxes, transforms=None):
+        """Candidates enclosed by any of the lassos, (curve, fill rule) pairs, in document order
+
+        transforms are the composed parent transforms of the candidates,
+        looked up from their parents when not given.
+        """
+        # Flatten each lasso to polygons once and test the points of all
+        # nearby objects against all of them in one go
+        with self.trace.span('flatten', lassos=len(lassos)) as span:
+            edges, groups = [], []
+            for group, (lasso_curve, rule) in enumerate(lassos):
+                lasso_edges = self.polygon_edges(self.flatten_curve(lasso_curve, self.options.flatness))
+                edges.append(lasso_edges)
+                groups.append(np.full(len(lasso_edges), group))
+            edges = np.concatenate(edges)
+            groups = np.concatenate(groups)
+            rules = [rule for lasso_curve, rule in lassos]
+            curve = BezierPath.concatenate(lasso_curve for lasso_curve, rule in lassos)
+            span.set(segments=len(edges))
+
+        with self.trace.span('geometry', candidates=len(candidates)) as span:
+            # Only objects overlapping the path bounding box can be enclosed
+            path_bbox = self.curve_bbox(curve)
+            if self.options.e_criteria == 'bounding_box_center':
+                centers = self.bbox_centers(bboxes)
+                near = BBoxGrid(np.hstack((centers, centers))).query_rect(path_bbox)
+            else:
+                near = BBoxGrid(bboxes).query_rect(path_bbox)
+
+            if self.options.e_criteria == 'bounding_box_center':
+                inside = self.within_budget(curve, np.hstack((centers[near], centers[near])), lambda part: self.evaluate(
+                    'points_in_polygon', 'points', centers[near[part]], len(edges) * len(part),
+                    edges=edges, rule=rules, groups=groups))
+            elif self.options.e_criteria == 'all_points' or self.options.e_criteria == 'any_point':
+                def corners_inside(part):
+                    corners = self.bbox_corners(bboxes[near[part]])
+                    inside = self.evaluate('points_in_polygon', 'points', corners.reshape(-1, 2),
+                                           len(edges) * len(corners) * 4,
+                                           edges=edges, rule=rules, groups=groups).reshape(-1, 4)
                     if self.options.e_criteria == 'all_points':
-                        all_inside = all(self.point_enclosed_by_path(pt, curve) for pt in bbox_points)
-                        if all_inside:
-                            enclosed_objects.append(obj)
-                    else:  # any_point
-                        any_inside = any(self.point_enclosed_by_path(pt, curve) for pt in bbox_points)
-                        if any_inside:
-                            enclosed_objects.append(obj)
-            # Process results based on selection mode
-            self.process_results(enclosed_objects)
+                        return inside.all(axis=1)
+                    return inside.any(axis=1)  # any_point
+
+                inside = self.within_budget(curve, bboxes[near], corners_inside)
+            elif self.options.e_criteria == 'geometry_inside':
+                if transforms is None:
+                    transforms = [self.parent_transform(obj, self.transform_cache) for obj in candidates]
+                inside = self.within_budget(curve, bboxes[near], lambda part: self.outlines_enclosed(
+                    [candidates[i] for i in near[part]], [transforms[i] for i in near[part]],
+                    bboxes[near[part]], edges, rules, groups))
+            else:
+                inside = np.zeros(len(near), dtype=bool)
+            span.set(near=len(near), hits=int(inside.sum()), unevaluated=self.unevaluated)
+        return [candidates[i] for i in near[inside]]
+
+    def outlines_enclosed(self, objects, transforms, bboxes, edges, rules, groups):
+        """Whether the flattened outline of each object lies within the lasso edges without crossing them
+
+        All outline vertices are tested first, the segments of the outlines
+        that pass are then tested against the edges. Objects without an
+        outline need all four bounding box corners inside instead.
+        """
+        outlines = [self.outline_segments(obj, transform) for obj, transform in zip(objects, transforms)]
+        has_outline = np.array([outline is not None for outline in outlines], dtype=bool)
+        inside = np.zeros(len(objects), dtype=bool)
+        corners = self.bbox_corners(bboxes[~has_outline])
+        inside[~has_outline] = self.evaluate('points_in_polygon', 'points', corners.reshape(-1, 2),
+                                             len(edges) * len(corners) * 4,
+                                             edges=edges, rule=rules, groups=groups).reshape(-1, 4).all(axis=1)
+        outlines = [outline for outline in outlines if outline is not None]
+        if not outlines:
+            return inside
+        sizes = np.array([len(outline) for outline in outlines])
+        offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        segments = np.concatenate(outlines)
+        # Both ends of every segment, so open outlines keep their last point
+        vertices = self.evaluate('points_in_polygon', 'points', segments.reshape(-1, 2), len(edges) * len(segments) * 2,
+                                 edges=edges, rule=rules, groups=groups).reshape(-1, 2).all(axis=1)
+        enclosed = np.logical_and.reduceat(vertices, offsets)
+        candidates = np.flatnonzero(enclosed)
+        if len(candidates):
+            owner = np.repeat(np.arange(len(outlines)), sizes)
+            tested = np.isin(owner, candidates)
+            crossing = np.zeros(len(segments), dtype=bool)
+            crossing[tested] = self.evaluate('segments_cross_segments', 'targets', segments[tested],
+                                             len(edges) * int(tested.sum()), segments=edges)
+            enclosed &= ~np.logical_or.reduceat(crossing, offsets)
+        inside[has_outline] = enclosed
+        return inside
+
+    def within_budget(self, curve, bboxes, test):
+        """Results of test for the objects with bboxes, nearest to the path curve first until the deadline
+
+        test takes an index array into bboxes and returns a bool per index.
+        Without a time budget all objects are tested at once. Otherwise they
+        are tested in batches sized to fit the time left; objects left when
+        the deadline passes are not selected and counted in unevaluated.
+        The first batch is tested even after the deadline, so objects whose
+        boxes were collected in time still give a result.
+        """
+        if self.deadline is None:
+            return test(np.arange(len(bboxes)))
+        order = np.argsort(self.lasso_distances(curve, bboxes), kind='stable')
+        results = np.zeros(len(bboxes), dtype=bool)
+        done, batch = 0, BUDGET_FIRST_BATCH
+        while done < len(order) and not (done and self.past_deadline()):
+            part = order[done:done + batch]
+            start = time.perf_counter()
+            results[part] = test(part)
+            done += len(part)
+            now = time.perf_counter()
+            # Grow by at most four times, rates measured on small batches are rough
+            batch = int(np.clip(len(part) * (self.deadline - now) / max(now - start, 1e-6), 1, 4 * len(part)))
+        self.unevaluated += len(order) - done
+        return results
+
+    def past_deadline(self):
+        """Whether the time budget is used up"""
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def lasso_distances(self, curve, bboxes):
+        """Coarse distance of each box to what the lassos select: their curve, or their inside in the enclosed method
+
+        In the enclosed method boxes centred inside the flattened curve are
+        at distance 0, the objects far from the curve are the ones to test.
+        """
+        distances = self.curve_distances(curve, bboxes)
+        if self.options.method == 'enclosed' and len(curve.segments):
+            box = self.curve_bbox(curve)
+            flatness = max(self.options.flatness, BUDGET_ORDER_FLATNESS * np.hypot(box[2] - box[0], box[3] - box[1]))
+            edges = self.polygon_edges(self.flatten_curve(curve, flatness))
+            centers = self.bbox_centers(bboxes)
+            known = np.flatnonzero(~np.isnan(centers).any(axis=1))
+            distances[known[self.points_in_polygon(centers[known], edges, 'nonzero')]] = 0
+        return distances
+
+    def curve_distances(self, curve, bboxes):
+        """Coarse distance of each box to the path curve, its gap to the nearest segment's control point box"""
+        segment_bboxes = curve.bboxes()
+        distances = np.full(len(bboxes), np.inf)
+        if not len(segment_bboxes):
+            return distances
+        step = max(1, BROADCAST_CHUNK // len(segment_bboxes))
+        for start in range(0, len(bboxes), step):
+            b = bboxes[start:start + step, None, :]
+            dx = np.maximum(0, np.maximum(segment_bboxes[:, 0] - b[..., 2], b[..., 0] - segment_bboxes[:, 2]))
+            dy = np.maximum(0, np.maximum(segment_bboxes[:, 1] - b[..., 3], b[..., 1] - segment_bboxes[:, 3]))
+            distances[start:start + step] = np.hypot(dx, dy).min(axis=1)
+        return distances
+
+    def evaluate(self, method, items_arg, items, cost, **kwargs):
+        """Run a geometry test on items, passed to method as items_arg, with the lasso in kwargs
+
+        Tests estimated to take fewer than parallel_threshold segment/object
+        tests run serially. Larger ones are split into contiguous chunks
+        evaluated in a process pool, each worker receives kwargs only once.
+        Chunk results are joined in order, so hits keep document order.
+        """
+        workers = self.options.workers
+        if workers <= 0:
+            workers = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+        if workers < 2 or len(items) < 2 or cost < self.options.parallel_threshold:
+            return getattr(self, method)(**{items_arg: items}, **kwargs)
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        # A few chunks per worker even out chunks of uneven cost
+        bounds = np.linspace(0, len(items), min(len(items), workers * 4) + 1).astype(int)
+        chunks = [items[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+        with ProcessPoolExecutor(min(workers, len(chunks)), initializer=init_worker,
+                                 initargs=(method, items_arg, kwargs)) as pool:
+            return np.concatenate(list(pool.map(run_chunk, chunks)))
 
     def csp_to_bezier(self, csp):
         """Convert Inkscape's CubicSuperPath to 4-point Bézier segments"""
-        bezier_segments = []
-        for subpath in csp:
-            for i in range(len(subpath)-1):
-                x0, y0 = subpath[i][1]  # Start point
-                x1, y1 = subpath[i][2]  # First control point
-                x2, y2 = subpath[i+1][0]  # Second control point
-                x3, y3 = subpath[i+1][1]  # End point
-                bezier_segments.append(np.array([[x0,y0], [x1,y1], [x2,y2], [x3,y3]]))
-        return bezier_segments
+        return BezierPath.from_superpath(csp)
 
     def bezier_point(self, curve, t):
-        """Evaluate a cubic Bézier at parameter t"""
-        mt = 1 - t
-        return (mt**3 * curve[0] + 3 * mt**2 * t * curve[1] 
-                + 3 * mt * t**2 * curve[2] + t**3 * curve[3])
+        """Evaluate a cubic Bézier at parameter t, or at each of an array of them"""
+        points = BezierPath(curve).points(t)[0]
+        return points if np.ndim(t) else points[0]
 
     def bezier_derivative(self, curve, t):
-        """First derivative of cubic Bézier at t"""
-        mt = 1 - t
-        return (3 * mt**2 * (curve[1] - curve[0]) 
-                + 6 * mt * t * (curve[2] - curve[1]) 
-                + 3 * t**2 * (curve[3] - curve[2]))
+        """First derivative of cubic Bézier at t, or at each of an array of them"""
+        derivatives = BezierPath(curve).derivatives(t)[0]
+        return derivatives if np.ndim(t) else derivatives[0]
+
+    def curves_intersect(self, curves1, curves2, tol=0.0, eps=1e-6):
+        """Check if two Bézier curves come within tol of each other"""
+        i, dummy, dummy, dummy = self.subdivide_intersections(curves1, curves2, tol=tol, eps=eps, first=True)
+        return len(i) > 0
+
+    def intersection_parameters(self, curves1, curves2, tol=1e-6, max_iter=20):
+        """Intersections of two Bézier curves as (i, j, t, s) arrays, segment curves1[i] at t meets curves2[j] at s
+
+        Segment pairs are subdivided while their control point boxes
+        overlap, until both are smaller than tol. With max_iter > 0 the
+        pairs are subdivided to a coarser size only and polished with
+        Newton-Raphson instead. Intersections closer than that size are
+        merged.
+        """
+        tol = max(tol, 1e-12)
+        coarse = max(tol, 1e-3) if max_iter > 0 else tol
+        i, j, t1, t2 = self.subdivide_intersections(curves1, curves2, eps=coarse)
+        if not len(i):
+            return i, j, np.empty(0), np.empty(0)
+        seg1 = np.asarray(curves1, dtype=np.float64).reshape(-1, 4, 2)[i]
+        seg2 = np.asarray(curves2, dtype=np.float64).reshape(-1, 4, 2)[j]
+        # Start from the centers of the subdivided pieces
+        t, s = t1.mean(axis=1), t2.mean(axis=1)
+        if max_iter > 0:
+            t, s = self.newton_polish(seg1, seg2, t, s, tol, max_iter)
+        keep = self.distinct_points(BezierPath(seg1).points_at(t), 2 * coarse)
+        return i[keep], j[keep], t[keep], s[keep]
 
     def find_intersections(self, curves1, curves2, tol=1e-6, max_iter=20):
-        """Newton-Raphson intersection finder"""
-        intersections = []
-        
-        # Check all segment pairs
-        for seg1 in curves1:
-            for seg2 in curves2:
-                # Initial guesses (could be improved with bounding box checks)
-                for t0 in np.linspace(0.1, 0.9, 3):
-                    for s0 in np.linspace(0.1, 0.9, 3):
-                        t, s = t0, s0
-                        
-                        for _ in range(max_iter):
-                            # Current points
-                            p1 = self.bezier_point(seg1, t)
-                            p2 = self.bezier_point(seg2, s)
-                            
-                            # Function value
-                            f = p1 - p2
-                            
-                            if np.linalg.norm(f) < tol:
-                                intersections.append((float(p1[0]), float(p1[1])))
-                                break
-                            
-                            # Jacobian matrix
-                            J11 = self.bezier_derivative(seg1, t)
-                            J12 = -self.bezier_derivative(seg2, s)
-                            J = np.column_stack((J11, J12))
-                            
-                            try:
-                                delta = np.linalg.solve(J, f)
-                            except np.linalg.LinAlgError:
-                                break
-                            
-                            t -= delta[0]
-                            s -= delta[1]
-                            
-                            # Clamp to [0,1]
-                            t = np.clip(t, 0, 1)
-                            s = np.clip(s, 0, 1)
-        
-        # Merge nearby points
-        unique_points = []
-        for pt in intersections:
-            if not any(np.linalg.norm(np.array(pt) - np.array(up)) < tol for up in unique_points):
-                unique_points.append(pt)
-        return unique_points
-
-    def point_enclosed_by_path(self, point, path, tol=1e-6):
-        """Check if a point is inside a path using ray-casting algorithm"""
-        x, y = point
-        ray = (x, y + 10000)
-        bezier_ray = self.line_to_bezier((point, ray))
-        intersections = self.find_intersections([bezier_ray], path, tol=tol, max_iter=20)
-        return len(intersections) % 2 == 1
-    
-    def line_to_bezier(self, line):
-        """Convert a line segment to a cubic Bézier curve with float64 control points"""
-        p1, p2 = line
-        return np.array([[p1[0], p1[1]], [p1[0], p1[1]], [p2[0], p2[1]], [p2[0], p2[1]]], dtype=np.float64)
-                
+        """Intersection points (x, y) of two Bézier curves, see intersection_parameters"""
+        i, dummy, t, dummy = self.intersection_parameters(curves1, curves2, tol, max_iter)
+        points = BezierPath(np.asarray(curves1, dtype=np.float64).reshape(-1, 4, 2)[i]).points_at(t)
+        return [(float(x), float(y)) for x, y in points]
+
+    def newton_polish(self, seg1, seg2, t, s, tol=1e-6, max_iter=20):
+        """Refine intersection parameters of (n, 4, 2) segment pairs with Newton-Raphson
+
+        Pairs that do not converge below tol keep their starting parameters.
+        """
+        curve1, curve2 = BezierPath(seg1), BezierPath(seg2)
+        t0, s0 = t.copy(), s.copy()
+        for dummy in range(max_iter):
+            f = curve1.points_at(t) - curve2.points_at(s)
+            d1 = curve1.derivatives_at(t)
+            d2 = -curve2.derivatives_at(s)
+            det = d1[:, 0] * d2[:, 1] - d2[:, 0] * d1[:, 1]
+            ok = np.abs(det) > 1e-12
+            safe = np.where(ok, det, 1.0)
+            dt = (f[:, 0] * d2[:, 1] - d2[:, 0] * f[:, 1]) / safe
+            ds = (d1[:, 0] * f[:, 1] - f[:, 0] * d1[:, 1]) / safe
+            t = np.clip(np.where(ok, t - dt, t), 0, 1)
+            s = np.clip(np.where(ok, s - ds, s), 0, 1)
+        residual = curve1.points_at(t) - curve2.points_at(s)
+        converged = np.hypot(residual[:, 0], residual[:, 1]) < tol
+        return np.where(converged, t, t0), np.where(converged, s, s0)
+
+    def distinct_points(self, points, distance):
+        """Indices of the points to keep so that no two kept points are closer than distance
+
+        Only kept points in neighbouring grid cells are compared.
+        """
+        cells = {}
+        keep = []
+        for index, point in enumerate(points):
+            cx, cy = np.floor(point / distance).astype(int)
+            near = (other for dx in (-1, 0, 1) for dy in (-1, 0, 1) for other in cells.get((cx + dx, cy + dy), ()))
+            if any(np.hypot(*(point - other)) < distance for other in near):
+                continue
+            cells.setdefault((cx, cy), []).append(point)
+            keep.append(index)
+        return np.array(keep, dtype=np.intp)
+
+    def outlines_intersect(self, curve, outlines, tol=0.0, eps=1e-6):
+        """Check curve against each outline, returns a boolean array"""
+        return np.array([self.curves_intersect(curve, outline, tol=tol, eps=eps) for outline in outlines], dtype=bool)
+
+    def subdivide_intersections(self, curves1, curves2, tol=0.0, eps=1e-6, first=False, max_depth=60):
+        """Recursive subdivision of all segment pairs with bounding box rejection
+
+        Pairs are dropped as soon as their control point boxes are more than
+        tol apart, and split in half while larger than eps or, with
+        tol, until both boxes fit within tol together. Returns
+        the segment indices into both curves of the remaining pieces and
+        their (start, end) parameter intervals on those segments. With
+        first=True it stops at the first converged pair.
+        """
+        empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty((0, 2)), np.empty((0, 2)))
+        if not len(curves1) or not len(curves2):
+            return empty
+        eps = max(eps, 1e-12)
+        a = np.asarray(curves1, dtype=np.float64).reshape(-1, 4, 2)
+        b = np.asarray(curves2, dtype=np.float64).reshape(-1, 4, 2)
+        # Initial pairs from all segment boxes that overlap
+        box_a, box_b = self.segment_bboxes(a), self.segment_bboxes(b)
+        i, j = np.nonzero((box_a[:, None, 0] <= box_b[None, :, 2] + tol)
+                          & (box_b[None, :, 0] <= box_a[:, None, 2] + tol)
+                          & (box_a[:, None, 1] <= box_b[None, :, 3] + tol)
+                          & (box_b[None, :, 1] <= box_a[:, None, 3] + tol))
+        seg1, seg2 = a[i], b[j]
+        t1 = np.tile([0.0, 1.0], (len(i), 1))
+        t2 = t1.copy()
+        converged = []
+        for depth in range(max_depth + 1):
+            box1, box2 = self.segment_bboxes(seg1), self.segment_bboxes(seg2)
+            # The gap between the boxes never exceeds the distance of the pieces
+            gap = np.maximum(0, np.maximum(box1[:, :2] - box2[:, 2:], box2[:, :2] - box1[:, 2:]))
+            keep = np.hypot(gap[:, 0], gap[:, 1]) <= tol
+            seg1, seg2, t1, t2, i, j = seg1[keep], seg2[keep], t1[keep], t2[keep], i[keep], j[keep]
+            box1, box2 = box1[keep], box2[keep]
+            size1 = (box1[:, 2:] - box1[:, :2]).max(axis=1)
+            size2 = (box2[:, 2:] - box2[:, :2]).max(axis=1)
+            done = (size1 <= eps) & (size2 <= eps)
+            if tol > 0:
+                # Pieces whose boxes together fit within tol are within tol
+                # of each other everywhere, no need to split them further
+                union = np.maximum(box1[:, 2:], box2[:, 2:]) - np.minimum(box1[:, :2], box2[:, :2])
+                done |= np.hypot(union[:, 0], union[:, 1]) <= tol
+            if depth == max_depth or len(seg1) > MAX_SUBDIVISION_PAIRS:
+                # Coincident curves, everything left counts as intersecting
+                done[:] = True
+            converged.append((i[done], j[done], t1[done], t2[done]))
+            if (first and done.any()) or done.all():
+                break
+            seg1, seg2, t1, t2, i, j = seg1[~done], seg2[~done], t1[~done], t2[~done], i[~done], j[~done]
+            split1, split2 = size1[~done] > eps, size2[~done] > eps
+            seg1, t1, order = self.split_pairs(seg1, t1, split1)
+            seg2, t2, split2 = seg2[order], t2[order], split2[order]
+            i, j = i[order], j[order]
+            seg2, t2, order = self.split_pairs(seg2, t2, split2)
+            seg1, t1, i, j = seg1[order], t1[order], i[order], j[order]
+        return tuple(np.concatenate(parts) for parts in zip(*converged))
+
+    def split_pairs(self, segments, intervals, split):
+        """Split the masked segments in half along with their parameter intervals
+
+        Returns the new segments and intervals, and the index of the
+        original pair for each of them so paired arrays can follow.
+        """
+        first, second = self.split_segments(segments[split])
+        whole = intervals[split]
+        mid = whole.mean(axis=1)
+        segments = np.concatenate((segments[~split], first, second))
+        intervals = np.concatenate((intervals[~split],
+                                    np.column_stack((whole[:, 0], mid)),
+                                    np.column_stack((mid, whole[:, 1]))))
+        order = np.concatenate((np.flatnonzero(~split), np.flatnonzero(split), np.flatnonzero(split)))
+        return segments, intervals, order
+
+    def split_segments(self, segments):
+        """Split (n, 4, 2) Bézier segments at t=0.5 using de Casteljau's algorithm"""
+        first, second = BezierPath(segments).split()
+        return first.segments, second.segments
+
+    def segment_bboxes(self, segments):
+        """Control point bounding boxes (left, top, right, bottom) of (n, 4, 2) segments"""
+        return BezierPath(segments).bboxes()
+
+    def object_curve(self, obj, transform=None):
+        """Outline of a shape or a clone of one as a BezierPath, None for other elements
+
+        The outline is in the coordinates of the parent, or mapped by
+        transform when given.
+        """
+        source, transform = self.outline_source(obj, transform)
+        if source is None:
+            return None
+        curve = self.local_curve(source)
+        if not len(curve):
+            return None
+        return curve.transform(transform)
+
+    def outline_segments(self, obj, transform=None):
+        """Outline of a shape or a clone of one flattened to (n, 2, 2) line segments, None for other elements
+
+        Outlines are flattened in the shape's own coordinates and cached for
+        the run in outline_cache, clones of a shape then only map the cached
+        polyline by their transform. The flatness is scaled down by the next
+        power of two above the transform's scale, so the mapped polyline is
+        still within flatness and clones of similar size share it. With the
+        geometry cache, outlines of shapes are also kept between runs.
+        """
+        source, outline_transform = self.outline_source(obj, transform)
+        if source is None:
+            return None
+        flatness = self.options.flatness
+        cache_key = None
+        if self.geometry_cache is not None and source is obj:
+            cache_key = self.geometry_cache.key(obj, Transform(transform))
+            segments = None if cache_key is None else self.geometry_cache.outline(cache_key, flatness)
+            if segments is not None:
+                return segments if len(segments) else None
+        matrix = np.array(outline_transform.matrix)
+        scale = np.linalg.norm(matrix[:, :2], 2)
+        level = int(np.ceil(np.log2(scale))) if scale > 0 else 0
+        key = (source, level)
+        if key not in self.outline_cache:
+            self.outline_cache[key] = self.flatten_curve(self.local_curve(source), flatness / 2.0**level)
+        segments = self.transform_points(self.outline_cache[key], outline_transform)
+        if cache_key is not None:
+            self.geometry_cache.set_outline(cache_key, flatness, segments)
+        return segments if len(segments) else None
+
+    def outline_source(self, obj, transform=None):
+        """The shape whose outline obj shows, following clones, and the transform mapping that outline
+
+        Returns (None, None) for elements without an outline.
+        """
+        transform = Transform(transform)
+        seen = set()
+        while isinstance(obj, Use) and obj not in seen:
+            seen.add(obj)
+            offset = Transform(translate=(obj.to_dimensionless(obj.get('x', 0)), obj.to_dimensionless(obj.get('y', 0))))
+            transform = transform @ obj.transform @ offset
+            obj = obj.href
+        if not isinstance(obj, OUTLINE_ELEMENTS):
+            return None, None
+        return obj, transform @ obj.transform
+
+    def local_curve(self, shape):
+        """BezierPath of a shape's path in its own coordinates, cached in outline_cache"""
+        key = (shape, None)
+        if key not in self.outline_cache:
+            self.outline_cache[key] = self.csp_to_bezier(shape.path.to_superpath())
+        return self.outline_cache[key]
+
+    def transform_points(self, points, transform):
+        """Map an array of points, with (x, y) in the last axis, by transform"""
+        matrix = np.array(transform.matrix)
+        return points @ matrix[:, :2].T + matrix[:, 2]
+
+    def polygon_edges(self, segments):
+        """Close every run of connected line segments into a polygon
+
+        Returns the (edges, 2, 2) edge array, with a closing edge added to
+        each subpath whose end does not meet its start.
+        """
+        if not len(segments):
+            return segments
+        breaks = np.flatnonzero((segments[1:, 0] != segments[:-1, 1]).any(axis=1)) + 1
+        starts = np.concatenate(([0], breaks))
+        ends = np.concatenate((breaks, [len(segments)])) - 1
+        closing = np.stack((segments[ends, 1], segments[starts, 0]), axis=1)
+        closing = closing[(closing[:, 0] != closing[:, 1]).any(axis=1)]
+        return np.concatenate((segments, closing))
+
+    def winding_numbers(self, points, edges, groups=None):
+        """Winding number of the polygon edges around each point
+
+        With groups, the polygon index of every edge, all polygons are done
+        in the same pass and a (points, polygons) array is returned.
+        """
+        count = 1 if groups is None else int(groups.max()) + 1 if len(groups) else 0
+        winding = np.zeros((len(points), count), dtype=np.int64)
+        if len(points) and len(edges):
+            # Sums the crossings of each polygon's edges
+            member = np.zeros((len(edges), count), dtype=np.int64)
+            member[np.arange(len(edges)), 0 if groups is None else groups] = 1
+            a, b = edges[None, :, 0], edges[None, :, 1]
+            step = max(1, BROADCAST_CHUNK // len(edges))
+            for start in range(0, len(points), step):
+                p = points[start:start + step, None, :]
+                # Which side of the edge line the point is on
+                side = ((b[..., 0] - a[..., 0]) * (p[..., 1] - a[..., 1])
+                        - (p[..., 0] - a[..., 0]) * (b[..., 1] - a[..., 1]))
+                upward = (a[..., 1] <= p[..., 1]) & (p[..., 1] < b[..., 1]) & (side > 0)
+                downward = (b[..., 1] <= p[..., 1]) & (p[..., 1] < a[..., 1]) & (side < 0)
+                winding[start:start + step] = (upward.astype(np.int64) - downward) @ member
+        return winding[:, 0] if groups is None else winding
+
+    def points_in_polygon(self, points, edges, rule='evenodd', groups=None):
+        """Check which points are inside the polygon under the evenodd or nonzero fill rule
+
+        With groups, the polygon index of every edge, points inside any of
+        the polygons count, and rule may give one fill rule per polygon.
+        """
+        winding = self.winding_numbers(points, edges, groups)
+        if groups is None:
+            winding = winding[:, None]
+        rules = [rule] * winding.shape[1] if isinstance(rule, str) else rule
+        inside = np.zeros(len(points), dtype=bool)
+        for column, column_rule in enumerate(rules):
+            if column_rule == 'nonzero':
+                inside |= winding[:, column] != 0
+            else:
+                inside |= winding[:, column] % 2 == 1
+        return inside
+
     def bezier_passes_near(self, curve, point, tol=1e-6, samples=100):
         """Check if a Bézier curve passes near a point"""
-        for seg in curve:
-            for t in np.linspace(0, 1, samples):
-                p = self.bezier_point(seg, t)
-                if np.linalg.norm(p - point) < tol:
-                    return True
-        return False
-    
+        points = self.sample_curve(curve, samples)
+        return bool(self.points_near_points(points, np.array([point], dtype=np.float64), tol)[0])
+
     def bezier_passes_trough_objects_bbox(self, curve, obj, tol=1e-6, samples=100):
         """Check if a Bézier curve passes through object bounding box"""
-        bbox = obj.bounding_box()
-        for seg in curve:
-            for t in np.linspace(0, 1, samples):
-                p = self.bezier_point(seg, t)
-                if (bbox.left - tol <= p[0] <= bbox.right + tol and
-                    bbox.top - tol <= p[1] <= bbox.bottom + tol):
-                    return True
-        return False
-    
+        points = self.sample_curve(curve, samples)
+        return bool(self.points_in_bboxes(points, self.objects_bbox_array([obj]), tol)[0])
+
     def bezier_passes_near_objects_bbox_center(self, curve, obj, tol=1e-6, samples=100):
         """Check if a Bézier curve passes any object bounding box center"""
-        bbox = obj.bounding_box()
-        center = bbox.center    
-        if self.bezier_passes_near(curve, center, tol, samples):
-            return True
-        return False
-    
+        centers = self.bbox_centers(self.objects_bbox_array([obj]))
+        return bool(self.points_near_points(self.sample_curve(curve, samples), centers, tol)[0])
+
+    def sample_curve(self, curve, samples=100):
+        """Evaluate all Bézier segments at `samples` evenly spaced t values
+
+        Returns a (segments * samples, 2) array of points in segment order.
+        """
+        return BezierPath(curve).points(np.linspace(0, 1, samples)).reshape(-1, 2)
+
+    def flatten_curve(self, curve, flatness=0.1, max_depth=16):
+        """Flatten Bézier segments to line segments by adaptive subdivision
+
+        A segment is split in half until all its control points are within
+        flatness of its chord. By the convex hull property the curve then
+        never deviates more than flatness from the returned polyline.
+        Returns an (segments, 2, 2) array of start and end points in path order.
+        """
+        if not len(curve):
+            return np.empty((0, 2, 2), dtype=np.float64)
+        pending = np.asarray(curve, dtype=np.float64).reshape(-1, 4, 2)
+        # Path position of each pending piece, used to restore the order
+        index = np.arange(len(pending), dtype=np.float64)
+        width = 1.0
+        done, done_index = [], []
+        for depth in range(max_depth + 1):
+            p0, p3 = pending[:, 0], pending[:, 3]
+            deviation = np.maximum(self.point_segment_distance(pending[:, 1], p0, p3),
+                                   self.point_segment_distance(pending[:, 2], p0, p3))
+            flat = ~(deviation > flatness) if depth < max_depth else np.ones(len(pending), dtype=bool)
+            done.append(pending[flat][:, [0, 3]])
+            done_index.append(index[flat])
+            if flat.all():
+                break
+            pending, index = pending[~flat], index[~flat]
+            first, second = self.split_segments(pending)
+            width /= 2
+            pending = np.concatenate((first, second))
+            index = np.concatenate((index, index + width))
+        segments = np.concatenate(done)
+        return segments[np.argsort(np.concatenate(done_index), kind='stable')]
+
+    def point_segment_distance(self, points, start, end):
+        """Distance of each point to the line segment from start to end (all (n, 2) arrays)"""
+        delta = end - start
+        length2 = delta[..., 0]**2 + delta[..., 1]**2
+        offset = points - start
+        dot = offset[..., 0] * delta[..., 0] + offset[..., 1] * delta[..., 1]
+        length2 = np.broadcast_to(length2, dot.shape)
+        u = np.divide(dot, length2, out=np.zeros_like(dot), where=length2 > 0)
+        u = np.clip(u, 0, 1)[..., None]
+        diff = offset - u * delta
+        return np.sqrt(diff[..., 0]**2 + diff[..., 1]**2)
+
+    def segments_cross_bboxes(self, segments, bboxes, tol=1e-6):
+        """For each bounding box, check if any line segment crosses it (grown by tol)
+
+        A segment crosses a box when their bounding boxes overlap and the
+        box corners are not all strictly on one side of the segment line.
+        """
+        hits = np.zeros(len(bboxes), dtype=bool)
+        if not len(segments) or not len(bboxes):
+            return hits
+        p, q = segments[None, :, 0], segments[None, :, 1]
+        lo, hi = np.minimum(p, q), np.maximum(p, q)
+        dx, dy = q[..., 0] - p[..., 0], q[..., 1] - p[..., 1]
+        step = max(1, BROADCAST_CHUNK // len(segments))
+        for start in range(0, len(bboxes), step):
+            b = bboxes[start:start + step, None, :]
+            left, top = b[..., 0] - tol, b[..., 1] - tol
+            right, bottom = b[..., 2] + tol, b[..., 3] + tol
+            overlap = ((lo[..., 0] <= right) & (left <= hi[..., 0])
+                       & (lo[..., 1] <= bottom) & (top <= hi[..., 1]))
+            sides = [dx * (y - p[..., 1]) - dy * (x - p[..., 0])
+                     for x, y in ((left, top), (right, top), (right, bottom), (left, bottom))]
+            one_side = (((sides[0] > 0) & (sides[1] > 0) & (sides[2] > 0) & (sides[3] > 0))
+                        | ((sides[0] < 0) & (sides[1] < 0) & (sides[2] < 0) & (sides[3] < 0)))
+            hits[start:start + step] = (overlap & ~one_side).any(axis=1)
+        return hits
+
+    def segments_cross_segments(self, segments, targets):
+        """For each target line segment, check if it meets any of the line segments
+
+        Two segments meet when their bounding boxes overlap and the ends of
+        each are not strictly on one side of the other's line.
+        """
+        hits = np.zeros(len(targets), dtype=bool)
+        if not len(segments) or not len(targets):
+            return hits
+        p, q = segments[None, :, 0], segments[None, :, 1]
+        lo, hi = np.minimum(p, q), np.maximum(p, q)
+        dx, dy = q[..., 0] - p[..., 0], q[..., 1] - p[..., 1]
+        step = max(1, BROADCAST_CHUNK // len(segments))
+        for start in range(0, len(targets), step):
+            a, b = targets[start:start + step, None, 0], targets[start:start + step, None, 1]
+            overlap = ((np.minimum(a, b) <= hi) & (lo <= np.maximum(a, b))).all(axis=-1)
+            ex, ey = b[..., 0] - a[..., 0], b[..., 1] - a[..., 1]
+            side_a = dx * (a[..., 1] - p[..., 1]) - dy * (a[..., 0] - p[..., 0])
+            side_b = dx * (b[..., 1] - p[..., 1]) - dy * (b[..., 0] - p[..., 0])
+            side_p = ex * (p[..., 1] - a[..., 1]) - ey * (p[..., 0] - a[..., 0])
+            side_q = ex * (q[..., 1] - a[..., 1]) - ey * (q[..., 0] - a[..., 0])
+            hits[start:start + step] = (overlap & (side_a * side_b <= 0) & (side_p * side_q <= 0)).any(axis=1)
+        return hits
+
+    def segments_near_points(self, segments, targets, tol=1e-6):
+        """For each target point, check if any line segment is closer than tol"""
+        hits = np.zeros(len(targets), dtype=bool)
+        if not len(segments) or not len(targets):
+            return hits
+        p, q = segments[None, :, 0], segments[None, :, 1]
+        step = max(1, BROADCAST_CHUNK // len(segments))
+        for start in range(0, len(targets), step):
+            dist = self.point_segment_distance(targets[start:start + step, None, :], p, q)
+            hits[start:start + step] = (dist < tol).any(axis=1)
+        return hits
+
+    def objects_bbox_array(self, objects, cache=None, transforms=None):
+        """Bounding boxes of objects as an (objects, 4) array of left, top, right, bottom
+
+        Boxes are in document coordinates. The layer is walked top-down once:
+        composed transforms of parents are looked up in cache, unless given
+        in transforms, and groups pass their transform on to their children
+        instead of recomputing it.
+        Objects without a bounding box get NaN rows, which never match.
+        """
+        if cache is None:
+            cache = {}
+        bboxes = np.full((len(objects), 4), np.nan, dtype=np.float64)
+        for i, obj in enumerate(objects):
+            transform = self.parent_transform(obj, cache) if transforms is None else transforms[i]
+            bbox = self.element_bbox(obj, transform)
+            if bbox is not None:
+                bboxes[i] = (bbox.left, bbox.top, bbox.right, bbox.bottom)
+        return bboxes
+
+    def parent_transform(self, elem, cache):
+        """Composed transform of the element's parent, memoized per parent in cache"""
+        parent = elem.getparent()
+        if not isinstance(parent, ShapeElement):
+            return Transform()
+        if parent not in cache:
+            cache[parent] = self.parent_transform(parent, cache) @ parent.transform
+        return cache[parent]
+
+    def element_bbox(self, elem, transform):
+        """Bounding box of an element with transform applied on top of its own
+
+        Groups are walked here with their composed transform handed down to
+        the children, clones are derived from their source's box, other
+        elements use inkex's bounding box.
+        """
+        if isinstance(elem, Use):
+            return self.clone_bbox(elem, transform)
+        if not isinstance(elem, Group):
+            if self.geometry_cache is not None:
+                return self.cached_bbox(elem, transform)
+            return elem.bounding_box(transform)
+        inner = transform @ elem.transform
+        bbox = None
+        for child in elem:
+            if not isinstance(child, ShapeElement):
+                continue
+            if self.hidden(child):
+                continue
+            child_bbox = self.element_bbox(child, inner)
+            if child_bbox is not None:
+                bbox += child_bbox
+        clip = elem.clip
+        if clip is None or bbox is None:
+            return bbox
+        return bbox & clip.bounding_box(inner)
+
+    def clone_bbox(self, clone, transform):
+        """Bounding box of a <use> clone, mapped from its source's box
+
+        The source's box is computed once per run and kept in source_bboxes.
+        Clones that only scale and translate it, which is the usual case
+        for markers and icons, map its corners. Rotated or skewed clones
+        get the exact box of the source under their transform instead.
+        Unlike inkex, the clone's x/y offset is applied.
+        """
+        source = clone.href
+        if not isinstance(source, ShapeElement):
+            return None
+        full = Transform(transform) @ clone.transform @ Transform(
+            translate=(clone.to_dimensionless(clone.get('x', 0)), clone.to_dimensionless(clone.get('y', 0))))
+        if full.b == 0 and full.c == 0:
+            if source not in self.source_bboxes:
+                # Placeholder first, a clone of itself has no box
+                self.source_bboxes[source] = None
+                self.source_bboxes[source] = self.element_bbox(source, Transform())
+            box = self.source_bboxes[source]
+            if box is None:
+                return None
+            xs = (full.a * box.left + full.e, full.a * box.right + full.e)
+            ys = (full.d * box.top + full.f, full.d * box.bottom + full.f)
+            bbox = BoundingBox((min(xs), max(xs)), (min(ys), max(ys)))
+        else:
+            bbox = self.element_bbox(source, full)
+        # Resolving the clip path is a document lookup, most clones have none
+        clipped = 'clip-path' in clone.attrib or 'clip-path' in clone.attrib.get('style', '')
+        clip = clone.clip if clipped and bbox is not None else None
+        if clip is None:
+            return bbox
+        return bbox & clip.bounding_box(Transform(transform) @ clone.transform)
+
+    def cached_bbox(self, elem, transform):
+        """Bounding box of a non-group element, looked up in or added to the geometry cache"""
+        transform = Transform(transform)
+        key = self.geometry_cache.key(elem, transform)
+        if key is None:
+            return elem.bounding_box(transform)
+        found, bbox = self.geometry_cache.bbox(key)
+        if found:
+            return None if bbox is None else BoundingBox((bbox[0], bbox[2]), (bbox[1], bbox[3]))
+        bbox = elem.bounding_box(transform)
+        self.geometry_cache.set_bbox(key, None if bbox is None else (bbox.left, bbox.top, bbox.right, bbox.bottom))
+        return bbox
+
+    def curve_bbox(self, curve):
+        """Bounding box (left, top, right, bottom) of the control points of all segments
+
+        By the convex hull property it contains the whole curve.
+        """
+        return BezierPath(curve).bbox()
+
+    def bbox_corners(self, bboxes):
+        """Corners of an (objects, 4) bounding box array as an (objects, 4, 2) array
+
+        Corners go top-left, top-right, bottom-right, bottom-left.
+        """
+        left, top, right, bottom = bboxes.T
+        return np.stack((np.column_stack((left, top)), np.column_stack((right, top)),
+                         np.column_stack((right, bottom)), np.column_stack((left, bottom))), axis=1)
+
+    def bbox_centers(self, bboxes):
+        """Centers of an (objects, 4) bounding box array as an (objects, 2) array"""
+        return np.column_stack(((bboxes[:, 0] + bboxes[:, 2]) / 2, (bboxes[:, 1] + bboxes[:, 3]) / 2))
+
+    def points_in_bboxes(self, points, bboxes, tol=1e-6):
+        """For each bounding box, check if any of the points falls inside it (grown by tol)"""
+        hits = np.zeros(len(bboxes), dtype=bool)
+        if not len(points) or not len(bboxes):
+            return hits
+        x = points[None, :, 0]
+        y = points[None, :, 1]
+        step = max(1, BROADCAST_CHUNK // len(points))
+        for start in range(0, len(bboxes), step):
+            b = bboxes[start:start + step, :, None]
+            inside = ((b[:, 0] - tol <= x) & (x <= b[:, 2] + tol)
+                      & (b[:, 1] - tol <= y) & (y <= b[:, 3] + tol))
+            hits[start:start + step] = inside.any(axis=1)
+        return hits
+
+    def points_near_points(self, points, targets, tol=1e-6):
+        """For each target point, check if any of the points is closer than tol"""
+        hits = np.zeros(len(targets), dtype=bool)
+        if not len(points) or not len(targets):
+            return hits
+        step = max(1, BROADCAST_CHUNK // len(points))
+        for start in range(0, len(targets), step):
+            diff = points[None, :, :] - targets[start:start + step, None, :]
+            dist = np.sqrt(diff[..., 0]**2 + diff[..., 1]**2)
+            hits[start:start + step] = (dist < tol).any(axis=1)
+        return hits
+
     def process_results(self, intersections):
         """Process the results based on selection mode"""
 
@@ -368,17 +1695,21 @@ class BezierIntersection(inkex.EffectExtension):
             if mode == 'replace':
                 inkex.errormsg(f"Replacing selection with: {', '.join([obj.get('id') for obj in intersections])}")
             elif mode == 'add':
-                selected_with_addition = list(set([obj.get('id') for obj in self.svg.selected] + [obj.get('id') for obj in intersections]))
+                selected_with_addition, dummy, dummy = selection_delta(
+                    [obj.get('id') for obj in self.svg.selected], [obj.get('id') for obj in intersections], 'add')
                 inkex.errormsg(f"New selection with addition: {', '.join(selected_with_addition)}")
             elif mode == 'subtract':
-                selected_with_subtraction = [obj.get('id') for obj in self.svg.selected if obj not in intersections]
+                selected_with_subtraction, dummy, dummy = selection_delta(
+                    [obj.get('id') for obj in self.svg.selected], [obj.get('id') for obj in intersections], 'subtract')
                 inkex.errormsg(f"New selection with subtraction: {', '.join(selected_with_subtraction)}")
         else:
-            # Pass the selected objects to DBus for selection
-            path_id_list = [obj.get('id') for obj in intersections]
-            current_selection_id_list = [obj.get('id') for obj in self.svg.selected]
-            path_id_list_string = ','.join(path_id_list)
-            current_selection_id_list_string = ','.join(current_selection_id_list)
+            with self.trace.span('results', hits=len(intersections)) as span:
+                # Pass the selected objects to DBus for selection
+                path_id_list = [obj.get('id') for obj in intersections]
+                current_selection_id_list = [obj.get('id') for obj in self.svg.selected]
+                path_id_list_string = ','.join(path_id_list)
+                current_selection_id_list_string = ','.join(current_selection_id_list)
+                span.set(selected=len(current_selection_id_list))
 
             if mode == 'replace':
                 selection_mode = 'clear'
@@ -387,7 +1718,10 @@ class BezierIntersection(inkex.EffectExtension):
             elif mode == 'subtract':
                 selection_mode = 'subtract'
                 
-            pass_ids_to_dbus(path_id_list_string, self.options.dbus_delay_float, selection_mode, current_selection_id_list_string)
+            # Debug mode never reaches the passback, log_errors records the DBus wait
+            with self.trace.span('dbus_handoff', ids=len(path_id_list)):
+                pass_ids_to_dbus(path_id_list_string, self.options.dbus_delay_float, selection_mode, current_selection_id_list_string,
+                                 self.options.log_errors, self.options.dbus_chunk_size, self.lasso_ids)
             sys.exit(0)
             
 if __name__ == '__main__':
@@ -7,9 +7,14 @@ It is intended to be used as an Inkscape extension.
 """
 
 import inkex
-import subprocess
+import numpy as np
+from inkex.properties import all_properties
+from lxml import etree
+from ink_dbus_client import selection_delta, selection_request, send_to_daemon, write_request_file
+from instrumentation import Trace, NO_TRACE
 
-import sys, os, shutil
+import sys, os, re
+from functools import lru_cache
 
 def get_attributes(obj):
     """ Returns a string containing all object attributes
@@ -63,13 +68,33 @@ def set_stderr(state):
 # import warnings
 # warnings.filterwarnings("ignore")
 
-def pass_ids_to_dbus(path_id_list_string, dbus_delay, selection_mode, current_selection_id_list_string):
+def pass_ids_to_dbus(path_id_list_string, dbus_delay, selection_mode, current_selection_id_list_string, debug=False,
+                     chunk_size=1000):
     dbus_delay = str(dbus_delay)
     inkex.utils.debug(f"DBus delay: {dbus_delay}")
     inkex.utils.debug(f"Selection mode: {selection_mode}")
     inkex.utils.debug(f"Path ID list: {path_id_list_string}")
     inkex.utils.debug(f"Current selection ID list: {current_selection_id_list_string}")
 
+    # Work out the final selection here and only send the changes,
+    # ink_dbus.py waits for this process to exit before selecting,
+    # with debug it records the wait in its debug file
+    path_id_list = [x for x in path_id_list_string.split(',') if x]
+    current_selection_id_list = [x for x in current_selection_id_list_string.split(',') if x]
+    final_id_list, add_id_list, remove_id_list = selection_delta(current_selection_id_list, path_id_list, selection_mode)
+    inkex.utils.debug(f"Adding {len(add_id_list)}, removing {len(remove_id_list)} IDs")
+    request = selection_request(add_id_list, remove_id_list, dbus_delay, debug, chunk_size)
+
+    # A running ink_dbus.py helper takes the request with one socket write
+    if send_to_daemon(request):
+        return
+
+    # Otherwise hand the request over in a temp file, the id lists can be
+    # too long for the command line
+    request_arg = '@' + write_request_file(request)
+
+    import subprocess
+
     if os_check() == 'windows':
 
         py_exe = sys.executable
@@ -77,42 +102,417 @@ def pass_ids_to_dbus(path_id_list_string, dbus_delay, selection_mode, current_se
             py_exe = py_exe.replace('pythonw.exe', 'python.exe')
 
         DETACHED_PROCESS = 0x08000000
-        subprocess.Popen([py_exe, 'ink_dbus.py',  'application', 'None', 'None', path_id_list_string, dbus_delay, selection_mode, current_selection_id_list_string, 'as_subprocess'], creationflags=DETACHED_PROCESS)
+        subprocess.Popen([py_exe, 'ink_dbus.py',  'application', 'None', 'None', request_arg, dbus_delay, selection_mode, '', 'as_subprocess'], creationflags=DETACHED_PROCESS)
     else:
-        subprocess.Popen(['python3', 'ink_dbus.py', 'application', 'None', 'None', path_id_list_string, dbus_delay, selection_mode, current_selection_id_list_string, 'as_subprocess'],
+        subprocess.Popen(['python3', 'ink_dbus.py', 'application', 'None', 'None', request_arg, dbus_delay, selection_mode, '', 'as_subprocess'],
                          preexec_fn=os.setpgrp, stdout=open('/dev/null', 'w'),
                          stderr=open('/tmp/inkdbus.txt', 'w'), )
 
 
+# Up to this many ids are looked up with an XPath each instead of the id index
+FEW_IDS = 4
+
+# Properties compared as RGB colours
+COLOR_PROPERTIES = {'fill', 'stroke', 'color', 'stop-color', 'flood-color', 'lighting-color', 'solid-color'}
+# Paint keywords compared as text, inkex.Color reads none as black
+PAINT_KEYWORDS = {'none', 'currentcolor', 'inherit'}
+# Properties that can also be given as attributes, the style attribute wins
+PRESENTATION_ATTRIBUTES = frozenset(name for name, prop in all_properties.items() if prop.presentation)
+# Plain or px numbers
+STYLE_NUMBER = re.compile(r'^([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(?:px)?$')
+
+
+@lru_cache(maxsize=256)
+def compiled_xpath(expression):
+    """Compiled XPath for expression with the SVG namespaces, built once per process
+
+    Values are passed to the compiled expression as XPath variables, e.g.
+    compiled_xpath('//*[@id=$id]')(root, id=elem_id), never pasted into it.
+    """
+    return etree.XPath(expression, namespaces=inkex.NSS)
+
+
+def first_step_length(path):
+    """Length of the first location step of the relative XPath path, up to a / outside predicates and strings"""
+    depth = 0
+    quote = None
+    for i, char in enumerate(path):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+        elif char in '[(':
+            depth += 1
+        elif char in '])':
+            depth -= 1
+        elif char == '/' and depth == 0:
+            return i
+    return len(path)
+
+
+class TokenIndex:
+    """Class token and id lookups for the subtree under root, root included
+
+    Each map is built on first use, in one pass over the elements that
+    have the attribute.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._classes = None
+        self._ids = None
+
+    @property
+    def classes(self):
+        if self._classes is None:
+            self._classes = {}
+            for elem in compiled_xpath('descendant-or-self::*[@class]')(self.root):
+                for token in elem.get('class').split():
+                    self._classes.setdefault(token, []).append(elem)
+        return self._classes
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            self._ids = {}
+            for elem in compiled_xpath('descendant-or-self::*[@id]')(self.root):
+                self._ids.setdefault(elem.get('id'), elem)
+        return self._ids
+
+    def by_class(self, class_names):
+        """Elements having every whitespace separated class in class_names, in document order"""
+        matches = [self.classes.get(token, []) for token in class_names.split()]
+        if not matches:
+            return []
+        matches.sort(key=len)
+        others = [set(elements) for elements in matches[1:]]
+        return [elem for elem in matches[0] if all(elem in elements for elements in others)]
+
+    def by_id(self, ids):
+        """Elements with the given ids, unknown ids are skipped"""
+        if self._ids is None and len(ids) <= FEW_IDS:
+            # Cheaper than indexing every element of the document
+            find = compiled_xpath('(descendant-or-self::*[@id=$id])[1]')
+            return [found[0] for found in (find(self.root, id=elem_id) for elem_id in ids) if found]
+        return [self.ids[elem_id] for elem_id in ids if elem_id in self.ids]
+
+
+@lru_cache(maxsize=4)
+def token_index(root):
+    """TokenIndex of the subtree under root, kept for later lookups on the same unchanged document"""
+    return TokenIndex(root)
+
+
+def parse_style(text):
+    """Property to value dict of a style attribute, later declarations win"""
+    style = {}
+    for declaration in text.split(';'):
+        name, colon, value = declaration.partition(':')
+        if colon:
+            style[name.strip().lower()] = value.strip()
+    return style
+
+
+def style_number(value):
+    """Value as a float if it is a plain or px number, else None"""
+    match = STYLE_NUMBER.match(value.strip().lower())
+    return float(match.group(1)) if match else None
+
+
+def style_color(value):
+    """Value as an (r, g, b) tuple if it is a colour, else None
+
+    Paint keywords and url(...) references are no colours.
+    """
+    value = value.strip()
+    if value.lower() in PAINT_KEYWORDS or value.lower().startswith('url('):
+        return None
+    try:
+        return tuple(inkex.Color(value).to_rgb())
+    except (inkex.colors.ColorError, ValueError, TypeError):
+        return None
+
+
+def style_key(name, value):
+    """Value of property name in the form values are compared in: RGB, number or lowercase text"""
+    if name in COLOR_PROPERTIES:
+        color = style_color(value)
+        if color is not None:
+            return color
+    number = style_number(value)
+    if number is not None:
+        return number
+    return value.strip().lower()
+
+
+def parse_style_query(query):
+    """Conditions of a style query, (property, kind, argument) triples
+
+    Conditions are separated by semicolons, all of them must hold:
+    'fill:#ff0000' compares values, 'stroke-width:0.5..2' takes a numeric
+    range with either end left open, 'stroke:#00f~20' a colour within an
+    RGB distance. Malformed conditions raise ValueError.
+    """
+    conditions = []
+    for condition in query.split(';'):
+        if not condition.strip():
+            continue
+        name, colon, value = condition.partition(':')
+        name, value = name.strip().lower(), value.strip()
+        if not colon or not name or not value:
+            raise ValueError(f"Expected property:value in '{condition.strip()}'")
+        if '..' in value:
+            low, high = (part.strip() for part in value.split('..', 1))
+            bounds = [style_number(part) if part else None for part in (low, high)]
+            if any(part and bound is None for part, bound in zip((low, high), bounds)):
+                raise ValueError(f"Expected numbers in range '{value}'")
+            conditions.append((name, 'range', (-np.inf if bounds[0] is None else bounds[0],
+                                               np.inf if bounds[1] is None else bounds[1])))
+        elif '~' in value:
+            color, tolerance = (part.strip() for part in value.rsplit('~', 1))
+            rgb, distance = style_color(color), style_number(tolerance)
+            if rgb is None or distance is None:
+                raise ValueError(f"Expected colour~distance in '{value}'")
+            conditions.append((name, 'color', (rgb, distance)))
+        else:
+            conditions.append((name, 'equals', style_key(name, value)))
+    if not conditions:
+        raise ValueError("Empty style query")
+    return conditions
+
+
+class StyleColumn:
+    """Values of one property, with the document positions of their elements
+
+    The lookup tables for each kind of query are built on first use.
+    """
+
+    def __init__(self, name, positions, values):
+        self.name = name
+        self.positions = np.array(positions, dtype=np.intp)
+        self.values = values
+        self._keys = None
+        self._numbers = None
+        self._colors = None
+
+    def equals(self, key):
+        if self._keys is None:
+            keys = {}
+            for position, value in zip(self.positions.tolist(), self.values):
+                keys.setdefault(style_key(self.name, value), []).append(position)
+            self._keys = {key: np.array(positions, dtype=np.intp) for key, positions in keys.items()}
+        return self._keys.get(key, np.empty(0, dtype=np.intp))
+
+    def in_range(self, low, high):
+        if self._numbers is None:
+            numbers = np.array([style_number(value) for value in self.values], dtype=np.float64)
+            order = np.argsort(numbers, kind='stable')
+            # NaN for values that are no numbers sorts last and never matches
+            self._numbers = numbers[order], self.positions[order]
+        numbers, positions = self._numbers
+        return np.sort(positions[np.searchsorted(numbers, low, 'left'):np.searchsorted(numbers, high, 'right')])
+
+    def near_color(self, rgb, distance):
+        if self._colors is None:
+            colors = [style_color(value) if self.name in COLOR_PROPERTIES else None for value in self.values]
+            known = np.array([color is not None for color in colors], dtype=bool)
+            self._colors = (np.array([color for color in colors if color is not None], dtype=np.float64).reshape(-1, 3),
+                            self.positions[known])
+        colors, positions = self._colors
+        return positions[((colors - rgb)**2).sum(axis=1) <= distance**2]
+
+
+class StyleIndex:
+    """Parsed style values of a document, one StyleColumn per property
+
+    The style attribute and the presentation attributes of every element
+    are parsed once, so queries look up columns instead of scanning the
+    style strings of the whole tree.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.elements = []
+        columns = {}
+        for elem in root.iter('*'):
+            attrib = elem.attrib
+            style = {name: attrib[name] for name in attrib.keys() if name in PRESENTATION_ATTRIBUTES}
+            if 'style' in attrib:
+                style.update(parse_style(attrib['style']))
+            if not style:
+                continue
+            position = len(self.elements)
+            self.elements.append(elem)
+            for name, value in style.items():
+                positions, values = columns.setdefault(name, ([], []))
+                positions.append(position)
+                values.append(value)
+        self.columns = {name: StyleColumn(name, positions, values) for name, (positions, values) in columns.items()}
+
+    def select(self, conditions):
+        """Elements meeting all conditions from parse_style_query, in document order"""
+        matches = None
+        for name, kind, argument in conditions:
+            column = self.columns.get(name)
+            if column is None:
+                return []
+            if kind == 'range':
+                found = column.in_range(*argument)
+            elif kind == 'color':
+                found = column.near_color(*argument)
+            else:
+                found = column.equals(argument)
+            matches = found if matches is None else np.intersect1d(matches, found, assume_unique=True)
+            if not len(matches):
+                return []
+        return [self.elements[position] for position in matches.tolist()]
+
+
+@lru_cache(maxsize=4)
+def style_index(root):
+    """StyleIndex of the subtree under root, kept for later queries on the same unchanged document"""
+    return StyleIndex(root)
+
+
 class SelectByXPath(inkex.EffectExtension):
+
+    # Replaced in load_raw, runs that skip it are not traced
+    trace = NO_TRACE
+
     def add_arguments(self, pars):
         pars.add_argument("--selection_mode", type=str, default='replace', help="Selection mode: replace or add")
         pars.add_argument("--xpath", type=str, help="XPath expression to select objects")
-        pars.add_argument("--classname", type=str, help="Class name to select objects")
-        pars.add_argument("--dbus_delay", type=float, default=0.1, help="Delay before sending selection to DBus")
+        pars.add_argument("--classname", type=str, help="Class names to select objects, elements need all of them")
+        pars.add_argument("--style", type=str,
+                          help="Style conditions, e.g. 'fill:#ff0000; stroke-width:0.5..2; stroke:#00f~20'")
+        pars.add_argument("--scope", type=str, default='document',
+                          help="Elements searched: document, layer (the current layer) or selection (the selected objects)")
+        pars.add_argument("--max_results", type=int, default=0,
+                          help="Stop after this many matches, 0 for no limit")
+        pars.add_argument("--dbus_delay", type=float, default=0.1, help="Maximum wait for Inkscape before sending selection to DBus")
+        pars.add_argument("--dbus_chunk_size", type=int, default=1000, help="Maximum number of IDs per DBus selection call")
         pars.add_argument("--debug", type=inkex.Boolean, default=False, help="Enable debug mode")
+        pars.add_argument("--trace", type=inkex.Boolean, default=False,
+                          help="Write per-phase timings and memory peaks to a JSON-lines log")
+
+    def load_raw(self):
+        self.trace = Trace.from_options('select_by_xpath', self.options.trace)
+        with self.trace.span('document_load'):
+            super().load_raw()
+
+    def scope_roots(self):
+        """Elements whose subtrees are searched, by the scope option"""
+        scope = self.options.scope
+        if scope == 'layer':
+            # Like svg.get_current_layer, without indexing every id of the document
+            layer = token_index(self.svg).by_id([self.svg.namedview.current_layer or ''])
+            return [layer[0] if layer and layer[0].tag == inkex.addNS('g', 'svg') else self.svg]
+        if scope == 'selection':
+            roots = list(self.svg.selected.values())
+            # Nested selected objects are searched with their ancestors
+            nested = set(roots)
+            return [root for root in roots if not any(parent in nested for parent in root.iterancestors())]
+        return [self.svg]
+
+    def xpath_lookup(self, xpath, roots):
+        """(lookup, search roots) evaluating xpath for the scope roots
+
+        A leading // searches each root and its subtree instead of the whole
+        document. Paths starting at the root itself are followed from its
+        parent with the first step narrowed to the root, so positions in
+        predicates still count among siblings. Other absolute expressions,
+        and unions, are evaluated once on the document, their matches are
+        narrowed to the scope by find_in_scope.
+        """
+        expression = xpath.strip()
+        if roots != [self.svg] and expression.startswith('//') and '|' not in expression:
+            below = compiled_xpath('.' + expression)
+            path = expression[2:]
+            step = first_step_length(path)
+            try:
+                at_root = compiled_xpath(f'./{path[:step]}[count(. | $root) = 1]{path[step:]}')
+            except etree.XPathSyntaxError:
+                # A first step that takes no predicate, such as '.'
+                return compiled_xpath(expression), [self.svg]
+
+            def lookup(root):
+                parent = root.getparent()
+                if parent is None:
+                    return below(root)
+                return at_root(parent, root=root) + below(root)
+            return lookup, roots
+        if expression.startswith('/'):
+            roots = [self.svg]
+        return compiled_xpath(expression), roots
+
+    def find_in_scope(self, lookup, roots, search_roots=None):
+        """Elements lookup(root) finds below the search roots that lie in the scope of roots
+
+        Repeats are dropped. Returns (elements, truncated), the search stops
+        once max_results elements are found.
+        """
+        limit = self.options.max_results
+        scope = set(roots)
+        everywhere = self.svg in scope
+        matches = {}
+        for root in search_roots or roots:
+            for elem in lookup(root):
+                if elem in matches or not (everywhere or elem in scope
+                                           or any(parent in scope for parent in elem.iterancestors())):
+                    continue
+                matches[elem] = None
+                if limit > 0 and len(matches) >= limit:
+                    return list(matches), True
+        return list(matches), False
 
     def effect(self):
         # Set debug mode
         if not self.options.debug:
             set_stdout('off')
             set_stderr('off')
+        else:
+            from startup_report import import_time_report
+            inkex.utils.debug(import_time_report('select_by_xpath'))
 
         xpath = self.options.xpath
-        class_name = self.options.classname
+        class_name = (self.options.classname or '').strip()
+        style = (self.options.style or '').strip()
 
-        if xpath:
-            elements = self.svg.xpath(xpath)
-        elif class_name:
-            elements = self.svg.xpath(f"//*[@class='{class_name}']")
-        else:
-            inkex.errormsg("Please provide either an XPath expression or a class name.")
+        if not xpath and not class_name and not style:
+            inkex.errormsg("Please provide an XPath expression, a class name or a style query.")
+            return
+        roots = self.scope_roots()
+        if not roots:
+            inkex.errormsg("Nothing selected to search within.")
             return
+        with self.trace.span('xpath', scope=self.options.scope, roots=len(roots)) as span:
+            if xpath:
+                try:
+                    lookup, search_roots = self.xpath_lookup(xpath, roots)
+                    elements, truncated = self.find_in_scope(lookup, roots, search_roots)
+                except etree.XPathError as error:
+                    inkex.errormsg(f"Invalid XPath expression: {error}")
+                    return
+            elif class_name:
+                elements, truncated = self.find_in_scope(lambda root: token_index(root).by_class(class_name), roots)
+            else:
+                try:
+                    conditions = parse_style_query(style)
+                except ValueError as error:
+                    inkex.errormsg(f"Invalid style query: {error}")
+                    return
+                elements, truncated = self.find_in_scope(lambda root: style_index(root).select(conditions), roots)
+            span.set(matches=len(elements), truncated=truncated)
+        if truncated:
+            inkex.errormsg(f"Stopped after the first {len(elements)} matches.")
         if not elements:
             inkex.errormsg("No elements found matching the criteria.")
             return
-        # Collect IDs of selected elements
-        selected_ids = [element.get('id') for element in elements if element.get('id')]
+        with self.trace.span('results', matches=len(elements)) as span:
+            # Collect IDs of selected elements
+            selected_ids = [element.get('id') for element in elements if element.get('id')]
+            span.set(hits=len(selected_ids))
 
         if not selected_ids:
             inkex.errormsg("No elements with IDs found matching the criteria.")
@@ -125,7 +525,9 @@ class SelectByXPath(inkex.EffectExtension):
         selection_mode = self.options.selection_mode == 'replace' and 'clear' or self.options.selection_mode
         dbus_delay = self.options.dbus_delay
         # Pass IDs to DBus
-        pass_ids_to_dbus(path_id_list_string, dbus_delay, selection_mode, current_selection_id_list_string)
+        with self.trace.span('dbus_handoff', ids=len(selected_ids)):
+            pass_ids_to_dbus(path_id_list_string, dbus_delay, selection_mode, current_selection_id_list_string, self.options.debug,
+                             self.options.dbus_chunk_size)
         sys.exit(0)
 
 if __name__ == '__main__':
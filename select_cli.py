@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+"""
+Headless selection queries on SVG files.
+
+Runs the select_by_path and select_by_xpath logic outside Inkscape and
+prints the matching IDs, one per line or as JSON, instead of passing them
+to Inkscape over DBus:
+
+    python select_cli.py path drawing.svg --id=lasso --method=enclosed
+    python select_cli.py xpath drawing.svg --classname=tree --json
+
+path takes the select_by_path options, --id can be repeated to combine
+several lassos. The document is streamed twice with lxml iterparse: the
+first pass finds the lassos and the ids that clones and clip paths refer
+to, the second tests the objects in the --scope in chunks and frees every
+element once it is done with. Candidates wait for their chunk as whole
+elements rather than just the attributes the tests read, since the
+extension's geometry code works on inkex elements. Memory is bounded by
+the chunk size and the referenced elements rather than by the document
+size.
+
+xpath --classname is matched on class tokens while streaming. An --xpath
+expression can look anywhere in the tree, so it and --style queries are
+evaluated on a plain lxml parse of the whole document, which is still
+much lighter than the inkex load. Both can be repeated; the document is
+read once and the matches are combined like add mode.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from collections import namedtuple
+
+import inkex
+import numpy as np
+from inkex import Transform
+from inkex.elements._parser import NodeBasedLookup
+from lxml import etree
+
+from geometry_cache import GeometryCache
+from instrumentation import Trace
+from select_by_path import BezierIntersection, BezierPath, CONTAINER_TAGS
+from select_by_xpath import StyleIndex, TokenIndex, compiled_xpath, parse_style_query
+
+SVG_G = inkex.addNS('g', 'svg')
+SVG_USE = inkex.addNS('use', 'svg')
+
+# Ids in url(#id) references, as used by clip-path
+URL_REFERENCE = re.compile(r'url\(\s*#([^)\s]+)\s*\)')
+
+# Scope state of an open element while streaming
+StreamState = namedtuple('StreamState', 'candidate children_in_scope under_root keep')
+
+
+def iterparse_svg(svg_file, events=('start', 'end'), inkex_elements=True):
+    """Stream (event, element) pairs of svg_file, as inkex elements unless told otherwise"""
+    with open(svg_file, 'rb') as file:
+        context = etree.iterparse(file, events=events, huge_tree=True, recover=True)
+        if inkex_elements:
+            context.set_element_class_lookup(NodeBasedLookup())
+        yield from context
+
+
+def free(elem):
+    """Drop a processed element and its subtree from the streamed tree"""
+    parent = elem.getparent()
+    elem.clear()
+    if parent is not None:
+        parent.remove(elem)
+
+
+def references(elem):
+    """Ids elem refers to for its geometry: a clone's source and clip paths"""
+    ids = set(URL_REFERENCE.findall(elem.get('clip-path', '') + elem.get('style', '')))
+    if elem.tag == SVG_USE:
+        href = elem.get('xlink:href') or elem.get('href')
+        if href and href.startswith('#'):
+            ids.add(href[1:])
+    return ids
+
+
+def subtree_references(elem):
+    """Ids referred to from elem and its descendants"""
+    ids = set()
+    for child in elem.iter():
+        ids |= references(child)
+    return ids
+
+
+class Positions:
+    """Position of the current element while streaming, the child indices leading to it from the root
+
+    Positions identify the lassos' parents in the second pass, labels
+    need not be unique.
+    """
+
+    def __init__(self):
+        self.path = []
+        self.children = [0]
+
+    def start(self):
+        self.path.append(self.children[-1])
+        self.children[-1] += 1
+        self.children.append(0)
+        return tuple(self.path[1:])
+
+    def end(self):
+        self.path.pop()
+        self.children.pop()
+
+
+def scan(svg_file, lasso_ids):
+    """First pass: the lassos and all referenced ids
+
+    Lassos are returned as a dict from id to a detached copy of the
+    element, its composed parent transform and the position of its parent,
+    the child indices leading to it from the root. Ids without an element
+    are left out.
+    """
+    lassos = {}
+    starts = {}
+    referenced = set()
+    transforms = []
+    positions = Positions()
+    for event, elem in iterparse_svg(svg_file):
+        if event == 'start':
+            # The root does not take part in the composed transforms, see parent_transform
+            parent = transforms[-1] if transforms else None
+            if parent is None:
+                transforms.append(Transform())
+            else:
+                transforms.append(parent @ elem.transform if elem.get('transform') else parent)
+            position = positions.start()
+            referenced |= references(elem)
+            elem_id = elem.get('id')
+            if elem_id in lasso_ids and elem_id not in lassos and elem_id not in starts:
+                starts[elem_id] = (parent if parent is not None else Transform(), position[:-1])
+        else:
+            transforms.pop()
+            positions.end()
+            elem_id = elem.get('id')
+            if elem_id in starts:
+                # Keep a detached copy, the streamed tree is freed as it goes
+                lasso = etree.fromstring(etree.tostring(elem), parser=inkex.elements._parser.SVG_PARSER)
+                lassos[elem_id] = (lasso,) + starts.pop(elem_id)
+            free(elem)
+    return lassos, referenced
+
+
+class StreamingSelection:
+    """Second pass of a path query: streams the candidates in the scope through the extension's tests
+
+    lassos are (curve, fill rule) pairs as made by lasso_curve, parents the
+    positions of the lassos' parents as found by scan. Candidates are held
+    whole, a candidate group is walked with the extension's collect_subtree
+    when its chunk is tested, so its box is built the same way.
+    """
+
+    def __init__(self, extension, lassos, parents, referenced, chunk_size=10000):
+        self.extension = extension
+        self.lassos = lassos
+        self.curve = BezierPath.concatenate(lasso_curve for lasso_curve, rule in lassos)
+        self.region = extension.lasso_region(self.curve)
+        self.parents = parents
+        self.referenced = referenced
+        self.chunk_size = chunk_size
+        self.scope = extension.options.scope
+        # Flattened outlines and clone sources' boxes live for the run,
+        # see outline_segments and clone_bbox
+        extension.outline_cache = {}
+        extension.source_bboxes = {}
+        self.tags = {inkex.addNS(tag, 'svg') for tag in extension.selectable_tags()}
+        self.seen = set()
+        self.pending = []
+        self.deferred = []
+        self.hits = []
+        self.candidates = 0
+        self.chunks = 0
+
+    def is_root(self, elem, position):
+        """Whether the contents of elem are in the scope, see scope_roots"""
+        if self.scope == 'document':
+            return not position
+        if self.scope == 'all_layers':
+            return elem.tag == SVG_G and elem.get('inkscape:groupmode') == 'layer'
+        return position in self.parents
+
+    def start(self, elem, position, parent):
+        """Scope state of elem from its parent's: (candidate, children in scope, below a root)"""
+        extension = self.extension
+        is_root = self.is_root(elem, position)
+        candidate = (parent.children_in_scope and elem.tag in self.tags and extension.selectable(elem)
+                     and (self.scope == 'layer' or elem.tag not in CONTAINER_TAGS
+                          or elem.get('inkscape:groupmode') != 'layer'))
+        if self.scope == 'layer':
+            children_in_scope = is_root
+        elif is_root and not parent.under_root:
+            children_in_scope = self.scope != 'all_layers' or extension.selectable(elem)
+        else:
+            # Hidden and locked subtrees are left out, candidate groups are walked when tested
+            children_in_scope = (parent.children_in_scope and not candidate and elem.tag in CONTAINER_TAGS
+                                 and extension.selectable(elem))
+        return candidate, children_in_scope, parent.under_root or is_root
+
+    def run(self, svg_file):
+        """Stream svg_file, returns the ids of the selected objects in document order"""
+        extension = self.extension
+        root = None
+        transforms = []
+        positions = Positions()
+        # Per open element: its StreamState
+        states = []
+        for event, elem in iterparse_svg(svg_file):
+            if event == 'start':
+                parent = transforms[-1] if transforms else None
+                position = positions.start()
+                if parent is None:
+                    root = elem
+                    transforms.append(Transform())
+                    if extension.geometry_cache is not None:
+                        # The cache keys include the unit scale, read off the root
+                        extension.geometry_cache.scale = root.scale
+                    parent_state = StreamState(False, False, False, False)
+                else:
+                    transforms.append(parent @ elem.transform if elem.get('transform') else parent)
+                    parent_state = states[-1]
+                elem_id = elem.get('id')
+                if elem_id in self.referenced:
+                    self.seen.add(elem_id)
+                candidate, children_in_scope, under_root = self.start(elem, position, parent_state)
+                keep = parent_state.keep or elem_id in self.referenced or candidate
+                states.append(StreamState(candidate, children_in_scope, under_root, keep))
+                continue
+
+            transforms.pop()
+            positions.end()
+            state = states.pop()
+            if elem is root:
+                break
+            if states[-1].keep:
+                # Part of a candidate or referenced subtree, handled with it
+                continue
+            if state.candidate:
+                if extension.past_deadline():
+                    # Nothing further is tested, the rest is only read to count what was left out
+                    extension.unevaluated += extension.subtree_candidates(elem, self.tags)
+                    free(elem)
+                    continue
+                self.candidates += 1
+                # Candidates wait under the root for their chunk, so their
+                # layer can be freed and references are still found
+                record = (self.candidates, elem, transforms[-1])
+                root.append(elem)
+                if subtree_references(elem) - self.seen:
+                    self.deferred.append(record)
+                else:
+                    self.pending.append(record)
+                    if len(self.pending) >= self.chunk_size:
+                        self.flush()
+            elif state.keep:
+                # Referenced elements stay reachable from the root
+                root.append(elem)
+            else:
+                free(elem)
+        self.flush()
+        # Clones and clip paths referring forward can be resolved now
+        self.pending = self.deferred
+        self.flush()
+        return [elem_id for order, elem_id in sorted(self.hits)]
+
+    def flush(self):
+        """Test the pending candidates and free them"""
+        if not self.pending:
+            return
+        self.chunks += 1
+        extension = self.extension
+        found = ([], [], [])
+        order = []
+        pending = self.pending
+        if extension.deadline is not None:
+            # The candidates nearest the lassos get their boxes first
+            pending = [pending[i] for i in extension.nearest_first(
+                self.curve, [(elem, transform) for seq, elem, transform in pending])]
+        for seq, elem, transform in pending:
+            if extension.past_deadline():
+                extension.unevaluated += extension.subtree_candidates(elem, self.tags)
+                continue
+            start = len(found[0])
+            extension.collect_subtree(elem, transform, self.tags, self.region, found)
+            order.extend((seq, index) for index in range(len(found[0]) - start))
+        candidates, boxes, transforms = found
+        bboxes = np.full((len(candidates), 4), np.nan, dtype=np.float64)
+        for i, bbox in enumerate(boxes):
+            if bbox is not None:
+                bboxes[i] = (bbox.left, bbox.top, bbox.right, bbox.bottom)
+        if extension.options.method == 'touching':
+            selected = extension.touching_objects(self.curve, candidates, bboxes, transforms=transforms)
+        else:
+            selected = extension.enclosed_objects(self.lassos, candidates, bboxes, transforms)
+        selected = set(selected)
+        for key, obj in zip(order, candidates):
+            if obj in selected:
+                self.hits.append((key, obj.get('id')))
+        for seq, elem, transform in self.pending:
+            if elem.get('id') in self.referenced:
+                # Clones further on still need it
+                continue
+            # Referenced elements inside a candidate outlive it
+            for child in list(elem.iterdescendants()):
+                if child.get('id') in self.referenced:
+                    elem.getparent().append(child)
+            free(elem)
+        # Only outlines of referenced shapes can be used again, by their clones
+        extension.outline_cache = {key: value for key, value in extension.outline_cache.items()
+                                   if key[0].get('id') in self.referenced}
+        self.pending = []
+
+
+def select_path(svg_file, extension, chunk_size=10000):
+    """Ids of the objects the lassos select together, lassos are given with --id like the extension's selection"""
+    options = extension.options
+    if not options.ids:
+        raise ValueError("No lasso given, pass its id with --id")
+    extension.unevaluated = 0
+    if options.time_budget > 0:
+        # Chunks come in document order, only the candidates within a chunk go nearest first
+        extension.deadline = time.perf_counter() + options.time_budget
+    with extension.trace.span('scan') as span:
+        found, referenced = scan(svg_file, set(options.ids))
+        span.set(lassos=len(found), referenced=len(referenced))
+    lassos = []
+    parents = set()
+    for lasso_id in dict.fromkeys(options.ids):
+        if lasso_id not in found:
+            raise ValueError(f"No element with id '{lasso_id}'")
+        lasso, transform, parent = found[lasso_id]
+        error = extension.lasso_error(lasso)
+        if error:
+            raise ValueError(error)
+        lassos.append(extension.lasso_curve(lasso, transform))
+        parents.add(parent)
+
+    if options.geometry_cache:
+        extension.geometry_cache = GeometryCache(max_bytes=options.geometry_cache_mb * 2**20)
+    selection = StreamingSelection(extension, lassos, parents, referenced, chunk_size)
+    with extension.trace.span('stream') as span:
+        ids = selection.run(svg_file)
+        span.set(candidates=selection.candidates, chunks=selection.chunks,
+                 deferred=len(selection.deferred), hits=len(ids))
+    if extension.unevaluated:
+        print(f"select_cli: time budget of {options.time_budget:g} s reached, "
+              f"{extension.unevaluated} objects were not evaluated", file=sys.stderr)
+    extension.save_geometry_cache()
+    return ids
+
+
+def select_xpath(svg_file, xpaths=(), class_names=(), styles=()):
+    """Ids of the elements matching any of xpaths, having all classes of any of class_names
+    or meeting any of the style queries, in document order"""
+    conditions = [parse_style_query(style) for style in styles]
+    if xpaths or conditions:
+        root = etree.parse(svg_file, etree.XMLParser(huge_tree=True, recover=True)).getroot()
+        matches = set()
+        for xpath in xpaths:
+            matches.update(elem for elem in compiled_xpath(xpath)(root) if isinstance(elem, etree._Element))
+        tokens = TokenIndex(root)
+        for class_name in class_names:
+            matches.update(tokens.by_class(class_name))
+        if conditions:
+            index = StyleIndex(root)
+            for condition in conditions:
+                matches.update(index.select(condition))
+        return [elem.get('id') for elem in root.iter() if elem in matches and elem.get('id')]
+    queries = [set(class_name.split()) for class_name in class_names]
+    ids = []
+    for event, elem in iterparse_svg(svg_file, events=('end',), inkex_elements=False):
+        classes = elem.get('class')
+        if classes and elem.get('id'):
+            tokens = set(classes.split())
+            if any(query and query <= tokens for query in queries):
+                ids.append(elem.get('id'))
+        # Children end before their parent, so only the current element is left
+        free(elem)
+    return ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('query', choices=('path', 'xpath'))
+    parser.add_argument('svg_file')
+    parser.add_argument('--json', action='store_true', help='Print {"ids": [...]} instead of one id per line')
+    parser.add_argument('--chunk_size', type=int, default=10000, help='Candidates tested per chunk (path)')
+    parser.add_argument('--xpath', action='append', default=[],
+                        help='XPath expression (xpath), repeat to combine several')
+    parser.add_argument('--classname', action='append', default=[],
+                        help='Space separated class names an element needs all of (xpath), repeat to combine several')
+    parser.add_argument('--style', action='append', default=[],
+                        help="Style query such as 'fill:#ff0000; stroke-width:0.5..2' (xpath), repeat to combine several")
+    options, extension_args = parser.parse_known_args(argv)
+
+    try:
+        if options.query == 'path':
+            extension = BezierIntersection()
+            extension.options = extension.arg_parser.parse_args(extension_args)
+            extension.trace = Trace.from_options('select_cli', extension.options.trace)
+            ids = select_path(options.svg_file, extension, options.chunk_size)
+        else:
+            if extension_args:
+                parser.error(f"unrecognized arguments: {' '.join(extension_args)}")
+            if not options.xpath and not options.classname and not options.style:
+                raise ValueError("Please provide an XPath expression, a class name or a style query.")
+            ids = select_xpath(options.svg_file, options.xpath, options.classname, options.style)
+    except (ValueError, OSError, etree.XMLSyntaxError, etree.XPathError) as error:
+        print(f"select_cli: {error}", file=sys.stderr)
+        return 1
+
+    if options.json:
+        print(json.dumps({'ids': ids}))
+    else:
+        for elem_id in ids:
+            print(elem_id)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
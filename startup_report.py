@@ -0,0 +1,55 @@
+"""
+Import time report for the extensions' debug mode.
+
+Runs a fresh interpreter with ``-X importtime`` on an extension module and
+summarises the total and the slowest imports, so startup regressions show
+up in the debug output. Only loaded in debug mode.
+"""
+
+import os
+import subprocess
+import sys
+
+
+def import_times(module_name):
+    """(self_us, cumulative_us, depth, name) for every import of module_name in a fresh interpreter"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+                            cwd=script_dir, capture_output=True, text=True, timeout=60)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(fields[0]), int(fields[1]), depth, name.strip()))
+    return rows
+
+
+def import_time_report(module_name, top=10):
+    """Summary of the import time of module_name with its top slowest direct dependencies"""
+    rows = import_times(module_name)
+    position = next((i for i, row in enumerate(rows) if row[3] == module_name), None)
+    if position is None:
+        return f"Import time of {module_name}: not available"
+    dummy, total, module_depth, dummy_name = rows[position]
+    # Imports are reported after the imports they trigger, the direct
+    # dependencies are the rows one level deeper right before the module
+    nested = []
+    for row in reversed(rows[:position]):
+        if row[2] <= module_depth:
+            break
+        nested.append(row)
+    direct = sorted((row for row in nested if row[2] == module_depth + 1), key=lambda row: row[1], reverse=True)
+    slowest = sorted(nested, key=lambda row: row[0], reverse=True)
+    lines = [f"Import time of {module_name}: {total / 1000:.1f} ms"]
+    for self_us, cumulative, depth, name in direct[:top]:
+        lines.append(f"  {name}: {cumulative / 1000:.1f} ms")
+    lines.append("Slowest modules (self time):")
+    for self_us, cumulative, depth, name in slowest[:top]:
+        lines.append(f"  {name}: {self_us / 1000:.1f} ms")
+    return '\n'.join(lines)
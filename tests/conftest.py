@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The extensions are plain modules next to their .inx files
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from select_by_path import BBoxGrid
+
+
+def random_bboxes(rng, count, size=1000.0, spread=20.0):
+    corners = rng.uniform(0, size, (count, 2))
+    extents = rng.exponential(spread, (count, 2))
+    return np.hstack((corners, corners + extents))
+
+
+def near_points(bboxes, points, tol):
+    """Brute force: objects whose box grown by tol contains any of the points"""
+    p = points[None, :, :]
+    b = bboxes[:, None, :]
+    inside = ((b[..., 0] - tol <= p[..., 0]) & (p[..., 0] <= b[..., 2] + tol)
+              & (b[..., 1] - tol <= p[..., 1]) & (p[..., 1] <= b[..., 3] + tol))
+    return set(np.flatnonzero(inside.any(axis=1)).tolist())
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('tol', [0.0, 3.0, 50.0])
+def test_query_points_finds_every_near_box(seed, tol):
+    rng = np.random.default_rng(seed)
+    bboxes = random_bboxes(rng, 500)
+    points = rng.uniform(-100, 1100, (200, 2))
+    found = set(BBoxGrid(bboxes).query_points(points, tol).tolist())
+    assert near_points(bboxes, points, tol) <= found
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_query_rect_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    bboxes = random_bboxes(rng, 500)
+    grid = BBoxGrid(bboxes)
+    for rect in rng.uniform(-200, 1200, (50, 4)):
+        rect = np.array([min(rect[0], rect[2]), min(rect[1], rect[3]), max(rect[0], rect[2]), max(rect[1], rect[3])])
+        expected = np.flatnonzero((bboxes[:, 0] <= rect[2]) & (rect[0] <= bboxes[:, 2])
+                                  & (bboxes[:, 1] <= rect[3]) & (rect[1] <= bboxes[:, 3]))
+        assert grid.query_rect(rect).tolist() == expected.tolist()
+
+
+def test_large_boxes_are_always_candidates():
+    bboxes = np.array([[0, 0, 1, 1], [2, 2, 3, 3], [-1e4, -1e4, 1e4, 1e4]], dtype=float)
+    grid = BBoxGrid(bboxes, cell_size=1.0)
+    assert 2 in grid.query_points(np.array([[0.5, 0.5]])).tolist()
+    assert 2 in grid.query_rect(np.array([2.5, 2.5, 2.6, 2.6])).tolist()
+
+
+def test_boxes_without_extent_and_missing_boxes():
+    # All boxes on one point once made the cell size collapse
+    bboxes = np.array([[5, 5, 5, 5], [5, 5, 5, 5], [np.nan] * 4])
+    grid = BBoxGrid(bboxes)
+    assert grid.query_points(np.array([[5.0, 5.0]])).tolist() == [0, 1]
+    assert grid.query_points(np.array([[500.0, 500.0]])).tolist() == []
+    assert grid.query_rect(np.array([0, 0, 10, 10])).tolist() == [0, 1]
+
+
+def test_empty_index():
+    grid = BBoxGrid(np.empty((0, 4)))
+    assert grid.query_points(np.array([[0.0, 0.0]])).tolist() == []
+    assert grid.query_rect(np.array([0, 0, 1, 1])).tolist() == []
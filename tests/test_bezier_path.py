@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from inkex import CubicSuperPath, Path, Transform
+from inkex.bezier import bezierpointatt, bezierslopeatt, beziersplitatt
+
+from select_by_path import BezierPath
+
+
+@pytest.fixture
+def path():
+    return BezierPath(np.random.default_rng(0).uniform(-100, 100, (6, 4, 2)))
+
+
+def test_from_superpath():
+    csp = CubicSuperPath(Path('M 0 0 L 10 0 C 10 5 5 10 0 10 Z M 20 20'))
+    segments = BezierPath.from_superpath(csp)
+    assert np.asarray(segments).shape == (3, 4, 2)
+    assert np.asarray(segments).tolist() == [
+        [[0, 0], [0, 0], [10, 0], [10, 0]],
+        [[10, 0], [10, 5], [5, 10], [0, 10]],
+        [[0, 10], [0, 10], [0, 0], [0, 0]],
+    ]
+    # Subpaths of a single node have no segments
+    assert len(BezierPath.from_superpath(CubicSuperPath(Path('M 20 20')))) == 0
+    assert BezierPath.concatenate([segments, segments[:1]])[3].tolist() == segments[0].tolist()
+
+
+@pytest.mark.parametrize('t', [0.0, 0.3, 0.5, 1.0])
+def test_points_and_derivatives_match_inkex(path, t):
+    points = path.points([t, 0.5])
+    derivatives = path.derivatives([t, 0.5])
+    assert points.shape == derivatives.shape == (len(path), 2, 2)
+    for i, segment in enumerate(path):
+        assert np.allclose(points[i, 0], bezierpointatt(segment.tolist(), t))
+        assert np.allclose(derivatives[i, 0], bezierslopeatt(segment.tolist(), t))
+    # One parameter per segment
+    ts = np.linspace(0, 1, len(path))
+    assert np.allclose(path.points_at(ts), [path.points(t)[i, 0] for i, t in enumerate(ts)])
+    assert np.allclose(path.derivatives_at(ts), [path.derivatives(t)[i, 0] for i, t in enumerate(ts)])
+
+
+@pytest.mark.parametrize('t', [0.25, 0.5])
+def test_split(path, t):
+    first, second = path.split(t)
+    for segment, a, b in zip(path, first, second):
+        expected = beziersplitatt(segment.tolist(), t)
+        assert np.allclose(a, expected[0]) and np.allclose(b, expected[1])
+    # The halves trace the segment
+    s = np.linspace(0, 1, 7)
+    assert np.allclose(first.points(s), path.points(s * t))
+    assert np.allclose(second.points(s), path.points(t + s * (1 - t)))
+
+
+def test_boxes_contain_the_curve(path):
+    samples = path.points(np.linspace(0, 1, 50))
+    bboxes = path.bboxes()
+    assert (samples.min(axis=1) >= bboxes[:, :2]).all() and (samples.max(axis=1) <= bboxes[:, 2:]).all()
+    assert path.bbox().tolist() == [*bboxes[:, :2].min(axis=0), *bboxes[:, 2:].max(axis=0)]
+    assert np.isnan(BezierPath().bbox()).all()
+
+
+def test_transform(path):
+    transform = Transform('rotate(30) translate(5, -2) scale(2, 3)')
+    mapped = path.transform(transform)
+    assert np.allclose(mapped[2, 1], transform.apply_to_point(path[2, 1].tolist()))
+    assert np.asarray(path) is path.segments
@@ -0,0 +1,59 @@
+import pytest
+
+import inkex
+from inkex import Transform
+
+from select_by_path import BezierIntersection
+
+SVG = """<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">
+<defs><path id="source" d="M 0,0 L 4,0 L 4,2 Z" transform="translate(1,1)"/></defs>
+<use id="offset" xlink:href="#source" x="10" y="20"/>
+<use id="scaled" xlink:href="#source" x="10" y="20" transform="translate(100,0) scale(2,3)"/>
+<use id="flipped" xlink:href="#source" x="10" transform="scale(-1,1)"/>
+<use id="rotated" xlink:href="#source" x="10" y="20" transform="rotate(90)"/>
+<use id="self" xlink:href="#self"/>
+</svg>"""
+
+
+def extension():
+    effect = BezierIntersection()
+    effect.parse_arguments([])
+    effect.svg = inkex.load_svg(SVG.encode()).getroot()
+    effect.source_bboxes = {}
+    return effect
+
+
+def box(bbox):
+    return [bbox.left, bbox.top, bbox.right, bbox.bottom]
+
+
+@pytest.mark.parametrize('clone_id, expected', [
+    # The source spans (1, 1) - (5, 3) in its own coordinates
+    ('offset', [11, 21, 15, 23]),
+    # x/y are applied before the clone's transform
+    ('scaled', [122, 63, 130, 69]),
+    ('flipped', [-15, 1, -11, 3]),
+])
+def test_scale_only_clones_map_the_source_box(clone_id, expected):
+    effect = extension()
+    clone = effect.svg.getElementById(clone_id)
+    assert box(effect.clone_bbox(clone, Transform())) == pytest.approx(expected)
+    # The source's box is computed once, in its own coordinates
+    assert [box(bbox) for bbox in effect.source_bboxes.values()] == [[1, 1, 5, 3]]
+    parent = Transform('translate(0,-50)')
+    assert box(effect.clone_bbox(clone, parent)) == pytest.approx([expected[0], expected[1] - 50,
+                                                                   expected[2], expected[3] - 50])
+
+
+def test_rotated_clones_use_the_exact_box():
+    effect = extension()
+    clone = effect.svg.getElementById('rotated')
+    bbox = effect.clone_bbox(clone, Transform())
+    # rotate(90) maps (x, y) to (-y, x), after the offset to (11, 21) - (15, 23)
+    assert box(bbox) == pytest.approx([-23, 11, -21, 15])
+    assert effect.source_bboxes == {}
+
+
+def test_clone_of_itself_has_no_box():
+    effect = extension()
+    assert effect.clone_bbox(effect.svg.getElementById('self'), Transform()) is None
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from select_by_path import BBoxGrid, BezierIntersection, BezierPath
+
+from test_bbox_grid import near_points, random_bboxes
+
+
+def sample_segments(segments, samples=200):
+    t = np.linspace(0, 1, samples)[None, :, None]
+    return (segments[:, None, 0] + t * (segments[:, None, 1] - segments[:, None, 0])).reshape(-1, 2)
+
+
+def random_curve(rng, count):
+    return BezierPath(rng.uniform(0, 1000, (count, 4, 2)))
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('tol', [0.0, 5.0])
+def test_query_segments_finds_every_box_near_the_segments(seed, tol):
+    rng = np.random.default_rng(seed)
+    bboxes = random_bboxes(rng, 500)
+    # Some segments reach far outside the grid
+    segments = rng.uniform(-3000, 4000, (40, 2, 2))
+    found = set(BBoxGrid(bboxes).query_segments(segments, tol).tolist())
+    assert near_points(bboxes, sample_segments(segments), tol) <= found
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_segments_cross_bboxes_against_samples(seed):
+    rng = np.random.default_rng(seed)
+    bboxes = random_bboxes(rng, 300, spread=60.0)
+    segments = rng.uniform(0, 1000, (20, 2, 2))
+    hits = BezierIntersection().segments_cross_bboxes(segments, bboxes, tol=0.0)
+    sampled = near_points(bboxes, sample_segments(segments, 2000), 0.0)
+    assert sampled <= set(np.flatnonzero(hits).tolist())
+    # A box off the side of a segment is not crossed even when their boxes overlap
+    segment = np.array([[[0.0, 0.0], [10.0, 10.0]]])
+    assert not BezierIntersection().segments_cross_bboxes(segment, np.array([[7.0, 0.0, 10.0, 2.0]]))[0]
+
+
+@pytest.mark.parametrize('flatness', [1.0, 0.1, 0.01])
+def test_flatten_curve_stays_within_flatness(flatness):
+    rng = np.random.default_rng(1)
+    curve = random_curve(rng, 10)
+    segments = BezierIntersection().flatten_curve(curve, flatness)
+    # Consecutive and joined up from the first point to the last
+    assert np.allclose(segments[0, 0], curve.segments[0, 0])
+    assert np.allclose(segments[-1, 1], curve.segments[-1, 3])
+    points = curve.points(np.linspace(0, 1, 400)).reshape(-1, 2)
+    start, end = segments[:, 0], segments[:, 1]
+    distance = np.full(len(points), np.inf)
+    for a, b in zip(start, end):
+        d = b - a
+        t = np.clip(((points - a) @ d) / max(d @ d, 1e-300), 0, 1)
+        distance = np.minimum(distance, np.hypot(*(a + t[:, None] * d - points).T))
+    assert distance.max() <= flatness * (1 + 1e-9)
@@ -0,0 +1,125 @@
+import numpy as np
+
+import inkex
+from inkex import Transform
+
+from geometry_cache import INDEX_DTYPE, GeometryCache
+
+
+def rectangle(element_id='rect1', **attributes):
+    elem = inkex.Rectangle.new(0, 0, 10, 5)
+    elem.set('id', element_id)
+    for name, value in attributes.items():
+        elem.set(name.replace('_', '-'), value)
+    return elem
+
+
+def test_entries_survive_a_save(tmp_path):
+    path = str(tmp_path / 'cache.npy')
+    cache = GeometryCache(path)
+    key = cache.key(rectangle(), Transform())
+    other = cache.key(rectangle('rect2'), Transform())
+    segments = np.arange(12, dtype=float).reshape(3, 2, 2)
+    cache.set_bbox(key, (0, 0, 10, 5))
+    cache.set_outline(key, 0.1, segments)
+    cache.set_bbox(other, None)
+    cache.save()
+
+    cache = GeometryCache(path)
+    assert cache.bbox(key)[0] and cache.bbox(key)[1].tolist() == [0, 0, 10, 5]
+    assert cache.bbox(other) == (True, None)
+    assert cache.outline(key, 0.1).tolist() == segments.tolist()
+    # Another flatness needs a new outline
+    assert cache.outline(key, 0.5) is None
+    assert (cache.hits, cache.misses) == (4, 1)
+
+
+def test_key_follows_geometry_and_transform():
+    cache = GeometryCache('unused')
+    key = cache.key(rectangle(), Transform())
+    assert cache.key(rectangle(), Transform()) == key
+    assert cache.key(rectangle(), Transform(translate=(1, 0))) != key
+    assert cache.key(rectangle(width='11'), Transform()) != key
+    assert cache.key(rectangle(transform='scale(2)'), Transform()) != key
+    # Style and class do not change the box
+    assert cache.key(rectangle(style='fill:red', **{'class': 'a'}), Transform()) == key
+    # Nor does a document of another size reuse it
+    assert GeometryCache('unused', scale=3.78).key(rectangle(), Transform()) != key
+
+
+def test_clipped_and_container_elements_are_not_cached():
+    cache = GeometryCache('unused')
+    assert cache.key(rectangle(clip_path='url(#clip)'), Transform()) is None
+    assert cache.key(rectangle(style='clip-path:url(#clip)'), Transform()) is None
+    assert cache.key(inkex.Group(), Transform()) is None
+
+
+def test_least_recently_used_entries_are_dropped(tmp_path):
+    path = str(tmp_path / 'cache.npy')
+    cache = GeometryCache(path)
+    keys = [cache.key(rectangle(f'rect{i}'), Transform()) for i in range(4)]
+    for key in keys[:3]:
+        cache.set_bbox(key, (0, 0, 1, 1))
+    cache.now = 1.0
+    cache.save()
+
+    cache = GeometryCache(path, max_bytes=3 * INDEX_DTYPE.itemsize)
+    cache.now = 2.0
+    assert cache.bbox(keys[0])[0]
+    cache.set_bbox(keys[3], (0, 0, 2, 2))
+    cache.save()
+
+    cache = GeometryCache(path)
+    assert len(cache.rows) == 3
+    assert cache.bbox(keys[0])[0] and cache.bbox(keys[3])[0]
+
+
+def test_reading_runs_keep_their_entries_recent(tmp_path):
+    path = str(tmp_path / 'cache.npy')
+    cache = GeometryCache(path)
+    keys = [cache.key(rectangle(f'rect{i}'), Transform()) for i in range(4)]
+    for key in keys[:3]:
+        cache.set_bbox(key, (0, 0, 1, 1))
+    cache.now = 1.0
+    cache.save()
+
+    # Nothing is added, only the use times of the entries read are written
+    cache = GeometryCache(path)
+    cache.now = 2.0
+    assert cache.bbox(keys[1])[0] and cache.bbox(keys[2])[0]
+    cache.save()
+    cache = GeometryCache(path)
+    assert cache.index['used'][cache.rows[keys[2]]] == 2.0
+    assert cache.index['used'][cache.rows[keys[0]]] == 1.0
+
+    cache = GeometryCache(path, max_bytes=3 * INDEX_DTYPE.itemsize)
+    cache.now = 3.0
+    cache.set_bbox(keys[3], (0, 0, 2, 2))
+    cache.save()
+    cache = GeometryCache(path)
+    assert sorted(cache.rows) == sorted(keys[1:])
+
+
+def test_unreadable_file_starts_empty(tmp_path):
+    path = tmp_path / 'cache.npy'
+    path.write_bytes(b'not a cache')
+    cache = GeometryCache(str(path))
+    assert cache.rows == {}
+    # A run that only reads leaves the file alone
+    cache.save()
+    assert path.read_bytes() == b'not a cache'
+
+
+def test_group_key_follows_the_whole_subtree():
+    cache = GeometryCache('unused')
+    group = inkex.Group(rectangle())
+    key = cache.group_key(group, Transform())
+    assert key is not None
+    assert cache.group_key(group, Transform(), (True,)) != key
+    group[0].set('style', 'display:none')
+    assert cache.group_key(group, Transform()) != key
+    # Clones and text depend on other elements and fonts
+    assert cache.group_key(inkex.Group(inkex.Use()), Transform()) is None
+    assert cache.group_key(inkex.Group(inkex.Group(inkex.TextElement())), Transform()) is None
+    assert cache.group_key(inkex.Group(rectangle(clip_path='url(#clip)')), Transform()) is None
+    assert cache.group_key(rectangle(), Transform()) is None
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from select_by_path import BezierIntersection, BezierPath
+
+
+def line(start, end):
+    (x0, y0), (x1, y1) = start, end
+    return BezierPath(np.array([[[x0, y0], [x0 + (x1 - x0) / 3, y0 + (y1 - y0) / 3],
+                                 [x0 + 2 * (x1 - x0) / 3, y0 + 2 * (y1 - y0) / 3], [x1, y1]]], dtype=float))
+
+
+def arc(cx, cy, r):
+    """Quarter circle approximation from angle 0 to 90 degrees"""
+    k = 0.5523 * r
+    return BezierPath(np.array([[[cx + r, cy], [cx + r, cy + k], [cx + k, cy + r], [cx, cy + r]]], dtype=float))
+
+
+def test_crossing_and_separate_curves():
+    extension = BezierIntersection()
+    assert extension.curves_intersect(line((0, 0), (10, 10)), line((0, 10), (10, 0)))
+    assert not extension.curves_intersect(line((0, 0), (10, 0)), line((0, 1), (10, 1)))
+    assert extension.curves_intersect(arc(0, 0, 10), line((0, 0), (20, 20)))
+    assert not extension.curves_intersect(arc(0, 0, 10), arc(0, 0, 5))
+
+
+@pytest.mark.parametrize('gap, tol, expected', [
+    (3.0, 0.0, False), (3.0, 2.0, False), (3.0, 5.0, True),
+    (4.9, 5.0, True), (5.1, 5.0, False),
+])
+def test_tolerance_on_parallel_lines(gap, tol, expected):
+    extension = BezierIntersection()
+    assert extension.curves_intersect(line((0, 0), (100, 0)), line((0, gap), (100, gap)), tol=tol) == expected
+
+
+def test_tolerance_between_curves():
+    extension = BezierIntersection()
+    # Concentric arcs, 2 apart
+    assert extension.curves_intersect(arc(0, 0, 10), arc(0, 0, 12), tol=2.5)
+    assert not extension.curves_intersect(arc(0, 0, 10), arc(0, 0, 12), tol=1.5)
+
+
+def test_outlines_intersect_per_outline():
+    extension = BezierIntersection()
+    lasso = line((0, 5), (100, 5))
+    outlines = [line((10, 0), (10, 10)), line((0, 20), (100, 20)), line((50, 6), (60, 6))]
+    assert extension.outlines_intersect(lasso, outlines, tol=2.0).tolist() == [True, False, True]
+    assert extension.outlines_intersect(lasso, outlines).tolist() == [True, False, False]
+
+
+def test_intersection_parameters_are_polished():
+    extension = BezierIntersection()
+    # Crossing at (4, 4): a quarter of the way along the first line, half way along the second
+    first, second = line((0, 0), (16, 16)), line((0, 8), (8, 0))
+    i, j, t, s = extension.intersection_parameters(first, second, tol=1e-9)
+    assert (i.tolist(), j.tolist()) == ([0], [0])
+    assert abs(t[0] - 0.25) < 1e-9 and abs(s[0] - 0.5) < 1e-9
+    # Without the polish the parameters are only as exact as the subdivision
+    i, j, t, s = extension.intersection_parameters(first, second, tol=1e-3, max_iter=0)
+    assert len(i) == 1 and abs(t[0] - 0.25) < 1e-3 and abs(s[0] - 0.5) < 1e-3
+
+
+def test_find_intersections_on_curves():
+    extension = BezierIntersection()
+    # The quarter circle crosses the diagonal once, near 45 degrees
+    points = extension.find_intersections(arc(0, 0, 10), line((0, 0), (20, 20)))
+    assert len(points) == 1
+    assert abs(points[0][0] - points[0][1]) < 1e-6 and abs(np.hypot(*points[0]) - 10) < 0.05
+    # The diagonal crosses each of two concentric arcs
+    curves = BezierPath.concatenate((arc(0, 0, 10), arc(0, 0, 5)))
+    assert len(extension.find_intersections(curves, line((0, 0), (20, 20)))) == 2
+    assert extension.find_intersections(arc(0, 0, 10), arc(0, 0, 5)) == []
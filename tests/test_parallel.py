@@ -0,0 +1,52 @@
+import sys
+
+import pytest
+
+import select_by_path
+from benchmarks.synthetic_svg import generate_svg
+
+
+def selected_ids(svg_file, *args):
+    """Ids select_by_path hands to DBus for a run on svg_file, the passback is recorded instead"""
+    passed = []
+
+    def record_passback(path_id_list_string, *dummy_args, **dummy_kwargs):
+        passed.append(path_id_list_string)
+
+    stdout, stderr = sys.stdout, sys.stderr
+    passback = select_by_path.pass_ids_to_dbus
+    select_by_path.pass_ids_to_dbus = record_passback
+    effect = select_by_path.BezierIntersection()
+    try:
+        effect.parse_arguments(list(args) + [str(svg_file)])
+        effect.load_raw()
+        try:
+            effect.effect()
+        except SystemExit:
+            pass
+    finally:
+        select_by_path.pass_ids_to_dbus = passback
+        sys.stdout, sys.stderr = stdout, stderr
+        if getattr(effect, 'file_io', None) is not None:
+            effect.file_io.close()
+    return [x for x in passed[0].split(',') if x] if passed else []
+
+
+@pytest.fixture(scope='module')
+def document(tmp_path_factory):
+    path = tmp_path_factory.mktemp('parallel') / 'objects.svg'
+    path.write_text(generate_svg(objects=400, lasso_fraction=0.2), encoding='utf-8')
+    return path
+
+
+@pytest.mark.parametrize('criteria', [
+    ['--method=touching', '--t_criteria=bounding_box_center', '--t_selection_tolerance=2'],
+    ['--method=touching', '--t_criteria=geometry_cross'],
+    ['--method=enclosed', '--e_criteria=all_points'],
+    ['--method=enclosed', '--e_criteria=geometry_inside'],
+])
+def test_process_pool_keeps_serial_order(document, criteria):
+    serial = selected_ids(document, '--id=lasso', '--workers=1', *criteria)
+    parallel = selected_ids(document, '--id=lasso', '--workers=2', '--parallel_threshold=0', *criteria)
+    assert serial
+    assert parallel == serial
@@ -0,0 +1,125 @@
+import pytest
+
+import inkex
+
+from geometry_cache import GeometryCache
+from select_by_path import BezierIntersection
+
+SVG = """<svg xmlns="http://www.w3.org/2000/svg"
+     xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+     xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd">
+<g id="layer1" inkscape:groupmode="layer">
+  <rect id="near" x="10" y="10" width="5" height="5"/>
+  <g id="far_group" transform="translate(1000,0)">
+    <rect id="far1" x="0" y="0" width="1" height="1"/>
+    <g id="far_inner"><rect id="far2" x="0" y="0" width="1" height="1"/></g>
+  </g>
+  <g id="near_group">
+    <rect id="near1" x="20" y="20" width="1" height="1"/>
+    <rect id="far3" x="500" y="500" width="1" height="1"/>
+  </g>
+  <g id="hidden_group" style="display:none">
+    <g><rect id="hidden_child" x="30" y="30" width="1" height="1"/></g>
+  </g>
+  <g id="locked_group" sodipodi:insensitive="true">
+    <rect id="locked_child" x="40" y="40" width="1" height="1"/>
+  </g>
+  <g id="sublayer" inkscape:groupmode="layer" style="display:none">
+    <rect id="sublayered" x="50" y="50" width="1" height="1"/>
+  </g>
+  <g id="holder">
+    <rect id="holder_child" x="60" y="60" width="1" height="1"/>
+    <rect id="locked_far" x="900" y="900" width="1" height="1" sodipodi:insensitive="true"/>
+  </g>
+</g>
+</svg>"""
+
+REGION = (0, 0, 100, 100)
+
+
+def extension(*args):
+    effect = BezierIntersection()
+    effect.parse_arguments(['--scope=layer_recursive'] + list(args))
+    effect.svg = inkex.load_svg(SVG.encode()).getroot()
+    effect.transform_cache = {}
+    effect.source_bboxes = {}
+    return effect
+
+
+def collected_ids(effect, region=REGION):
+    candidates, bboxes, transforms = effect.collect_candidates([effect.svg.getElementById('layer1')], region)
+    return [elem.get('id') for elem in candidates]
+
+
+def measured_ids(effect, monkeypatch):
+    """Ids of the elements element_bbox is called with from here on"""
+    measured = []
+    element_bbox = effect.element_bbox
+
+    def record(elem, transform):
+        measured.append(elem.get('id'))
+        return element_bbox(elem, transform)
+
+    monkeypatch.setattr(effect, 'element_bbox', record)
+    return measured
+
+
+def test_groups_away_from_the_region_are_left_out():
+    assert collected_ids(extension(), None) == ['near', 'far1', 'far2', 'near1', 'far3', 'holder_child']
+    # Only whole groups are dropped, far3 is in a group that reaches the region
+    assert collected_ids(extension()) == ['near', 'near1', 'far3', 'holder_child']
+
+
+@pytest.mark.parametrize('option', ['--t_include_hidden=true', '--method=enclosed --e_include_hidden=true'])
+def test_hidden_and_locked_groups_hide_their_contents(option):
+    ids = collected_ids(extension())
+    for elem_id in ['hidden_group', 'hidden_child', 'locked_child', 'sublayered', 'locked_far']:
+        assert elem_id not in ids
+    ids = collected_ids(extension(*option.split()))
+    for elem_id in ['hidden_child', 'locked_child', 'sublayered', 'locked_far']:
+        assert elem_id in ids
+    # Sublayers are walked into, never selected
+    assert 'sublayer' not in ids
+
+
+def test_locked_objects_make_up_their_group_box():
+    effect = extension('--t_include_groups=true')
+    candidates, bboxes, transforms = effect.collect_candidates([effect.svg.getElementById('layer1')], None)
+    ids = [elem.get('id') for elem in candidates]
+    assert 'locked_far' not in ids
+    assert list(bboxes[ids.index('holder')]) == [60, 60, 901, 901]
+
+
+def test_cached_group_boxes_skip_far_contents(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cache.npy')
+    effect = extension()
+    effect.geometry_cache = GeometryCache(path)
+    measured = measured_ids(effect, monkeypatch)
+    assert collected_ids(effect) == ['near', 'near1', 'far3', 'holder_child']
+    assert 'far1' in measured and 'far2' in measured
+    effect.geometry_cache.save()
+
+    effect = extension()
+    effect.geometry_cache = GeometryCache(path)
+    measured = measured_ids(effect, monkeypatch)
+    assert collected_ids(effect) == ['near', 'near1', 'far3', 'holder_child']
+    assert 'far1' not in measured and 'far2' not in measured
+    # A stored box does not decide for another region, loose objects are never dropped
+    assert collected_ids(effect, (900, -10, 1100, 10)) == ['near', 'far1', 'far2']
+
+
+def test_cached_group_boxes_follow_the_contents(tmp_path):
+    path = str(tmp_path / 'cache.npy')
+    effect = extension()
+    effect.geometry_cache = GeometryCache(path)
+    collected_ids(effect)
+    effect.geometry_cache.save()
+
+    effect = extension()
+    effect.geometry_cache = GeometryCache(path)
+    effect.svg.getElementById('far1').set('x', '-1000')
+    assert collected_ids(effect) == ['near', 'far1', 'near1', 'far3', 'holder_child']
+    # Including hidden objects changes which objects make up a box
+    effect = extension('--t_include_hidden=true')
+    effect.geometry_cache = GeometryCache(path)
+    assert 'hidden_child' in collected_ids(effect)
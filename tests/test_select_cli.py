@@ -0,0 +1,66 @@
+import json
+import os
+
+import pytest
+
+import select_cli
+
+from benchmarks.synthetic_svg import generate_svg
+from test_parallel import selected_ids
+
+TEST_SVG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test.svg')
+
+CRITERIA = [
+    ['--method=touching', '--t_criteria=bounding_box_cross'],
+    ['--method=touching', '--t_criteria=bounding_box_center', '--t_selection_tolerance=5'],
+    ['--method=touching', '--t_criteria=geometry_cross'],
+    ['--method=touching', '--t_criteria=geometry_cross', '--t_include_groups=true'],
+    ['--method=enclosed', '--e_criteria=bounding_box_center'],
+    ['--method=enclosed', '--e_criteria=all_points'],
+    ['--method=enclosed', '--e_criteria=any_point'],
+    ['--method=enclosed', '--e_criteria=geometry_inside', '--e_include_hidden=true'],
+]
+
+
+def cli_ids(capsys, *args):
+    assert select_cli.main(['--json'] + list(args)) == 0
+    return json.loads(capsys.readouterr().out)['ids']
+
+
+@pytest.mark.parametrize('criteria', CRITERIA)
+@pytest.mark.parametrize('scope', ['layer', 'document'])
+def test_path_matches_the_extension(capsys, criteria, scope):
+    args = ['--id=path2', f'--scope={scope}'] + criteria
+    expected = selected_ids(TEST_SVG, *args)
+    # Tiny chunks so the candidates are tested over several of them
+    assert cli_ids(capsys, 'path', TEST_SVG, '--chunk_size=2', *args) == expected
+
+
+@pytest.mark.parametrize('criteria', CRITERIA[:4])
+def test_open_lasso_matches_the_extension(capsys, criteria):
+    args = ['--id=path301'] + criteria
+    assert cli_ids(capsys, 'path', TEST_SVG, *args) == selected_ids(TEST_SVG, *args)
+
+
+def test_several_lassos(capsys):
+    args = ['--id=path2', '--id=path301', '--method=touching', '--t_criteria=geometry_cross']
+    assert cli_ids(capsys, 'path', TEST_SVG, *args) == selected_ids(TEST_SVG, *args)
+
+
+def test_errors(capsys):
+    assert select_cli.main(['path', TEST_SVG, '--id=missing']) == 1
+    assert 'missing' in capsys.readouterr().err
+    assert select_cli.main(['path', TEST_SVG, '--id=path301', '--method=enclosed']) == 1
+    assert 'closed' in capsys.readouterr().err
+
+
+def test_time_budget_counts_what_was_not_read(capsys, tmp_path):
+    path = tmp_path / 'objects.svg'
+    path.write_text(generate_svg(objects=300, depth=1, group_size=10), encoding='utf-8')
+    # Already spent by the first pass, every candidate is only counted
+    assert select_cli.main(['--json', 'path', str(path), '--id=lasso', '--scope=document',
+                            '--time_budget=1e-9']) == 0
+    out, err = capsys.readouterr()
+    assert json.loads(out)['ids'] == []
+    # The 300 objects and the lasso, in groups of ten
+    assert 'time budget of 1e-09 s reached, 301 objects were not evaluated' in err
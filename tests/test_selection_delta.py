@@ -0,0 +1,45 @@
+import pytest
+
+from ink_dbus_client import selection_delta
+
+
+def apply_delta(current_id_list, add_id_list, remove_id_list):
+    removed = set(remove_id_list)
+    return set(x for x in current_id_list if x not in removed) | set(add_id_list)
+
+
+@pytest.mark.parametrize('mode, expected', [
+    ('clear', ['b', 'c', 'd']),
+    ('add', ['a', 'b', 'c', 'd']),
+    ('subtract', ['a']),
+])
+def test_modes(mode, expected):
+    final_id_list, add_id_list, remove_id_list = selection_delta(['a', 'b', 'c'], ['c', 'd', 'b', 'd'], mode)
+    assert sorted(final_id_list) == expected
+    assert len(final_id_list) == len(set(final_id_list))
+    assert apply_delta(['a', 'b', 'c'], add_id_list, remove_id_list) == set(expected)
+    # Only changes are sent
+    assert not set(add_id_list) & {'a', 'b', 'c'}
+    assert set(remove_id_list) <= {'a', 'b', 'c'}
+
+
+@pytest.mark.parametrize('mode', ['clear', 'add', 'subtract'])
+def test_lassos_are_deselected(mode):
+    final_id_list, add_id_list, remove_id_list = selection_delta(['a'], ['b'], mode, ['lasso'])
+    assert 'lasso' in remove_id_list
+    assert 'lasso' not in final_id_list
+    assert apply_delta(['a', 'lasso'], add_id_list, remove_id_list) == set(final_id_list)
+
+
+def test_lasso_hit_by_another_lasso_stays_selected():
+    final_id_list, add_id_list, remove_id_list = selection_delta([], ['lasso2'], 'clear', ['lasso1', 'lasso2'])
+    assert final_id_list == ['lasso2']
+    assert add_id_list == []
+    assert remove_id_list == ['lasso1']
+
+
+def test_order_is_kept():
+    final_id_list, add_id_list, remove_id_list = selection_delta(['z', 'y', 'x'], ['w', 'v', 'y'], 'add')
+    assert final_id_list == ['z', 'y', 'x', 'w', 'v']
+    assert add_id_list == ['w', 'v']
+    assert remove_id_list == []
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import inkex
+
+from select_by_xpath import StyleIndex, parse_style_query, style_color
+
+SVG = """<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">
+<defs><linearGradient id="grad"/></defs>
+<rect id="red" style="fill:#ff0000;stroke-width:1px" width="1" height="1"/>
+<rect id="nearly_red" style="fill:rgb(250,5,0);stroke-width:2.5" width="1" height="1"/>
+<rect id="attribute" fill="red" stroke-width="3" width="1" height="1"/>
+<rect id="override" fill="blue" style="fill:red" width="1" height="1"/>
+<rect id="none" style="fill:none;stroke:#000000" width="1" height="1"/>
+<rect id="black" style="fill:#000000" width="1" height="1"/>
+<rect id="gradient" style="fill:url(#grad)" width="1" height="1"/>
+<rect id="current" style="fill:currentColor;stroke-width:0.5" width="1" height="1"/>
+<rect id="plain" width="1" height="1"/>
+</svg>"""
+
+
+def select_ids(query):
+    index = StyleIndex(inkex.load_svg(SVG.encode()).getroot())
+    return [elem.get('id') for elem in index.select(parse_style_query(query))]
+
+
+def test_parse_style_query():
+    assert parse_style_query('Fill: #F00 ; stroke-width:0.5..2;') == [
+        ('fill', 'equals', (255, 0, 0)), ('stroke-width', 'range', (0.5, 2.0))]
+    assert parse_style_query('stroke-width:..2px; opacity:0.5..') == [
+        ('stroke-width', 'range', (-np.inf, 2.0)), ('opacity', 'range', (0.5, np.inf))]
+    assert parse_style_query('stroke:#00f~20') == [('stroke', 'color', ((0, 0, 255), 20.0))]
+    assert parse_style_query('fill:none; display:None') == [('fill', 'equals', 'none'), ('display', 'equals', 'none')]
+
+
+@pytest.mark.parametrize('query', ['', ' ; ', 'fill', 'fill:', ':red', 'stroke-width:a..2', 'stroke:blue~far',
+                                   'fill:none~10'])
+def test_malformed_queries(query):
+    with pytest.raises(ValueError):
+        parse_style_query(query)
+
+
+@pytest.mark.parametrize('value', ['none', 'None', 'currentColor', 'inherit', 'url(#grad)', ' URL(#grad) '])
+def test_paint_keywords_are_no_colours(value):
+    assert style_color(value) is None
+
+
+def test_equal_values():
+    assert select_ids('fill:#f00') == ['red', 'attribute', 'override']
+    assert select_ids('fill:none') == ['none']
+    assert select_ids('fill:#000') == ['black']
+    assert select_ids('fill:url(#grad)') == ['gradient']
+    assert select_ids('fill:currentcolor') == ['current']
+    assert select_ids('fill:purple') == []
+    assert select_ids('marker:none') == []
+
+
+def test_ranges_and_colour_distance():
+    assert select_ids('stroke-width:1..3') == ['red', 'nearly_red', 'attribute']
+    assert select_ids('stroke-width:..1') == ['red', 'current']
+    assert select_ids('fill:#ff0000~10') == ['red', 'nearly_red', 'attribute', 'override']
+    assert select_ids('fill:#000~10') == ['black']
+
+
+def test_all_conditions_must_hold():
+    assert select_ids('fill:red; stroke-width:2..') == ['attribute']
+    assert select_ids('fill:none; stroke:black') == ['none']
+    assert select_ids('fill:red; stroke:black') == []
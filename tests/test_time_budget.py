@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+import pytest
+
+import inkex
+from inkex import Transform
+
+from select_by_path import BezierIntersection, BezierPath
+
+SVG = """<svg xmlns="http://www.w3.org/2000/svg"
+     xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape">
+<g id="layer1" inkscape:groupmode="layer">
+  <path id="far" d="M 500,500 L 510,510"/>
+  <rect id="near" x="95" y="-3" width="5" height="5"/>
+  <circle id="inside" cx="50" cy="50" r="2"/>
+  <g id="group" transform="translate(1000,0)">
+    <rect id="grouped1" x="0" y="0" width="1" height="1"/>
+    <g id="inner"><rect id="grouped2" x="0" y="0" width="1" height="1"/></g>
+  </g>
+  <g id="sublayer" inkscape:groupmode="layer"><rect id="sublayered" x="100" y="200" width="1" height="1"/></g>
+  <text id="unplaced">text</text>
+</g>
+</svg>"""
+
+
+def extension(*args):
+    effect = BezierIntersection()
+    effect.parse_arguments(list(args))
+    effect.svg = inkex.load_svg(SVG.encode()).getroot()
+    effect.transform_cache = {}
+    return effect
+
+
+def square(size=100.0):
+    """Closed lasso around (0, 0) - (size, size)"""
+    corners = np.array([[0, 0], [size, 0], [size, size], [0, size], [0, 0]], dtype=float)
+    return BezierPath(np.array([[a, a + (b - a) / 3, a + 2 * (b - a) / 3, b] for a, b in zip(corners, corners[1:])]))
+
+
+def by_id(effect, elem_id):
+    return effect.svg.getElementById(elem_id)
+
+
+def test_anchor_point():
+    effect = extension()
+    assert effect.anchor_point(by_id(effect, 'far')) == (500, 500)
+    assert effect.anchor_point(by_id(effect, 'near')) == (95, -3)
+    assert effect.anchor_point(by_id(effect, 'inside')) == (50, 50)
+    # Groups take the position of their first shape, in the group's parent's coordinates
+    assert effect.anchor_point(by_id(effect, 'group')) == (1000, 0)
+    assert effect.anchor_point(by_id(effect, 'unplaced')) is None
+
+
+@pytest.mark.parametrize('method, expected', [
+    ('touching', ['near', 'inside', 'sublayer', 'far', 'group', 'unplaced']),
+    ('enclosed', ['inside', 'near', 'sublayer', 'far', 'group', 'unplaced']),
+])
+def test_nearest_first(method, expected):
+    effect = extension(f'--method={method}')
+    units = [(elem, Transform()) for elem in by_id(effect, 'layer1')]
+    order = effect.nearest_first(square(), units)
+    assert [units[i][0].get('id') for i in order] == expected
+
+
+def test_skipped_objects_are_counted_with_their_descendants():
+    effect = extension('--scope=layer_recursive')
+    effect.deadline = time.perf_counter() - 1
+    candidates, bboxes, transforms = effect.collect_candidates([by_id(effect, 'layer1')], None, square())
+    assert candidates == []
+    # The rects inside groups and the sublayer count, the groups do not
+    assert effect.unevaluated == 7
+
+
+def test_budget_keeps_document_order():
+    effect = extension('--scope=layer_recursive')
+    effect.deadline = time.perf_counter() + 60
+    candidates, bboxes, transforms = effect.collect_candidates([by_id(effect, 'layer1')], None, square())
+    assert [elem.get('id') for elem in candidates] == ['far', 'near', 'inside', 'grouped1', 'grouped2',
+                                                       'sublayered', 'unplaced']
+    assert effect.unevaluated == 0
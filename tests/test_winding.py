@@ -0,0 +1,126 @@
+import inkex
+import numpy as np
+import pytest
+
+from select_by_path import BezierIntersection
+
+from test_parallel import selected_ids
+
+
+def polygon(*points):
+    """Edges of the closed polygon through points"""
+    points = np.array(points, dtype=float)
+    return np.stack((points, np.roll(points, -1, axis=0)), axis=1)
+
+
+def ray_casting(points, edges):
+    """Brute force evenodd test, counting edge crossings of a ray to the right"""
+    inside = []
+    for x, y in points:
+        crossings = 0
+        for (x0, y0), (x1, y1) in edges:
+            if (y0 <= y) != (y1 <= y):
+                if x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+                    crossings += 1
+        inside.append(crossings % 2 == 1)
+    return np.array(inside)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_evenodd_matches_ray_casting(seed):
+    rng = np.random.default_rng(seed)
+    # A random star shaped polygon, self-intersections included
+    angles = np.sort(rng.uniform(0, 2 * np.pi, 30))
+    radii = rng.uniform(20, 100, 30)
+    edges = polygon(*np.stack((np.cos(angles) * radii, np.sin(angles) * radii), axis=1))
+    edges = np.concatenate((edges, polygon(*rng.uniform(-100, 100, (12, 2)))))
+    points = rng.uniform(-110, 110, (2000, 2))
+    inside = BezierIntersection().points_in_polygon(points, edges, 'evenodd')
+    assert (inside == ray_casting(points, edges)).all()
+
+
+def test_nonzero_and_evenodd_differ_on_overlap():
+    square = polygon((0, 0), (10, 0), (10, 10), (0, 10))
+    twice = np.concatenate((square, square))
+    points = np.array([[5.0, 5.0], [15.0, 5.0]])
+    extension = BezierIntersection()
+    assert np.abs(extension.winding_numbers(points, twice)).tolist() == [2, 0]
+    assert extension.points_in_polygon(points, twice, 'nonzero').tolist() == [True, False]
+    assert extension.points_in_polygon(points, twice, 'evenodd').tolist() == [False, False]
+
+
+def test_groups_use_their_own_rule():
+    square = polygon((0, 0), (10, 0), (10, 10), (0, 10))
+    other = polygon((20, 0), (30, 0), (30, 10), (20, 10))
+    edges = np.concatenate((square, square, other))
+    groups = np.array([0] * 8 + [1] * 4)
+    points = np.array([[5.0, 5.0], [25.0, 5.0], [15.0, 5.0]])
+    extension = BezierIntersection()
+    assert extension.points_in_polygon(points, edges, ['evenodd', 'nonzero'], groups).tolist() == [False, True, False]
+    assert extension.points_in_polygon(points, edges, ['nonzero', 'nonzero'], groups).tolist() == [True, True, False]
+
+
+def test_polygon_edges_closes_open_runs():
+    segments = np.array([[[0, 0], [10, 0]], [[10, 0], [10, 10]],
+                         [[20, 0], [30, 0]], [[30, 0], [20, 0]]], dtype=float)
+    edges = BezierIntersection().polygon_edges(segments)
+    # The first run gets a closing edge, the second already ends where it starts
+    assert len(edges) == 5
+    assert edges[-1].tolist() == [[10, 10], [0, 0]]
+
+
+@pytest.mark.parametrize('d, expected', [
+    ('M 0,0 L 10,0 L 10,10 Z', 0),
+    ('M 0,0 L 10,0 L 10,10', 1),
+    # Returning to the start closes a subpath without z
+    ('M 0,0 L 10,0 L 10,10 L 0,0', 0),
+    ('m 0,0 10,0 0,10 -10,-10', 0),
+    ('M 0,0 L 1e2,0 L 1e2,1e2 Z M 20,20 L 30,20 L 30,30 Z', 0),
+    ('M 0,0 L 10,0 L 10,10 Z M 20,20 L 30,20 L 30,30', 1),
+    ('M 0,0 L 10,0 L 10,10 M 20,20 L 30,20 L 30,30', 2),
+    # Drawing on after z starts a new subpath at the closing point
+    ('M 0,0 L 10,0 L 10,10 Z L 5,5', 1),
+    ('M 0,0 L 10,0 L 10,10 Z L 5,5 L 0,0', 0),
+])
+def test_open_subpaths(d, expected):
+    path = inkex.PathElement()
+    path.set('d', d)
+    assert BezierIntersection().open_subpaths(path) == expected
+
+
+def test_lasso_rule():
+    extension = BezierIntersection()
+    path = inkex.PathElement()
+    assert extension.lasso_rule(path) == 'nonzero'
+    path.set('fill-rule', 'evenodd')
+    assert extension.lasso_rule(path) == 'evenodd'
+    path.set('style', 'fill-rule:nonzero')
+    assert extension.lasso_rule(path) == 'nonzero'
+
+
+# Two compound lassos, a square with a square hole drawn the same way round,
+# one with each fill rule, and a marker object in the hole and the ring of each
+LASSOS_SVG = """<svg xmlns="http://www.w3.org/2000/svg"
+     xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape">
+<g id="layer1" inkscape:groupmode="layer">
+  <path id="evenodd" style="fill-rule:evenodd" d="M 0,0 H 100 V 100 H 0 Z M 30,30 H 70 V 70 H 30 Z"/>
+  <path id="nonzero" d="M 200,0 H 300 V 100 H 200 Z M 230,30 H 270 V 70 H 230 Z"/>
+  <rect id="evenodd_hole" x="48" y="48" width="4" height="4"/>
+  <rect id="evenodd_ring" x="10" y="10" width="4" height="4"/>
+  <rect id="nonzero_hole" x="248" y="48" width="4" height="4"/>
+  <rect id="nonzero_ring" x="210" y="10" width="4" height="4"/>
+</g>
+</svg>"""
+
+
+@pytest.mark.parametrize('criteria, expected', [
+    # The box center of the nonzero lasso itself lies in its filled hole
+    ('bounding_box_center', ['nonzero', 'evenodd_ring', 'nonzero_hole', 'nonzero_ring']),
+    ('all_points', ['evenodd_ring', 'nonzero_hole', 'nonzero_ring']),
+    ('geometry_inside', ['evenodd_ring', 'nonzero_hole', 'nonzero_ring']),
+])
+def test_each_lasso_uses_its_own_fill_rule(tmp_path, criteria, expected):
+    svg_file = tmp_path / 'lassos.svg'
+    svg_file.write_text(LASSOS_SVG, encoding='utf-8')
+    ids = selected_ids(svg_file, '--id=evenodd', '--id=nonzero', '--method=enclosed', f'--e_criteria={criteria}')
+    assert ids == expected
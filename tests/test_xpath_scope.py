@@ -0,0 +1,73 @@
+import sys
+
+import pytest
+
+import select_by_xpath
+
+SVG = """<svg xmlns="http://www.w3.org/2000/svg"
+     xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape">
+<g id="layer1" inkscape:groupmode="layer">
+  <rect id="r1" class="tree" x="0" y="0" width="1" height="1"/>
+  <g id="g1" class="tree">
+    <rect id="r2" class="tree" x="0" y="0" width="1" height="1"/>
+    <rect id="r3" x="0" y="0" width="1" height="1"/>
+    <g id="g2"><rect id="r4" class="tree" x="0" y="0" width="1" height="1"/></g>
+  </g>
+  <rect id="r5" class="tree" x="0" y="0" width="1" height="1"/>
+</g>
+</svg>"""
+
+
+@pytest.fixture(scope='module')
+def document(tmp_path_factory):
+    path = tmp_path_factory.mktemp('xpath') / 'scope.svg'
+    path.write_text(SVG, encoding='utf-8')
+    return path
+
+
+def xpath_ids(svg_file, *args):
+    """Ids select_by_xpath hands to DBus for a run on svg_file, the passback is recorded instead"""
+    passed = []
+
+    def record_passback(path_id_list_string, *dummy_args, **dummy_kwargs):
+        passed.append(path_id_list_string)
+
+    stdout, stderr = sys.stdout, sys.stderr
+    passback = select_by_xpath.pass_ids_to_dbus
+    select_by_xpath.pass_ids_to_dbus = record_passback
+    effect = select_by_xpath.SelectByXPath()
+    try:
+        effect.parse_arguments(list(args) + [str(svg_file)])
+        effect.load_raw()
+        try:
+            effect.effect()
+        except SystemExit:
+            pass
+    finally:
+        select_by_xpath.pass_ids_to_dbus = passback
+        sys.stdout, sys.stderr = stdout, stderr
+        if getattr(effect, 'file_io', None) is not None:
+            effect.file_io.close()
+    return passed[0].split(',') if passed else []
+
+
+@pytest.mark.parametrize('query', ['--xpath=//svg:rect', '--xpath=/descendant::svg:rect', '--classname=tree'])
+def test_selection_scope_includes_the_selected_objects(document, query):
+    ids = xpath_ids(document, '--scope=selection', '--id=r1', '--id=g1', query)
+    if query == '--classname=tree':
+        assert ids == ['r1', 'g1', 'r2', 'r4']
+    else:
+        assert ids == ['r1', 'r2', 'r3', 'r4']
+
+
+@pytest.mark.parametrize('xpath, expected', [
+    # Positions count among the siblings, as on the whole document
+    ('//svg:rect[1]', ['r1', 'r2', 'r4']),
+    ('//svg:rect[last()]', ['r3', 'r4']),
+    ('//svg:g/svg:rect', ['r2', 'r3', 'r4']),
+    ('//*[@class="tree"]', ['r1', 'g1', 'r2', 'r4']),
+    ('//svg:rect | //svg:g', ['r1', 'g1', 'r2', 'r3', 'g2', 'r4']),
+    ('self::svg:rect', ['r1']),
+])
+def test_xpath_in_selection_matches_the_document(document, xpath, expected):
+    assert xpath_ids(document, '--scope=selection', '--id=r1', '--id=g1', f'--xpath={xpath}') == expected